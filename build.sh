@@ -5,4 +5,5 @@ set -o errexit
 pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
-python manage.py migrate 
\ No newline at end of file
+python manage.py migrate
+python manage.py createcachetable 
\ No newline at end of file
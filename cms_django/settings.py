@@ -42,9 +42,25 @@ CSRF_TRUSTED_ORIGINS = [
 # Session and CSRF configuration
 # Синхронізація сесії та CSRF токена для запобігання помилкам після тривалої бездіяльності
 SESSION_COOKIE_AGE = 1209600  # 2 тижні (за замовчуванням)
-SESSION_SAVE_EVERY_REQUEST = True  # Оновлювати сесію при кожному запиті (продовжує час життя сесії)
+# Сесія продовжується не на кожному запиті, а лише коли до завершення лишилось
+# менше SESSION_REFRESH_THRESHOLD секунд (patients.middleware.SessionRefreshMiddleware)
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_THRESHOLD = int(os.environ.get('SESSION_REFRESH_THRESHOLD', SESSION_COOKIE_AGE // 2))
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Сесія не закривається при закритті браузера
 
+# Сховище сесій (змінна SESSION_BACKEND):
+#   db             - таблиця django_session (очищення: python manage.py purge_sessions)
+#   cached_db      - кеш з записом у БД
+#   cache          - лише кеш (потрібен спільний для всіх воркерів кеш, див. CACHES)
+#   signed_cookies - підписана cookie, без серверного сховища
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_BACKENDS[os.environ.get('SESSION_BACKEND', 'db')]
+
 # CSRF токен синхронізується з сесією
 # Використовуємо cookie замість сесії для CSRF, щоб уникнути проблем з закритим з'єднанням БД
 CSRF_USE_SESSIONS = False  # Зберігати CSRF токен у cookie (безпечніше при проблемах з БД)
@@ -78,16 +94,57 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'patients.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'patients.middleware.SessionRefreshMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'cms_django.urls'
 
+# Максимальна кількість SQL-запитів на один HTTP-запит (url_name -> ліміт).
+# Перевищення пишеться в лог patients.query_budget; тести ViewQueryBudgetTests
+# перевіряють кожен view з patients/urls.py проти цих лімітів.
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGETS = {
+    'dashboard': 6,
+    'search_patients': 6,
+    'patient_autocomplete': 4,
+    'patient_list': 5,
+    'patient_list_filtered': 5,
+    'patient_archive': 5,
+    'patient_export': 5,
+    'inpatient_list': 5,
+    'patient_create': 15,
+    'patient_detail': 7,
+    'patient_update': 15,
+    'patient_delete': 6,
+    'fraction_list': 7,
+    'patient_fraction_list': 7,
+    'fraction_export': 5,
+    'generate_fractions': 15,
+    'recalculate_discharge': 8,
+    'fraction_edit': 8,
+    'fraction_shift': 16,  # зсув, підсумки, дата виписки, перепланування слотів
+    'treatment_worklist': 10,  # POST "розпланувати": select_for_update, звільнення слотів, bulk_update
+    'closure_reschedule': 16,  # попередній перегляд: перенесення у транзакції, що відкочується
+    'confirm_fractions_doctor': 9,
+    'confirm_fractions_nurse': 9,
+    'medical_incapacity_create': 8,
+    'medical_incapacity_delete': 6,
+    'login': 10,  # POST: користувач, last_login, нова сесія
+    'logout': 6,
+    'register': 6,
+    'admin_users': 5,
+    'approve_user': 6,
+    'confirm_blood_test': 6,
+    'update_all_discharge_dates': 7,
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -103,6 +160,50 @@ TEMPLATES = [
     },
 ]
 
+# Django 4.1+ без явних 'loaders' вже використовує cached.Loader (шаблони
+# компілюються один раз на процес), тому окремо вмикати його не потрібно.
+
+# Кеш (фрагменти сторінок пацієнтів, сесії з SESSION_BACKEND=cache) має бути
+# спільним для всіх воркерів gunicorn: інвалідація версією пацієнта
+# (bump_patient_versions) в одному воркері інакше не видна іншим, і вони
+# віддають застарілу історію фракцій до FRAGMENT_TIMEOUT.
+#   REDIS_URL             - спільний Redis (рекомендовано)
+#   за замовчуванням      - таблиця cache_table у БД (python manage.py createcachetable)
+#   CACHE_BACKEND=locmem  - пам'ять процесу; лише для одного процесу (runserver)
+REDIS_URL = os.environ.get('REDIS_URL')
+LOCMEM_CACHE = os.environ.get('CACHE_BACKEND') == 'locmem'
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'cms',
+        }
+    }
+elif LOCMEM_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_table',
+        }
+    }
+
+# Фрагменти шаблонів ({% cache ... using="fragments" %}) та версії пацієнтів
+# (patients/cache_versions.py). З кешем у БД кожен фрагмент і кожна версія -
+# це SQL-запити (сотні на список пацієнтів), тому без Redis чи LocMem
+# кешування фрагментів вимкнено (DummyCache): дані завантажуються одним
+# набором запитів view, як і без кешу.
+CACHES['fragments'] = (
+    dict(CACHES['default']) if REDIS_URL or LOCMEM_CACHE
+    else {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+)
+
 WSGI_APPLICATION = 'cms_django.wsgi.application'
 
 
@@ -113,15 +214,40 @@ WSGI_APPLICATION = 'cms_django.wsgi.application'
 
 # Основна конфігурація бази даних. Використовується для всього,
 # крім запуску тестів (наприклад, для продакшну та db_backup).
-# conn_max_age=0 означає, що Django завжди перевідкриває з'єднання,
-# що важливо для хостингів типу Render.com, де застосунок може "засинати"
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=0  # Завжди перевідкривати з'єднання (виправляє "connection already closed")
+        conn_max_age=0
     )
 }
 
+# Режим з'єднань з PostgreSQL (змінна DB_POOL):
+#   pool       - пул psycopg 3: з'єднання перевіряється перед видачею
+#                (check_connection), тому після "засинання" хостингу мертві
+#                з'єднання замінюються новими замість "connection already closed";
+#                max_idle / max_lifetime періодично оновлюють з'єднання
+#   persistent - постійні з'єднання Django (CONN_MAX_AGE) з CONN_HEALTH_CHECKS
+#   off        - нове з'єднання на кожен запит (попередня поведінка)
+DB_POOL = os.environ.get('DB_POOL', 'pool')
+
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    if DB_POOL == 'pool':
+        from psycopg_pool import ConnectionPool
+
+        # Пул Django вимагає CONN_MAX_AGE = 0: з'єднання повертається в пул після запиту
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'check': ConnectionPool.check_connection,
+        }
+    elif DB_POOL == 'persistent':
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 # Перевизначення бази даних для тестового середовища.
 # Якщо Django запущено з командою 'test', використовується швидка база даних в пам'яті.
 # Це робить тести швидкими та ізольованими від робочої бази даних.
@@ -130,6 +256,17 @@ if 'test' in sys.argv:
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
     }
+    # Як у розгортанні без Redis: кеш у БД, фрагменти вимкнено. Тести
+    # кешування фрагментів (і бюджети запитів з ним) вмикають LocMem явно
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_table',
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }
 
 # --- КІНЕЦЬ ЗМІНЕНОГО БЛОКУ ---
 
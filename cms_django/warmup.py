@@ -0,0 +1,66 @@
+"""
+Прогрів процесу перед прийомом трафіку.
+
+warm_process() викликається в master-процесі gunicorn після preload_app:
+URL-резолвер та скомпільовані шаблони (cached.Loader) успадковуються
+воркерами через fork, тож перший запит у воркері не платить за їх
+побудову. З'єднання з БД не можна відкривати до fork (сокет ділився б між
+процесами), тому warm_database() викликається вже у кожному воркері.
+"""
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.template import engines
+from django.template.exceptions import TemplateDoesNotExist, TemplateSyntaxError
+from django.urls import get_resolver
+
+logger = logging.getLogger('cms_django.warmup')
+
+
+def warm_url_resolver():
+    """Будує дерево URL-шаблонів і зворотні словники для reverse()"""
+    # reverse_dict заповнює _populate(): імпорт views і обхід усіх include()
+    return len(get_resolver().reverse_dict)
+
+
+def warm_templates():
+    """Компілює всі HTML-шаблони проєкту та застосунків у кеш завантажувача"""
+    compiled = 0
+    for engine in engines.all():
+        names = {
+            path.relative_to(directory).as_posix()
+            for directory in map(Path, engine.template_dirs)
+            for path in directory.rglob('*.html')
+        }
+        for name in sorted(names):
+            try:
+                engine.get_template(name)
+                compiled += 1
+            except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                logger.warning('Шаблон %s не скомпільовано: %s', name, exc)
+    return compiled
+
+
+def warm_database():
+    """Відкриває з'єднання (і пул psycopg) кожної БД та повертає його назад"""
+    warmed = 0
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            warmed += 1
+        except Exception as exc:  # БД ще недоступна - воркер все одно стартує
+            logger.warning('Прогрів БД %s не вдався: %s', alias, exc)
+    close_old_connections()
+    return warmed
+
+
+def warm_process():
+    """Прогрів, який можна робити до fork (без з'єднань з БД)"""
+    urls = warm_url_resolver()
+    templates = warm_templates()
+    logger.info('Прогрів: %d імен URL, %d шаблонів', urls, templates)
+    return {'urls': urls, 'templates': templates}
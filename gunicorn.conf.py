@@ -0,0 +1,123 @@
+"""
+Конфігурація gunicorn (підхоплюється автоматично з робочої директорії).
+
+Кількість воркерів рахується з доступних CPU та пам'яті контейнера
+(cgroup), застосунок завантажується в master до fork і прогрівається,
+а воркери перезапускаються після max_requests запитів, щоб не накопичували
+пам'ять. Усі значення можна перевизначити змінними середовища GUNICORN_*.
+"""
+import math
+import multiprocessing
+import os
+
+# uvicorn - ASGI (async views), gthread - WSGI з потоками, sync - WSGI без потоків
+WORKER_CLASSES = {
+    'uvicorn': 'uvicorn_worker.UvicornWorker',
+    'gthread': 'gthread',
+    'sync': 'sync',
+}
+
+
+CPU_MAX_PATH = '/sys/fs/cgroup/cpu.max'
+
+
+def _read_values(path):
+    try:
+        with open(path) as file:
+            return file.read().split()
+    except OSError:
+        return None
+
+
+def _read_int(path):
+    value = _read_values(path)
+    if not value or value[0] == 'max':
+        return None
+    return int(value[0])
+
+
+def cpu_quota(path=CPU_MAX_PATH):
+    """
+    CPU за квотою cgroup v2 (cpu.max: "квота період"), округлено вгору:
+    квота 0.5 CPU дає 1, а не 0. None - квоти немає ("max" або файлу немає).
+    """
+    value = _read_values(path)
+    if not value or value[0] == 'max':
+        return None
+    period = int(value[1]) if len(value) > 1 else 100000
+    return math.ceil(int(value[0]) / period)
+
+
+def available_cpus(cpu_max_path=CPU_MAX_PATH):
+    """CPU з урахуванням affinity та квоти cgroup v2"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    quota = cpu_quota(cpu_max_path)
+    return cpus if quota is None else max(1, min(cpus, quota))
+
+
+def available_memory_mb():
+    """Ліміт пам'яті cgroup або фізична пам'ять, МБ"""
+    limit = _read_int('/sys/fs/cgroup/memory.max') or _read_int('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    try:
+        physical = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        physical = None
+    candidates = [value for value in (limit, physical) if value]
+    return min(candidates) // (1024 * 1024) if candidates else None
+
+
+def worker_count(cpus, memory_mb, worker_memory_mb):
+    """2 * CPU + 1, але не більше, ніж вміщує пам'ять (з запасом 20% для master)"""
+    by_cpu = 2 * cpus + 1
+    if not memory_mb:
+        return by_cpu
+    by_memory = int(memory_mb * 0.8 // worker_memory_mb)
+    return max(1, min(by_cpu, by_memory))
+
+
+worker_kind = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn')
+worker_class = WORKER_CLASSES[worker_kind]
+wsgi_app = 'cms_django.asgi:application' if worker_kind == 'uvicorn' else 'cms_django.wsgi:application'
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('GUNICORN_WORKERS') or worker_count(
+    available_cpus(), available_memory_mb(), int(os.environ.get('GUNICORN_WORKER_MEMORY_MB', 150)),
+))
+# Для gthread потоки покривають очікування БД; uvicorn і sync їх не використовують
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_kind == 'gthread' else 1))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+# Розкид, щоб воркери не перезапускались одночасно
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def when_ready(server):
+    """Master: застосунок уже імпортовано (preload) - прогріваємо URL і шаблони до fork"""
+    if not preload_app:
+        return
+    from cms_django.warmup import warm_process
+
+    stats = warm_process()
+    server.log.info(
+        'Warmed up %d URL names and %d templates; %d %s workers',
+        stats['urls'], stats['templates'], workers, worker_kind,
+    )
+
+
+def post_worker_init(worker):
+    """Воркер: застосунок завантажено - відкриваємо пул БД до першого запиту"""
+    from cms_django.warmup import warm_database, warm_process
+
+    if not preload_app:
+        warm_process()
+    warm_database()
@@ -1,9 +1,28 @@
+import base64
+
+from django import forms
 from django.contrib import admin
 from django.http import HttpResponseRedirect
-from django.urls import path
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.contrib import messages
-from .models import User, Patient, FractionHistory, MedicalIncapacity
-from .services import recalculate_discharge_date
+from .importer import import_patients, read_rows
+from .models import User, Patient, FractionHistory, MedicalIncapacity, Holiday, TreatmentMachine
+from .services import bulk_recalculate_discharge_dates, refresh_fraction_summaries
+
+
+def errors_csv_url(result):
+    """
+    Звіт помилок імпорту як data: URL - віддається в самій відповіді на
+    завантаження, а не окремим запитом, який міг би потрапити на інший воркер
+    """
+    content = ('\ufeff' + result.error_csv()).encode('utf-8')
+    return 'data:text/csv;base64,' + base64.b64encode(content).decode('ascii')
+
+
+class PatientImportForm(forms.Form):
+    file = forms.FileField(label='Файл CSV або XLSX')
+    dry_run = forms.BooleanField(label='Лише перевірити, без імпорту', required=False)
 
 
 @admin.register(Patient)
@@ -15,13 +34,8 @@ class PatientAdmin(admin.ModelAdmin):
     actions = ['update_discharge_dates']
     
     def update_discharge_dates(self, request, queryset):
-        updated_count = 0
-        for patient in queryset:
-            if patient.fractions.exists():
-                old_date = patient.discharge_date
-                new_date = recalculate_discharge_date(patient)
-                if new_date and new_date != old_date:
-                    updated_count += 1
+        changes = bulk_recalculate_discharge_dates(queryset)
+        updated_count = len(changes)
         
         if updated_count > 0:
             self.message_user(
@@ -37,8 +51,71 @@ class PatientAdmin(admin.ModelAdmin):
             )
     
     update_discharge_dates.short_description = "Оновити дати виписки для вибраних пацієнтів"
+    
+    change_list_template = 'admin/patients/patient/change_list.html'
+    
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='patients_patient_import'),
+        ] + super().get_urls()
+    
+    def import_view(self, request):
+        """Завантаження файлу для масового імпорту пацієнтів"""
+        if not self.has_add_permission(request):
+            return HttpResponseRedirect(reverse('admin:patients_patient_changelist'))
+        
+        result = None
+        form = PatientImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            result = import_patients(read_rows(upload, upload.name), dry_run=form.cleaned_data['dry_run'])
+            if result.created:
+                self.message_user(
+                    request,
+                    f'Імпортовано пацієнтів: {result.created}, фракцій: {result.fractions}',
+                    messages.SUCCESS
+                )
+        
+        return TemplateResponse(request, 'admin/patients/patient/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Імпорт пацієнтів',
+            'form': form,
+            'result': result,
+            'errors_preview': result.errors[:200] if result else [],
+            'errors_csv_url': errors_csv_url(result) if result and result.errors else None,
+        })
+
+
+@admin.register(TreatmentMachine)
+class TreatmentMachineAdmin(admin.ModelAdmin):
+    list_display = ['name', 'day_start', 'day_end', 'slot_minutes', 'slots_per_day', 'is_active']
+    list_filter = ['is_active']
+
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'name']
+    date_hierarchy = 'date'
+
+
+@admin.register(FractionHistory)
+class FractionHistoryAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'date', 'dose', 'delivered', 'confirmed_by_doctor', 'is_missed', 'is_postponed']
+    list_filter = ['delivered', 'confirmed_by_doctor', 'is_missed', 'is_postponed']
+    list_select_related = ['patient']
+    
+    # Збереження однієї фракції оновлює підсумки через сигнал post_save,
+    # а видалення - тут, щоб не рахувати підсумки на кожен видалений рядок
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_fraction_summaries([obj.patient_id])
+    
+    def delete_queryset(self, request, queryset):
+        patient_ids = set(queryset.values_list('patient_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_fraction_summaries(patient_ids)
 
 
 admin.site.register(User)
-admin.site.register(FractionHistory)
 admin.site.register(MedicalIncapacity)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patients'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .query_budget import install_query_recording
+
+        # Облік запитів (QueryBudgetMiddleware) на з'єднаннях усіх потоків
+        connection_created.connect(install_query_recording, dispatch_uid='patients.query_recording')
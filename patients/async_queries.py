@@ -0,0 +1,50 @@
+"""
+Паралельне виконання незалежних запитів в async views.
+
+Async ORM Django виконує кожен запит через sync_to_async(thread_sensitive=True),
+тобто всі запити одного HTTP-запиту йдуть по черзі в одному потоці, і
+asyncio.gather над aaggregate()/aget() їх не перекриває. Тут кожна функція
+виконується в окремому потоці пулу зі своїм з'єднанням до БД (з пулу
+psycopg), тож затримка сторінки визначається найповільнішим запитом, а не
+сумою всіх.
+
+Паралельно запити йдуть лише поза транзакцією: інші з'єднання не бачать
+незафіксованих даних (зокрема в тестах TestCase). Для SQLite паралельність
+не дає виграшу, тому там запити виконуються послідовно.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+
+def concurrent_queries_enabled():
+    return (
+        getattr(settings, 'ASYNC_CONCURRENT_QUERIES', True)
+        and connection.vendor != 'sqlite'
+        and not connection.in_atomic_block
+    )
+
+
+def _with_own_connection(func):
+    def run():
+        try:
+            return func()
+        finally:
+            # Повертає з'єднання потоку пулу (в пул psycopg або за CONN_MAX_AGE)
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """
+    Виконує sync-функції з запитами до БД і повертає результати в порядку
+    аргументів. Функції мають бути незалежними і лише читати дані.
+    """
+    if await sync_to_async(concurrent_queries_enabled)():
+        return await asyncio.gather(*(
+            sync_to_async(_with_own_connection(func), thread_sensitive=False)()
+            for func in funcs
+        ))
+    return [await sync_to_async(func)() for func in funcs]
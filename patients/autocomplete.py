@@ -0,0 +1,183 @@
+"""
+In-memory префіксний індекс для автодоповнення пошуку пацієнтів.
+
+Кожен воркер тримає відсортований список ключів (нормалізоване прізвище,
+"прізвище ім'я", номер амбулаторної карти) і шукає префікс двійковим
+пошуком, тому запит на кожне натискання клавіші не йде в базу.
+Збереження пацієнта в цьому воркері оновлює індекс одразу (сигнали, а для
+масового імпорту без сигналів - patients_added після коміту); зміни з інших воркерів та масові update() підхоплюються повною
+перебудовою раз на AUTOCOMPLETE_REFRESH_SECONDS.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def normalize(value):
+    """Нижній регістр, без зайвих пробілів; апостроф і ґ/г не розрізняються"""
+    value = ' '.join((value or '').split()).casefold()
+    return value.replace('ʼ', "'").replace('’', "'").replace('ґ', 'г')
+
+
+def _keys_for(last_name, first_name, ambulatory_card_id):
+    keys = set()
+    surname = normalize(last_name)
+    if surname:
+        keys.add(surname)
+        if first_name:
+            keys.add(f'{surname} {normalize(first_name)}')
+    card = normalize(ambulatory_card_id)
+    if card:
+        keys.add(card)
+    return keys
+
+
+class PrefixIndex:
+    """Відсортований масив пар (ключ, pk) з пошуком за префіксом"""
+
+    def __init__(self):
+        self._entries = []
+        self._keys_by_pk = {}
+        self._payload_by_pk = {}
+        self._lock = threading.RLock()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._payload_by_pk)
+
+    def _add(self, pk, keys, payload):
+        for key in keys:
+            insort(self._entries, (key, pk))
+        self._keys_by_pk[pk] = keys
+        self._payload_by_pk[pk] = payload
+
+    def _discard(self, pk):
+        for key in self._keys_by_pk.pop(pk, ()):
+            position = bisect_left(self._entries, (key, pk))
+            if position < len(self._entries) and self._entries[position] == (key, pk):
+                del self._entries[position]
+        self._payload_by_pk.pop(pk, None)
+
+    def build(self, rows):
+        """Повна перебудова з ітерованого набору рядків (див. PATIENT_FIELDS)"""
+        entries = []
+        keys_by_pk = {}
+        payload_by_pk = {}
+        for row in rows:
+            pk = row['id']
+            keys = _keys_for(row['last_name'], row['first_name'], row['ambulatory_card_id'])
+            entries.extend((key, pk) for key in keys)
+            keys_by_pk[pk] = keys
+            payload_by_pk[pk] = _payload(row)
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._keys_by_pk = keys_by_pk
+            self._payload_by_pk = payload_by_pk
+            self.built_at = time.monotonic()
+
+    def update(self, row):
+        with self._lock:
+            self._discard(row['id'])
+            keys = _keys_for(row['last_name'], row['first_name'], row['ambulatory_card_id'])
+            self._add(row['id'], keys, _payload(row))
+
+    def update_many(self, rows):
+        """Пакетне оновлення: одне сортування замість insort на кожен ключ"""
+        with self._lock:
+            entries = []
+            for row in rows:
+                self._discard(row['id'])
+                keys = _keys_for(row['last_name'], row['first_name'], row['ambulatory_card_id'])
+                entries.extend((key, row['id']) for key in keys)
+                self._keys_by_pk[row['id']] = keys
+                self._payload_by_pk[row['id']] = _payload(row)
+            self._entries.extend(entries)
+            self._entries.sort()
+
+    def remove(self, pk):
+        with self._lock:
+            self._discard(pk)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(results) < limit:
+                key, pk = self._entries[position]
+                if not key.startswith(prefix):
+                    break
+                if pk not in seen:
+                    seen.add(pk)
+                    results.append(self._payload_by_pk[pk])
+                position += 1
+        return results
+
+
+PATIENT_FIELDS = ['id', 'last_name', 'first_name', 'middle_name', 'ambulatory_card_id', 'birth_date']
+
+
+def _payload(row):
+    name = ' '.join(part for part in (row['last_name'], row['first_name'], row['middle_name']) if part)
+    return {
+        'id': row['id'],
+        'name': name,
+        'card': row['ambulatory_card_id'] or '',
+        # str() дає ISO-формат і для date, і для рядка, переданого в create()
+        'birth_date': str(row['birth_date']) if row['birth_date'] else None,
+    }
+
+
+def _row_from_instance(patient):
+    return {field: getattr(patient, 'pk' if field == 'id' else field) for field in PATIENT_FIELDS}
+
+
+patient_index = PrefixIndex()
+_build_lock = threading.Lock()
+
+
+def get_index():
+    """Індекс поточного воркера; будується при першому зверненні та після TTL"""
+    refresh_seconds = getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 300)
+    built_at = patient_index.built_at
+    if built_at is None or time.monotonic() - built_at > refresh_seconds:
+        with _build_lock:
+            # Інший потік міг уже перебудувати індекс, поки ми чекали
+            if patient_index.built_at == built_at:
+                from .models import Patient
+                patient_index.build(Patient.objects.values(*PATIENT_FIELDS).iterator(chunk_size=5000))
+    return patient_index
+
+
+def autocomplete(query, limit=DEFAULT_LIMIT):
+    """Топ-N пацієнтів, у яких прізвище, "прізвище ім'я" або номер карти починаються з query"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    return get_index().search(query, limit)
+
+
+def patient_saved(patient, update_fields=None):
+    """Інкрементне оновлення після збереження пацієнта (лише якщо індекс уже побудовано)"""
+    if update_fields is not None and not set(PATIENT_FIELDS) & set(update_fields):
+        return
+    if patient_index.built_at is not None:
+        patient_index.update(_row_from_instance(patient))
+
+
+def patients_added(patients):
+    """Додає до індексу пацієнтів, створених в обхід сигналів (bulk_create, COPY)"""
+    if patient_index.built_at is not None:
+        patient_index.update_many([_row_from_instance(patient) for patient in patients])
+
+
+def patient_deleted(pk):
+    if patient_index.built_at is not None:
+        patient_index.remove(pk)
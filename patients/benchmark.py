@@ -0,0 +1,163 @@
+"""
+Наскрізний бенчмарк сторінок: кожен маршрут patients/urls.py виконується
+тестовим клієнтом Django з заміром затримки, кількості SQL-запитів та
+пікової пам'яті.
+
+Кожен запит виконується у вкладеній транзакції, яка відкочується, тому
+POST-маршрути (створення пацієнта, підтвердження фракцій тощо) не
+змінюють дані між повтореннями і всі виміри йдуть на однаковому стані бази.
+"""
+import math
+import time
+import tracemalloc
+from datetime import date
+
+from django.db import transaction
+from django.urls import reverse
+
+from .models import FractionHistory
+from .query_budget import QueryRecorder, get_query_budget
+
+
+def route_requests(patient, fraction, incapacity, pending_user):
+    """
+    Список (url_name, метод, url, дані) для кожного маршруту patients/urls.py.
+
+    Використовується бенчмарком і тестом бюджетів запитів, тож новий
+    маршрут треба додати сюди - інакше тест покаже, що його не покрито.
+    """
+    fraction_ids = list(
+        FractionHistory.objects.filter(date=date.today()).values_list('pk', flat=True)[:50]
+    )
+    return [
+        ('dashboard', 'get', reverse('dashboard'), None),
+        ('search_patients', 'get', reverse('search_patients') + '?q=Коваль', None),
+        ('patient_autocomplete', 'get', reverse('patient_autocomplete') + '?q=ко', None),
+        ('patient_list', 'get', reverse('patient_list'), None),
+        ('patient_list_filtered', 'get', reverse('patient_list_filtered', args=['in-treatment']), None),
+        ('patient_archive', 'get', reverse('patient_archive'), None),
+        ('inpatient_list', 'get', reverse('inpatient_list'), None),
+        ('patient_export', 'get', reverse('patient_export') + '?filter=in-treatment', None),
+        ('patient_create', 'post', reverse('patient_create'), {
+            'last_name': 'Бюджетний', 'first_name': 'Пацієнт',
+            'treatment_start_date': date.today().strftime('%d.%m.%Y'),
+            'total_fractions': 20, 'dose_per_fraction': 2.0,
+        }),
+        ('patient_detail', 'get', reverse('patient_detail', args=[patient.pk]), None),
+        ('patient_update', 'post', reverse('patient_update', args=[patient.pk]), {
+            'last_name': patient.last_name, 'first_name': 'Оновлений',
+        }),
+        ('patient_delete', 'get', reverse('patient_delete', args=[patient.pk]), None),
+        ('fraction_list', 'get', reverse('fraction_list'), None),
+        ('patient_fraction_list', 'get', reverse('patient_fraction_list', args=[patient.pk]), None),
+        ('fraction_export', 'get', reverse('fraction_export'), None),
+        ('generate_fractions', 'post', reverse('generate_fractions', args=[patient.pk]), None),
+        ('recalculate_discharge', 'post', reverse('recalculate_discharge', args=[patient.pk]), None),
+        ('fraction_edit', 'get', reverse('fraction_edit', args=[fraction.pk]), None),
+        ('fraction_shift', 'post', reverse('fraction_shift', args=[fraction.pk]), {'days': 1, 'reason': 'Бюджет'}),
+        ('treatment_worklist', 'get', reverse('treatment_worklist') + f'?date={fraction.date.isoformat()}', None),
+        ('closure_reschedule', 'post', reverse('closure_reschedule'), {
+            'dates': fraction.date.strftime('%d.%m.%Y'), 'reason': 'Бюджет', 'preview': '',
+        }),
+        ('confirm_fractions_doctor', 'post', reverse('confirm_fractions_doctor'), {'fraction_ids': fraction_ids}),
+        ('confirm_fractions_nurse', 'post', reverse('confirm_fractions_nurse'), {'fraction_ids': fraction_ids}),
+        ('medical_incapacity_create', 'get', reverse('medical_incapacity_create', args=[patient.pk]), None),
+        ('medical_incapacity_delete', 'get', reverse('medical_incapacity_delete', args=[incapacity.pk]), None),
+        ('register', 'get', reverse('register'), None),
+        ('admin_users', 'get', reverse('admin_users'), None),
+        ('approve_user', 'post', reverse('approve_user', args=[pending_user.pk]), None),
+        ('confirm_blood_test', 'post', reverse('confirm_blood_test', args=[patient.pk]), None),
+        ('update_all_discharge_dates', 'post', reverse('update_all_discharge_dates'), None),
+        ('login', 'get', reverse('login'), None),
+        ('logout', 'get', reverse('logout'), None),
+    ]
+
+
+def percentile(values, pct):
+    """Перцентиль методом найближчого рангу (без інтерполяції)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _perform(client, method, url, data):
+    """
+    Один запит у транзакції, що відкочується. Повертає (відповідь,
+    кількість запитів, мс); SAVEPOINT самої транзакції не враховуються.
+    """
+    with transaction.atomic():
+        with QueryRecorder() as recorder:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, secure=True)
+            if response.streaming:
+                # Потокові експорти читають БД під час віддачі тіла
+                for _ in response.streaming_content:
+                    pass
+            elapsed = (time.perf_counter() - start) * 1000
+        transaction.set_rollback(True)
+    return response, recorder.count, elapsed
+
+
+def _ensure_logged_in(client, user):
+    # logout очищує сесію клієнта - повертаємо вхід для наступних запитів
+    if '_auth_user_id' not in client.session:
+        client.force_login(user)
+
+
+def benchmark_route(client, user, method, url, data=None, iterations=20, warmup=2):
+    """
+    Заміри одного маршруту. Пам'ять міряється окремим прогоном під
+    tracemalloc, щоб його накладні витрати не спотворювали затримку.
+    """
+    for _ in range(warmup):
+        _perform(client, method, url, data)
+        _ensure_logged_in(client, user)
+
+    latencies = []
+    query_counts = []
+    status_codes = set()
+    for _ in range(iterations):
+        response, queries, elapsed = _perform(client, method, url, data)
+        _ensure_logged_in(client, user)
+        latencies.append(elapsed)
+        query_counts.append(queries)
+        status_codes.add(response.status_code)
+
+    tracemalloc.start()
+    try:
+        _perform(client, method, url, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    _ensure_logged_in(client, user)
+
+    return {
+        'method': method.upper(),
+        'url': url,
+        'status': sorted(status_codes),
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries': max(query_counts),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmark(client, user, requests, iterations=20, warmup=2, only=None, stdout=None):
+    """Заміри для всіх маршрутів; повертає {url_name: результат}"""
+    results = {}
+    for name, method, url, data in requests:
+        if only and name not in only:
+            continue
+        result = benchmark_route(client, user, method, url, data, iterations, warmup)
+        result['query_budget'] = get_query_budget(name)
+        results[name] = result
+        if stdout is not None:
+            stdout.write(
+                f"{name:<28} p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+                f"запитів {result['queries']:>3}  пам'ять {result['peak_memory_kb']:>8.1f} KB"
+            )
+    return results
@@ -0,0 +1,91 @@
+"""
+Версії даних пацієнтів для кешування фрагментів шаблонів.
+
+Кожен пацієнт має токен версії в кеші. Фрагменти сторінок кешуються з
+ключем, що містить цей токен, тому будь-яка зміна пацієнта, його фракцій
+чи лікарняних (сигнали та масові операції викликають bump_patient_versions)
+робить старі фрагменти недосяжними - застарілі дані не показуються.
+Якщо токен витіснено з кешу, створюється новий, що дає лише промах кешу.
+
+Усе зберігається в окремому кеші FRAGMENT_CACHE_ALIAS: без кешу в пам'яті
+(Redis, LocMem) це DummyCache, і фрагменти просто не кешуються, а не
+перетворюються на запити до таблиці кешу в БД (див. CACHES у settings).
+"""
+import time
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+FRAGMENT_CACHE_ALIAS = 'fragments'
+cache = ConnectionProxy(caches, FRAGMENT_CACHE_ALIAS)
+
+# Фрагменти живуть довго: актуальність гарантує версія, а не TTL
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def _version_key(patient_id):
+    return f'patient-version:{patient_id}'
+
+
+def _new_token():
+    return str(time.time_ns())
+
+
+def patient_versions(patient_ids):
+    """Словник {patient_id: версія}; відсутні версії створюються"""
+    keys = {_version_key(pk): pk for pk in patient_ids}
+    if not keys:
+        return {}
+    versions = cache.get_many(keys)
+    missing = {key: _new_token() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {pk: versions[key] for key, pk in keys.items()}
+
+
+def patient_version(patient_id):
+    return patient_versions([patient_id])[patient_id]
+
+
+def _set_new_versions(patient_ids):
+    token = _new_token()
+    cache.set_many({_version_key(pk): token for pk in patient_ids}, None)
+
+
+def bump_patient_versions(patient_ids):
+    """
+    Інвалідовує кешовані фрагменти пацієнтів.
+
+    Версія змінюється одразу і ще раз після коміту транзакції: інакше
+    паралельний запит міг би закешувати старі дані під новою версією,
+    поки транзакція ще не зафіксована.
+    """
+    patient_ids = {pk for pk in patient_ids if pk is not None}
+    if not patient_ids:
+        return
+    _set_new_versions(patient_ids)
+    transaction.on_commit(lambda: _set_new_versions(patient_ids))
+
+
+def cached_fragment_ids(fragment_name, versions, *vary_on):
+    """
+    Id пацієнтів, для яких фрагмент {% cache ... fragment_name pk версія *vary_on %}
+    вже є в кеші. Дозволяє не завантажувати дані для закешованих фрагментів.
+    """
+    keys = {
+        make_template_fragment_key(fragment_name, [pk, version, *vary_on]): pk
+        for pk, version in versions.items()
+    }
+    return {keys[key] for key in cache.get_many(keys)}
+
+
+def attach_cache_versions(patients):
+    """Додає кожному пацієнту атрибут cache_version (один запит до кешу)"""
+    patients = list(patients)
+    versions = patient_versions([patient.pk for patient in patients])
+    for patient in patients:
+        patient.cache_version = versions[patient.pk]
+    return patients
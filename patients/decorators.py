@@ -1,11 +1,24 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required as django_login_required
 from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
 
 def login_required(view_func):
     """
     Власний декоратор для перевірки авторизації з кращим UX
     """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            # request.user в async-коді не можна обчислити ліниво - завантажуємо явно
+            # і підставляємо, щоб шаблон не робив повторний запит
+            request.user = await request.auser()
+            if request.user.is_authenticated:
+                return await view_func(request, *args, **kwargs)
+            return await sync_to_async(render)(request, 'patients/unauthorized.html')
+        
+        return _wrapped_async_view
+    
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         if request.user.is_authenticated:
@@ -0,0 +1,160 @@
+"""
+Потоковий експорт пацієнтів та історії фракцій у CSV і XLSX.
+
+Рядки читаються через .values_list().iterator(chunk_size=...): на
+PostgreSQL це серверний курсор, тож у пам'яті одночасно лише один пакет
+рядків, скільки б їх не було. CSV віддається частинами через
+StreamingHttpResponse, XLSX пишеться openpyxl у режимі write_only у
+тимчасовий файл на диску.
+"""
+import csv
+import io
+import tempfile
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+
+from .models import FractionHistory
+
+EXPORT_CHUNK_SIZE = 2000
+# Рядків CSV в одній частині HTTP-відповіді
+ROWS_PER_CHUNK = 500
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# (заголовок, поле values_list)
+PATIENT_COLUMNS = [
+    ('Прізвище', 'last_name'),
+    ("Ім'я", 'first_name'),
+    ('По батькові', 'middle_name'),
+    ('№ амбулаторної карти', 'ambulatory_card_id'),
+    ('Дата народження', 'birth_date'),
+    ('Стать', 'gender'),
+    ('Діагноз', 'diagnosis'),
+    ('TNM', 'tnm_staging'),
+    ('Тип лікування', 'treatment_type'),
+    ('Зона опромінення', 'irradiation_zone'),
+    ('Кількість фракцій', 'total_fractions'),
+    ('РОД, Гр', 'dose_per_fraction'),
+    ('СОД, Гр', 'received_dose'),
+    ('КТ-симуляція', 'ct_simulation_date'),
+    ('Початок лікування', 'treatment_start_date'),
+    ('Дата виписки', 'discharge_date'),
+    ('Стаціонар', 'inpatient_status'),
+    ('Палата', 'ward_number'),
+    ('МВТН до', 'latest_incapacity_end'),
+]
+
+FRACTION_COLUMNS = [
+    ('Прізвище', 'patient__last_name'),
+    ("Ім'я", 'patient__first_name'),
+    ('По батькові', 'patient__middle_name'),
+    ('№ амбулаторної карти', 'patient__ambulatory_card_id'),
+    ('Дата', 'date'),
+    ('Доза, Гр', 'dose'),
+    ('Проведено', 'delivered'),
+    ('Підтверджено лікарем', 'confirmed_by_doctor'),
+    ('Пропущено', 'is_missed'),
+    ('Відкладено', 'is_postponed'),
+    ('Початкова дата', 'original_date'),
+    ('Причина', 'reason'),
+    ('Примітка', 'note'),
+]
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+def patient_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Рядки пацієнтів; queryset має бути анотований with_latest_incapacity_end()"""
+    fields = [field for _, field in PATIENT_COLUMNS]
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def fraction_export_queryset(patients=None):
+    """
+    Фракції пацієнтів (або всі), згруповані по пацієнтах у порядку
+    fraction_list. Пацієнти фільтруються підзапитом, а не списком id.
+    """
+    fractions = FractionHistory.objects.all()
+    if patients is not None:
+        fractions = fractions.filter(patient__in=patients.values('pk'))
+    return fractions.order_by('patient__last_name', 'patient__first_name', 'patient_id', 'date', 'pk')
+
+
+def fraction_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    fields = [field for _, field in FRACTION_COLUMNS]
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if value is True:
+        return 'так'
+    if value is False:
+        return 'ні'
+    return value
+
+
+def csv_chunks(columns, rows, rows_per_chunk=ROWS_PER_CHUNK):
+    """
+    Текст CSV частинами по rows_per_chunk рядків. Починається з BOM,
+    щоб Excel правильно відкривав кирилицю.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _ in columns])
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, rows_per_chunk))
+        if not batch:
+            break
+        writer.writerows([_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_xlsx(columns, rows, file, title='Дані'):
+    """Пише рядки у XLSX-файл без побудови всієї книги в пам'яті"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append([header for header, _ in columns])
+    for row in rows:
+        sheet.append([None if value is None else _cell(value) for value in row])
+    workbook.save(file)
+
+
+async def _aiter_chunks(chunks):
+    # Частини читаються в потоці запиту (там же серверний курсор) пакетами,
+    # щоб ASGI не збирав увесь синхронний ітератор у список
+    next_batch = sync_to_async(lambda: list(islice(chunks, 20)))
+    while batch := await next_batch():
+        for chunk in batch:
+            yield chunk
+
+
+def export_response(request, columns, rows, filename, export_format='csv'):
+    """HTTP-відповідь з експортом; CSV - потоком, XLSX - файлом з диска"""
+    if export_format == 'xlsx':
+        file = tempfile.TemporaryFile()
+        write_xlsx(columns, rows, file)
+        file.seek(0)
+        return FileResponse(
+            file, as_attachment=True, filename=f'{filename}.xlsx', content_type=XLSX_CONTENT_TYPE
+        )
+
+    chunks = csv_chunks(columns, rows)
+    response = StreamingHttpResponse(
+        _aiter_chunks(chunks) if isinstance(request, ASGIRequest) else chunks,
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
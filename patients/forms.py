@@ -1,9 +1,12 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from .models import Patient, FractionHistory, MedicalIncapacity, User
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import authenticate
 
+DUPLICATE_CARD_ID_MESSAGE = 'Пацієнт з таким ID амбулаторної картки вже існує'
+
 class PatientForm(forms.ModelForm):
     birth_date = forms.DateField(
         input_formats=['%d.%m.%Y', '%Y-%m-%d'],
@@ -46,6 +49,7 @@ class PatientForm(forms.ModelForm):
                 date_value = getattr(self.instance, field_name)
                 if date_value:
                     self.initial[field_name] = date_value.strftime('%d.%m.%Y')
+        self.fields['treatment_machine'].empty_label = 'Будь-який апарат'
     
     class Meta:
         model = Patient
@@ -57,7 +61,7 @@ class PatientForm(forms.ModelForm):
             'total_fractions', 'dose_per_fraction', 'received_dose',
             'discharge_date', 'treatment_phase',
             'irradiation_zone', 'inpatient_status', 'ward_number', 'prior_radiation', 
-            'last_blood_test_date', 'notes'
+            'last_blood_test_date', 'notes', 'treatment_machine', 'preferred_time'
         ]
         widgets = {
             'ambulatory_card_id': forms.TextInput(attrs={
@@ -114,6 +118,8 @@ class PatientForm(forms.ModelForm):
             'ward_number': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Номер палати'}),
             'prior_radiation': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Попереднє опромінення'}),
             'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': 'Додаткові примітки'}),
+            'treatment_machine': forms.Select(attrs={'class': 'form-control'}),
+            'preferred_time': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}, format='%H:%M'),
         }
 
     def clean(self):
@@ -139,18 +145,7 @@ class PatientForm(forms.ModelForm):
                 raise ValidationError({
                     'ambulatory_card_id': 'ID амбулаторної картки повинен містити хоча б одну цифру'
                 })
-            
-            # Перевірка унікальності (якщо редагуємо існуючого пацієнта)
-            instance = self.instance
-            if instance and instance.pk:
-                existing = Patient.objects.filter(ambulatory_card_id=ambulatory_card_id).exclude(pk=instance.pk)
-            else:
-                existing = Patient.objects.filter(ambulatory_card_id=ambulatory_card_id)
-            
-            if existing.exists():
-                raise ValidationError({
-                    'ambulatory_card_id': 'Пацієнт з таким ID амбулаторної картки вже існує'
-                })
+
         
         # Перевірка дат
         treatment_start = cleaned_data.get('treatment_start_date')
@@ -161,6 +156,43 @@ class PatientForm(forms.ModelForm):
         
         return cleaned_data
 
+    def validate_unique(self):
+        # Унікальність номера карти перевіряє обмеження БД під час save(),
+        # тому окремий SELECT перед збереженням не потрібен
+        exclude = self._get_validation_exclusions()
+        exclude.add('ambulatory_card_id')
+        try:
+            self.instance.validate_unique(exclude=exclude)
+        except ValidationError as e:
+            self._update_errors(e)
+
+    def save(self, commit=True):
+        """
+        Зберігає пацієнта; порушення унікальності номера карти стає
+        помилкою поля форми. У такому разі повертає None.
+        """
+        if not commit:
+            return super().save(commit=False)
+        try:
+            with transaction.atomic():
+                return super().save()
+        except IntegrityError:
+            # Текст помилки залежить від БД і локалі, тому перевіряємо сам
+            # номер карти (транзакцію вже відкочено, запит виконається)
+            if not self._card_id_taken():
+                raise
+            self.add_error('ambulatory_card_id', DUPLICATE_CARD_ID_MESSAGE)
+            return None
+
+    def _card_id_taken(self):
+        card_id = self.instance.ambulatory_card_id
+        if not card_id:
+            return False
+        others = Patient.objects.filter(ambulatory_card_id=card_id)
+        if not self.instance._state.adding:
+            others = others.exclude(pk=self.instance.pk)
+        return others.exists()
+
 class FractionHistoryForm(forms.ModelForm):
     date = forms.DateField(
         input_formats=['%d.%m.%Y', '%Y-%m-%d'],
@@ -252,6 +284,48 @@ class FractionEditForm(forms.ModelForm):
         
         return cleaned_data
 
+class CourseShiftForm(forms.Form):
+    """Зсув решти курсу (від цієї фракції) на кілька робочих днів"""
+    days = forms.IntegerField(
+        min_value=1, max_value=60, initial=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    reason = forms.CharField(
+        max_length=255, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Причина зсуву'})
+    )
+
+class ClosureRescheduleForm(forms.Form):
+    """Закриті дні відділення, з яких треба перенести фракції всіх пацієнтів"""
+    dates = forms.CharField(
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'дд.мм.рррр, дд.мм.рррр'}),
+        help_text='Одна або кілька дат через кому чи пробіл'
+    )
+    reason = forms.CharField(
+        max_length=255, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Наприклад: ТО лінійного прискорювача'})
+    )
+    add_holidays = forms.BooleanField(
+        required=False, label='Додати дати до святкових днів (нові курси теж їх оминатимуть)'
+    )
+    
+    def clean_dates(self):
+        from datetime import datetime
+        
+        dates = set()
+        for value in self.cleaned_data['dates'].replace(',', ' ').split():
+            for date_format in ('%d.%m.%Y', '%Y-%m-%d'):
+                try:
+                    dates.add(datetime.strptime(value, date_format).date())
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise ValidationError(f'Некоректна дата: {value}')
+        if not dates:
+            raise ValidationError('Вкажіть хоча б одну дату')
+        return sorted(dates)
+
 class UserRegistrationForm(UserCreationForm):
     role = forms.ChoiceField(
         choices=[
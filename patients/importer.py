@@ -0,0 +1,299 @@
+"""
+Масовий імпорт пацієнтів з CSV/XLSX з генерацією курсів фракцій.
+
+Замість PatientForm + save() + сигналу на кожен рядок: усі рядки
+валідуються в пам'яті, унікальність номерів карт перевіряється одним
+запитом на пакет, розклади всіх курсів рахуються одним векторним
+викликом workday_schedules, а пацієнти й фракції вставляються пакетами
+(bulk_create, на PostgreSQL - COPY). Некоректні рядки не імпортуються і
+потрапляють у звіт помилок з номером рядка файлу.
+
+Заголовки колонок - ті самі, що в експорті (patients.exports), або імена
+полів моделі, тож експортований файл можна імпортувати назад.
+"""
+import csv
+import io
+from datetime import date, datetime
+
+from django.db import IntegrityError, connection, transaction
+
+from .autocomplete import patients_added
+from .exports import PATIENT_COLUMNS
+from .forms import DUPLICATE_CARD_ID_MESSAGE
+from .models import Patient, FractionHistory, card_id_error
+from .services import refresh_fraction_summaries
+from .workdays import holiday_calendar, workday_schedules
+
+IMPORT_BATCH_SIZE = 5000
+
+DATE_FIELDS = [
+    'birth_date', 'ct_simulation_date', 'treatment_start_date', 'discharge_date',
+    'last_blood_test_date', 'histology_date',
+]
+INT_FIELDS = ['total_fractions', 'ward_number']
+FLOAT_FIELDS = ['dose_per_fraction', 'received_dose']
+TEXT_FIELDS = [
+    'ambulatory_card_id', 'last_name', 'first_name', 'middle_name', 'gender', 'diagnosis',
+    'tnm_staging', 'disease_stage', 'clinical_group', 'treatment_type', 'treatment_phase',
+    'irradiation_zone', 'histology_number', 'histology_description', 'inpatient_status',
+    'prior_radiation', 'notes',
+]
+IMPORT_FIELDS = TEXT_FIELDS + DATE_FIELDS + INT_FIELDS + FLOAT_FIELDS
+
+# Заголовок файлу (експорту або ім'я поля) -> поле моделі
+HEADER_FIELDS = {header.casefold(): field for header, field in PATIENT_COLUMNS if field in IMPORT_FIELDS}
+HEADER_FIELDS.update({field: field for field in IMPORT_FIELDS})
+
+DATE_FORMATS = ['%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y']
+
+
+class RowError(Exception):
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+        self.message = message
+
+
+class ImportResult:
+    """Підсумок імпорту: кількість створених записів та помилки по рядках"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.fractions = 0
+        self.errors = []  # (номер рядка, поле, повідомлення)
+
+    def add_error(self, line, field, message):
+        self.errors.append((line, field, message))
+
+    def error_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Рядок', 'Поле', 'Помилка'])
+        writer.writerows(self.errors)
+        return buffer.getvalue()
+
+
+def read_rows(file, filename):
+    """
+    Рядки файлу як (номер рядка, {поле: значення}). XLSX читається
+    openpyxl у режимі read_only, CSV - з автовизначенням роздільника.
+    """
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='') if isinstance(file.read(0), bytes) else file
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        rows = csv.reader(text, dialect)
+
+    header = next(rows, None) or []
+    fields = [HEADER_FIELDS.get(str(name or '').strip().casefold()) for name in header]
+    for line, row in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in row):
+            continue
+        yield line, {field: value for field, value in zip(fields, row) if field}
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def clean_row(values):
+    """Перетворює сирі значення рядка на значення полів Patient; RowError при помилці"""
+    cleaned = {}
+    for field, value in values.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            cleaned[field] = None
+            continue
+        try:
+            if field in DATE_FIELDS:
+                cleaned[field] = _parse_date(value)
+            elif field in INT_FIELDS:
+                cleaned[field] = int(float(str(value).replace(',', '.')))
+            elif field in FLOAT_FIELDS:
+                cleaned[field] = float(str(value).replace(',', '.'))
+            else:
+                cleaned[field] = str(value)
+        except (TypeError, ValueError):
+            raise RowError(field, f'Некоректне значення: {value}')
+
+    if not cleaned.get('last_name'):
+        raise RowError('last_name', 'Прізвище обов\'язкове')
+    for field in TEXT_FIELDS:
+        max_length = Patient._meta.get_field(field).max_length
+        if max_length and cleaned.get(field) and len(cleaned[field]) > max_length:
+            raise RowError(field, f'Довше за {max_length} символів')
+    card_id = cleaned.get('ambulatory_card_id')
+    if card_id and card_id_error(card_id):
+        raise RowError('ambulatory_card_id', card_id_error(card_id))
+    start, discharge = cleaned.get('treatment_start_date'), cleaned.get('discharge_date')
+    if start and discharge and discharge < start:
+        raise RowError('discharge_date', 'Дата виписки не може бути раніше дати початку лікування')
+    if cleaned.get('total_fractions') is not None and cleaned['total_fractions'] < 0:
+        raise RowError('total_fractions', 'Кількість фракцій не може бути від\'ємною')
+    return cleaned
+
+
+def _existing_card_ids(card_ids):
+    """Номери карт, що вже є в БД - один запит на пакет номерів"""
+    card_ids = list(card_ids)
+    existing = set()
+    for offset in range(0, len(card_ids), IMPORT_BATCH_SIZE):
+        existing.update(Patient.objects.filter(
+            ambulatory_card_id__in=card_ids[offset:offset + IMPORT_BATCH_SIZE]
+        ).values_list('ambulatory_card_id', flat=True))
+    return existing
+
+
+def validate_rows(rows, result):
+    """Валідація всіх рядків; повертає [(номер рядка, поля)] лише коректних рядків"""
+    valid = []
+    lines_by_card = {}
+    for line, values in rows:
+        result.rows += 1
+        try:
+            cleaned = clean_row(values)
+        except RowError as error:
+            result.add_error(line, error.field, error.message)
+            continue
+        card_id = cleaned.get('ambulatory_card_id')
+        if card_id:
+            if card_id in lines_by_card:
+                result.add_error(line, 'ambulatory_card_id', f'Повтор номера карти з рядка {lines_by_card[card_id]}')
+                continue
+            lines_by_card[card_id] = line
+        valid.append((line, cleaned))
+
+    existing = _existing_card_ids(lines_by_card)
+    if existing:
+        for line, cleaned in valid:
+            if cleaned.get('ambulatory_card_id') in existing:
+                result.add_error(line, 'ambulatory_card_id', DUPLICATE_CARD_ID_MESSAGE)
+        valid = [(line, cleaned) for line, cleaned in valid if cleaned.get('ambulatory_card_id') not in existing]
+    result.errors.sort()
+    return valid
+
+
+def _schedules(patients):
+    """
+    Розклади фракцій для пацієнтів з повними параметрами курсу - як
+    auto_generate_fractions, але одним векторним викликом для всіх.
+    """
+    treated = [
+        patient for patient in patients
+        if patient.treatment_start_date and patient.total_fractions and patient.dose_per_fraction
+    ]
+    schedules = workday_schedules(
+        [patient.treatment_start_date for patient in treated],
+        [patient.total_fractions for patient in treated],
+        calendar=holiday_calendar(),
+    )
+    return list(zip(treated, schedules))
+
+
+def _copy_rows(table, columns, rows):
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(f'COPY {table} ({", ".join(columns)}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def _reserve_ids(table, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [table, 'id', count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _insert_patients(patients):
+    if connection.vendor != 'postgresql':
+        Patient.objects.bulk_create(patients, batch_size=IMPORT_BATCH_SIZE)
+        return
+    # COPY не повертає id - резервуємо їх із послідовності наперед
+    for patient, pk in zip(patients, _reserve_ids(Patient._meta.db_table, len(patients))):
+        patient.pk = pk
+    now = datetime.now().astimezone()
+    columns = ['id', 'created_at'] + [Patient._meta.get_field(field).column for field in IMPORT_FIELDS]
+    _copy_rows(Patient._meta.db_table, columns, (
+        [patient.pk, now] + [getattr(patient, field) for field in IMPORT_FIELDS]
+        for patient in patients
+    ))
+
+
+def _insert_fractions(schedules):
+    fields = ['patient_id', 'date', 'dose', 'delivered', 'confirmed_by_doctor', 'is_postponed', 'is_missed']
+    rows = (
+        (patient.pk, fraction_date, patient.dose_per_fraction, False, False, False, False)
+        for patient, schedule in schedules
+        for fraction_date in schedule
+    )
+    if connection.vendor == 'postgresql':
+        _copy_rows(FractionHistory._meta.db_table, fields, rows)
+        return
+    batch = []
+    for row in rows:
+        batch.append(FractionHistory(**dict(zip(fields, row))))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            FractionHistory.objects.bulk_create(batch)
+            batch = []
+    FractionHistory.objects.bulk_create(batch)
+
+
+def import_patients(rows, dry_run=False):
+    """
+    Імпортує рядки read_rows(). Коректні рядки вставляються в одній
+    транзакції, некоректні - лише в звіті помилок. dry_run - тільки
+    валідація.
+    """
+    result = ImportResult()
+    valid = validate_rows(rows, result)
+    if dry_run or not valid:
+        return result
+
+    patients = [Patient(**{field: cleaned.get(field) for field in IMPORT_FIELDS}) for _, cleaned in valid]
+    schedules = _schedules(patients)
+    for patient, schedule in schedules:
+        # Як generate_fractions_for_patient: виписка - дата останньої фракції,
+        # якщо у файлі її не вказано
+        if schedule and not patient.discharge_date:
+            patient.discharge_date = schedule[-1]
+
+    try:
+        with transaction.atomic():
+            _insert_patients(patients)
+            _insert_fractions(schedules)
+            patient_ids = [patient.pk for patient in patients]
+            for offset in range(0, len(patient_ids), IMPORT_BATCH_SIZE):
+                refresh_fraction_summaries(patient_ids[offset:offset + IMPORT_BATCH_SIZE])
+            # bulk_create і COPY не надсилають post_save - індекс автодоповнення
+            # цього воркера оновлюється явно, лише якщо імпорт зафіксовано
+            transaction.on_commit(lambda: patients_added(patients))
+    except IntegrityError:
+        # Номер карти зайняли паралельно після перевірки - імпорт відкочено повністю
+        result.add_error(0, 'ambulatory_card_id', DUPLICATE_CARD_ID_MESSAGE)
+        return result
+
+    result.created = len(patients)
+    result.fractions = sum(len(schedule) for _, schedule in schedules)
+    return result
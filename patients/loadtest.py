@@ -0,0 +1,227 @@
+"""
+Генератор HTTP-навантаження на запущений сервер (gunicorn, runserver).
+
+Кожен віртуальний користувач - окремий потік з власними cookie: входить
+через форму логіну як синтетичний лікар чи медсестра і в циклі виконує
+зважену суміш запитів своєї ролі з паузою "на роздуми". Id пацієнтів і
+фракцій береться з посилань на отриманих сторінках, як це робив би
+браузер. Працює лише на стандартній бібліотеці, щоб запускатися поруч
+із сервером без додаткових залежностей.
+"""
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from .benchmark import percentile
+
+# Верхні межі кошиків гістограми затримок, мс
+HISTOGRAM_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Суміш ранкового піку: (ендпоінт, вага)
+ROLE_MIX = {
+    'nurse': [
+        ('fraction_list', 5),
+        ('confirm_fractions_nurse', 3),
+        ('dashboard', 1),
+        ('patient_detail', 1),
+    ],
+    'doctor': [
+        ('dashboard', 4),
+        ('patient_detail', 4),
+        ('fraction_list', 2),
+    ],
+}
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+PATIENT_LINK = re.compile(r'href="/patients/(\d+)/"')
+FRACTION_LINK = re.compile(r'href="/fractions/(\d+)/edit/"')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """Редирект після POST - це успішна відповідь, а не ще один запит"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class LoadStats:
+    """Потокобезпечний збір результатів по ендпоінтах"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, status, elapsed_ms, error=False):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            self.statuses[endpoint][status] += 1
+            if error:
+                self.errors[endpoint] += 1
+
+    @staticmethod
+    def histogram(latencies):
+        """{'<=10': n, ..., '>10000': n} - кількість запитів у кожному кошику"""
+        counts = {f'<={bucket}': 0 for bucket in HISTOGRAM_BUCKETS}
+        counts[f'>{HISTOGRAM_BUCKETS[-1]}'] = 0
+        for value in latencies:
+            for bucket in HISTOGRAM_BUCKETS:
+                if value <= bucket:
+                    counts[f'<={bucket}'] += 1
+                    break
+            else:
+                counts[f'>{HISTOGRAM_BUCKETS[-1]}'] += 1
+        return counts
+
+    def report(self, duration):
+        endpoints = {}
+        with self._lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                total = len(latencies)
+                endpoints[endpoint] = {
+                    'requests': total,
+                    'throughput_rps': round(total / duration, 2) if duration else None,
+                    'error_rate': round(self.errors[endpoint] / total, 4),
+                    'statuses': dict(self.statuses[endpoint]),
+                    'p50_ms': round(percentile(latencies, 50), 1),
+                    'p95_ms': round(percentile(latencies, 95), 1),
+                    'p99_ms': round(percentile(latencies, 99), 1),
+                    'max_ms': round(max(latencies), 1),
+                    'histogram_ms': self.histogram(latencies),
+                }
+            total = sum(len(latencies) for latencies in self.latencies.values())
+            errors = sum(self.errors.values())
+        return {
+            'duration_s': round(duration, 2),
+            'requests': total,
+            'throughput_rps': round(total / duration, 2) if duration else None,
+            'error_rate': round(errors / total, 4) if total else None,
+            'endpoints': endpoints,
+        }
+
+
+class VirtualUser(threading.Thread):
+    """Один користувач з власною сесією, що виконує суміш запитів своєї ролі"""
+
+    def __init__(self, base_url, username, password, role, stats, stop_event,
+                 think_time=1.0, read_only=False, timeout=30, seed=None):
+        super().__init__(name=f'loadtest-{username}', daemon=True)
+        self.base_url = base_url.rstrip('/') + '/'
+        self.username = username
+        self.password = password
+        self.role = role
+        self.stats = stats
+        self.stop_event = stop_event
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _NoRedirect)
+        self.patient_ids = []
+        self.fraction_ids = []
+        mix = [(name, weight) for name, weight in ROLE_MIX[role]
+               if not (read_only and name.startswith('confirm_'))]
+        self.endpoints = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+
+    def _csrf_cookie(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, endpoint, path, data=None):
+        """Виконує запит і записує результат; повертає HTML або None"""
+        url = urljoin(self.base_url, path.lstrip('/'))
+        headers = {'User-Agent': 'cms-loadtest'}
+        body = None
+        if data is not None:
+            data = {'csrfmiddlewaretoken': self._csrf_cookie(), **data}
+            body = urlencode(data, doseq=True).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = url
+        start = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, body, headers), timeout=self.timeout) as response:
+                html = response.read().decode('utf-8', 'replace')
+                status = response.status
+        except HTTPError as exc:
+            status = exc.code
+            html = None
+        except (URLError, OSError):
+            status = 'connection_error'
+            html = None
+        elapsed = (time.perf_counter() - start) * 1000
+        error = not isinstance(status, int) or status >= 400
+        self.stats.record(endpoint, status, elapsed, error)
+        return html
+
+    def login(self):
+        html = self.request('login_page', 'login/')
+        token = CSRF_INPUT.search(html or '')
+        if token is None:
+            return False
+        self.request('login', 'login/', {
+            'username': self.username,
+            'password': self.password,
+            'csrfmiddlewaretoken': token.group(1),
+        })
+        return any(cookie.name == 'sessionid' for cookie in self.cookies)
+
+    def _discover(self, html):
+        if html:
+            self.patient_ids = PATIENT_LINK.findall(html) or self.patient_ids
+            self.fraction_ids = FRACTION_LINK.findall(html) or self.fraction_ids
+
+    def step(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        if endpoint == 'patient_detail' and self.patient_ids:
+            self.request(endpoint, f'patients/{self.rng.choice(self.patient_ids)}/')
+        elif endpoint == 'confirm_fractions_nurse' and self.fraction_ids:
+            sample = self.rng.sample(self.fraction_ids, min(10, len(self.fraction_ids)))
+            self.request(endpoint, 'fractions/confirm/nurse/', {'fraction_ids': sample})
+        elif endpoint == 'dashboard':
+            self._discover(self.request(endpoint, 'dashboard/'))
+        else:
+            # Сторінка фракцій - і сама по собі, і як джерело id для інших кроків
+            self._discover(self.request('fraction_list', 'fractions/'))
+
+    def run(self):
+        if not self.login():
+            return
+        while not self.stop_event.is_set():
+            self.step()
+            if self.think_time:
+                # Експоненційні паузи дають потік запитів, близький до пуассонівського
+                self.stop_event.wait(self.rng.expovariate(1 / self.think_time))
+
+
+def run_load(base_url, users, duration, ramp_up=0, think_time=1.0, read_only=False, timeout=30):
+    """
+    users - список (username, password, role). Запускає всіх користувачів
+    рівномірно протягом ramp_up секунд, чекає duration секунд від старту і
+    повертає звіт LoadStats.report.
+    """
+    stats = LoadStats()
+    stop_event = threading.Event()
+    threads = [
+        VirtualUser(base_url, username, password, role, stats, stop_event,
+                    think_time=think_time, read_only=read_only, timeout=timeout, seed=index)
+        for index, (username, password, role) in enumerate(users)
+    ]
+    start = time.perf_counter()
+    for index, thread in enumerate(threads):
+        thread.start()
+        if ramp_up and index < len(threads) - 1:
+            stop_event.wait(ramp_up / len(threads))
+    stop_event.wait(max(0, duration - (time.perf_counter() - start)))
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout)
+    report = stats.report(time.perf_counter() - start)
+    report['users'] = {role: sum(1 for *_, r in users if r == role) for role in ROLE_MIX}
+    return report
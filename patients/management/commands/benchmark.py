@@ -0,0 +1,120 @@
+import json
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+
+from patients.benchmark import route_requests, run_benchmark
+from patients.models import User, Patient, FractionHistory, MedicalIncapacity
+from patients.seed import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Наповнює базу синтетичними даними та міряє кожну сторінку '
+        '(p50/p95 затримки, кількість запитів, пікова пам\'ять). '
+        'Результат записується в JSON; дані відкочуються.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=20000, help='Кількість пацієнтів')
+        parser.add_argument('--fractions-per-patient', type=int, default=30, help='Фракцій на курс')
+        parser.add_argument('--incapacities', type=int, default=30000, help='Кількість МВТН')
+        parser.add_argument('--iterations', type=int, default=20, help='Вимірів на маршрут')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогрівних запитів на маршрут')
+        parser.add_argument('--view', action='append', dest='views', help='Міряти лише вказаний url_name (можна кілька)')
+        parser.add_argument('--output', help='Файл JSON (за замовчуванням benchmark-<дата>.json)')
+        parser.add_argument('--no-seed', action='store_true', help='Використати наявні дані без наповнення')
+        parser.add_argument('--keep', action='store_true', help='Не відкочувати згенеровані дані')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations має бути не менше 1')
+        output = Path(options['output'] or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+
+        with transaction.atomic():
+            if not options['no_seed']:
+                seed_dataset(
+                    patients=options['patients'],
+                    fractions_per_patient=options['fractions_per_patient'],
+                    incapacities=options['incapacities'],
+                    stdout=self.stdout,
+                )
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            report = {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'environment': self._environment(),
+                'dataset': {
+                    'patients': Patient.objects.count(),
+                    'fractions': FractionHistory.objects.count(),
+                    'incapacities': MedicalIncapacity.objects.count(),
+                },
+                'iterations': options['iterations'],
+                'views': self._run(options),
+            }
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        over_budget = [
+            name for name, result in report['views'].items()
+            if result['query_budget'] is not None and result['queries'] > result['query_budget']
+        ]
+        if over_budget:
+            self.stdout.write(self.style.WARNING('Перевищено бюджет запитів: ' + ', '.join(over_budget)))
+        self.stdout.write(self.style.SUCCESS(f'Результати записано в {output}'))
+
+    def _run(self, options):
+        patient = Patient.objects.filter(
+            fractions__isnull=False, medical_incapacities__isnull=False
+        ).order_by('-pk').first()
+        if patient is None:
+            raise CommandError('Немає пацієнта з фракціями та МВТН - запустіть без --no-seed')
+        user = User.objects.create_user(
+            username='benchmark', password=None, role='admin', approved=True, is_staff=True
+        )
+        pending_user = User.objects.create_user(
+            username='benchmark-pending', password=None, role='nurse', approved=False
+        )
+        client = Client()
+        client.force_login(user)
+
+        requests = route_requests(
+            patient,
+            patient.fractions.order_by('pk').first(),
+            patient.medical_incapacities.order_by('pk').first(),
+            pending_user,
+        )
+        return run_benchmark(
+            client, user, requests,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            only=options['views'],
+            stdout=self.stdout,
+        )
+
+    def _environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+        }
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from patients.services import close_fraction_day
+
+
+class Command(BaseCommand):
+    help = (
+        'Закриття дня: підтверджує фракції за день та позначає пропущеними '
+        'непроведені фракції за попередні дні. Безпечно запускати повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='День, що закривається (РРРР-ММ-ДД), за замовчуванням сьогодні',
+        )
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Невірна дата: {options['date']}")
+
+        changes = close_fraction_day(day)
+        confirmed = sum(len(c['confirmed']) for c in changes.values())
+        missed = sum(len(c['missed']) for c in changes.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Підтверджено фракцій: {confirmed}, позначено пропущеними: {missed}, "
+                f"пацієнтів: {len(changes)}"
+            )
+        )
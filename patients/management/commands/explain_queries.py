@@ -0,0 +1,126 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from patients.models import User, Patient
+from patients.seed import seed_dataset
+
+# Таблиці, для яких повне сканування на великих даних є проблемою
+LARGE_TABLES = ['patients', 'fraction_history', 'medical_incapacity', 'fraction_summary']
+
+PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Наповнює базу синтетичними даними, виконує основні сторінки та '
+        'показує EXPLAIN ANALYZE для кожного SQL-запиту. Дані відкочуються.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000, help='Кількість пацієнтів')
+        parser.add_argument('--fractions-per-patient', type=int, default=30, help='Фракцій на курс')
+        parser.add_argument('--incapacities', type=int, default=2500, help='Кількість МВТН')
+        parser.add_argument('--no-seed', action='store_true', help='Використати наявні дані без наповнення')
+        parser.add_argument('--keep', action='store_true', help='Не відкочувати згенеровані дані')
+        parser.add_argument('--verbose-plans', action='store_true', help='Друкувати повні плани запитів')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['no_seed']:
+                seed_dataset(
+                    patients=options['patients'],
+                    fractions_per_patient=options['fractions_per_patient'],
+                    incapacities=options['incapacities'],
+                    stdout=self.stdout,
+                )
+            if connection.vendor == 'postgresql':
+                # Свіжа статистика, інакше планувальник не бачить нових рядків
+                with connection.cursor() as cursor:
+                    for table in LARGE_TABLES:
+                        cursor.execute(f'ANALYZE {table}')
+
+            total_seq_scans = self._explain_views(options['verbose_plans'])
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if total_seq_scans:
+            self.stdout.write(self.style.WARNING(
+                f'Повних сканувань великих таблиць: {total_seq_scans}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Усі запити використовують індекси'))
+
+    def _view_urls(self):
+        patient = Patient.objects.filter(fractions__isnull=False).order_by('-pk').first()
+        urls = [
+            ('dashboard', reverse('dashboard')),
+            ('patient_list', reverse('patient_list')),
+            ('patient_list sort=medical_incapacity_end',
+             reverse('patient_list') + '?sort=medical_incapacity_end&order=desc'),
+        ]
+        for filter_type in ['ct-simulation', 'treatment-start', 'in-treatment', 'discharge-prep']:
+            urls.append((
+                f'patient_list_filtered {filter_type}',
+                reverse('patient_list_filtered', args=[filter_type]),
+            ))
+        urls += [
+            ('inpatient_list', reverse('inpatient_list')),
+            ('patient_archive', reverse('patient_archive')),
+            ('fraction_list', reverse('fraction_list')),
+            ('search_patients', reverse('search_patients') + '?q=Коваль'),
+        ]
+        if patient:
+            urls += [
+                ('patient_detail', reverse('patient_detail', args=[patient.pk])),
+                ('patient_fraction_list', reverse('patient_fraction_list', args=[patient.pk])),
+            ]
+        return urls
+
+    def _explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def _seq_scans(self, plan):
+        pattern = PG_SEQ_SCAN if connection.vendor == 'postgresql' else SQLITE_FULL_SCAN
+        return [table for table in pattern.findall(plan) if table in LARGE_TABLES]
+
+    def _explain_views(self, verbose):
+        user = User.objects.create_user(
+            username='explain-queries', password=None, role='doctor', approved=True
+        )
+        client = Client()
+        client.force_login(user)
+
+        total_seq_scans = 0
+        for name, url in self._view_urls():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url, secure=True)
+            queries = [
+                q['sql'] for q in captured.captured_queries
+                if q['sql'].lstrip().upper().startswith('SELECT')
+                and any(table in q['sql'] for table in LARGE_TABLES)
+            ]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: HTTP {response.status_code}, запитів {len(captured)}'
+            ))
+            for sql in queries:
+                plan = self._explain(sql)
+                seq_scans = self._seq_scans(plan)
+                total_seq_scans += len(seq_scans)
+                marker = self.style.WARNING('SEQ SCAN ' + ', '.join(seq_scans)) if seq_scans else 'index'
+                self.stdout.write(f'  [{marker}] {sql[:120]}')
+                if verbose or seq_scans:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'      {line}')
+        return total_seq_scans
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.exports import (
+    EXPORT_CHUNK_SIZE, EXPORT_FORMATS, FRACTION_COLUMNS, PATIENT_COLUMNS,
+    csv_chunks, fraction_export_queryset, fraction_export_rows, patient_export_rows, write_xlsx,
+)
+from patients.models import Patient
+
+FILTERS = ['ct-simulation', 'treatment-start', 'in-treatment', 'discharge-prep', 'archive']
+
+
+class Command(BaseCommand):
+    help = 'Експортує пацієнтів або історію фракцій у CSV/XLSX потоком (пам\'ять не залежить від обсягу)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['patients', 'fractions'], help='Що експортувати')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Формат файлу')
+        parser.add_argument('--filter', choices=FILTERS, help='Фільтр етапу, як у списку пацієнтів')
+        parser.add_argument('--all', action='store_true', help='Усі пацієнти, включно з виписаними')
+        parser.add_argument('--patient', type=int, help='Лише фракції вказаного пацієнта')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Рядків на пакет курсора')
+        parser.add_argument('--output', help='Файл (для CSV за замовчуванням - stdout)')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'xlsx' and not options['output']:
+            raise CommandError('Для XLSX потрібен --output')
+
+        patients = self._patients(options)
+        if options['kind'] == 'patients':
+            columns = PATIENT_COLUMNS
+            rows = patient_export_rows(
+                (patients if patients is not None else Patient.objects.all())
+                .with_latest_incapacity_end().order_by('last_name', 'pk'),
+                options['chunk_size'],
+            )
+        else:
+            columns = FRACTION_COLUMNS
+            rows = fraction_export_rows(fraction_export_queryset(patients), options['chunk_size'])
+
+        if options['format'] == 'xlsx':
+            write_xlsx(columns, rows, options['output'])
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(csv_chunks(columns, rows))
+        else:
+            for chunk in csv_chunks(columns, rows):
+                self.stdout.write(chunk, ending='')
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Експорт записано в {options['output']}"))
+
+    def _patients(self, options):
+        """None - без обмеження пацієнтів (для фракцій - усі фракції)"""
+        if options['patient']:
+            return Patient.objects.filter(pk=options['patient'])
+        if options['filter'] == 'archive':
+            return Patient.objects.archived()
+        if options['filter'] or not options['all'] and options['kind'] == 'patients':
+            # Без --all пацієнти експортуються як у списку: лише активні
+            return Patient.objects.list_filter(options['filter'])
+        return None
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.importer import import_patients, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Масовий імпорт пацієнтів з CSV/XLSX з генерацією фракцій. '
+        'Некоректні рядки пропускаються і потрапляють у звіт помилок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV або XLSX файл (заголовки як в експорті або імена полів)')
+        parser.add_argument('--dry-run', action='store_true', help='Лише перевірити файл')
+        parser.add_argument('--errors', help='Записати звіт помилок у CSV-файл')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не знайдено')
+
+        with path.open('rb') as file:
+            result = import_patients(read_rows(file, path.name), dry_run=options['dry_run'])
+
+        for line, field, message in result.errors[:50]:
+            self.stdout.write(self.style.WARNING(f'Рядок {line}, {field}: {message}'))
+        if len(result.errors) > 50:
+            self.stdout.write(self.style.WARNING(f'... і ще {len(result.errors) - 50} помилок'))
+        if options['errors'] and result.errors:
+            Path(options['errors']).write_text(result.error_csv(), encoding='utf-8-sig')
+
+        valid = result.rows - len(result.errors)
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'DRY RUN: рядків {result.rows}, коректних {valid}, з помилками {len(result.errors)}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Імпортовано пацієнтів: {result.created}, фракцій: {result.fractions}; '
+                f'рядків з помилками: {len(result.errors)}'
+            ))
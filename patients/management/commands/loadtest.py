@@ -0,0 +1,90 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.loadtest import run_load
+from patients.models import User
+
+SYNTHETIC_PREFIX = 'loadtest'
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерує навантаження на запущений сервер: синтетичні лікарі та медсестри '
+        'входять у систему і виконують суміш ранкового піку. Показує пропускну '
+        'здатність, частку помилок і гістограми затримок по ендпоінтах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адреса сервера')
+        parser.add_argument('--nurses', type=int, default=20, help='Кількість медсестер')
+        parser.add_argument('--doctors', type=int, default=5, help='Кількість лікарів')
+        parser.add_argument('--duration', type=float, default=60, help='Тривалість, секунд')
+        parser.add_argument('--ramp-up', type=float, default=10, help='Час поступового підключення користувачів, секунд')
+        parser.add_argument('--think-time', type=float, default=1.0, help='Середня пауза між запитами користувача, секунд')
+        parser.add_argument('--timeout', type=float, default=30, help='Таймаут одного запиту, секунд')
+        parser.add_argument('--password', default='loadtest-password', help='Пароль синтетичних користувачів')
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Створити/оновити синтетичних користувачів у базі з налаштувань цього проєкту',
+        )
+        parser.add_argument('--read-only', action='store_true', help='Не надсилати POST-підтвердження фракцій')
+        parser.add_argument('--output', help='Записати повний звіт у JSON-файл')
+
+    def handle(self, *args, **options):
+        if options['nurses'] + options['doctors'] < 1:
+            raise CommandError('Потрібен хоча б один користувач')
+        users = [
+            (f'{SYNTHETIC_PREFIX}-{role}-{index}', options['password'], role)
+            for role, count in (('nurse', options['nurses']), ('doctor', options['doctors']))
+            for index in range(count)
+        ]
+        if options['create_users']:
+            self._create_users(users)
+
+        self.stdout.write(
+            f"Навантаження на {options['url']}: {options['nurses']} медсестер, "
+            f"{options['doctors']} лікарів, {options['duration']:g} с"
+        )
+        report = run_load(
+            options['url'], users,
+            duration=options['duration'],
+            ramp_up=options['ramp_up'],
+            think_time=options['think_time'],
+            read_only=options['read_only'],
+            timeout=options['timeout'],
+        )
+        self._print(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"Звіт записано в {options['output']}"))
+
+    def _create_users(self, users):
+        for username, password, role in users:
+            user, _ = User.objects.get_or_create(
+                username=username, defaults={'role': role, 'approved': True},
+            )
+            user.role = role
+            user.approved = True
+            user.set_password(password)
+            user.save()
+
+    def _print(self, report):
+        if not report['requests']:
+            raise CommandError('Жодного запиту не виконано - перевірте --url та облікові дані')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Усього {report['requests']} запитів, {report['throughput_rps']} запит/с, "
+            f"помилок {report['error_rate']:.2%}"
+        ))
+        for endpoint, result in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<26} {result['requests']:>6}  {result['throughput_rps']:>7.2f} запит/с  "
+                f"помилок {result['error_rate']:>6.2%}  p50 {result['p50_ms']:>7.1f}  "
+                f"p95 {result['p95_ms']:>7.1f}  p99 {result['p99_ms']:>7.1f} ms"
+            )
+            peak = max(result['histogram_ms'].values())
+            for bucket, count in result['histogram_ms'].items():
+                if count:
+                    bar = '#' * max(1, round(40 * count / peak))
+                    self.stdout.write(f"    {bucket:>7} ms {count:>6} {bar}")
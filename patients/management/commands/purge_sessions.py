@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Рушії, що зберігають сесії в таблиці django_session
+DB_SESSION_ENGINES = [
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Видаляє прострочені сесії з django_session невеликими пакетами, '
+        'щоб не блокувати таблицю одним великим DELETE'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Сесій в одному DELETE')
+        parser.add_argument('--sleep', type=float, default=0, help='Пауза між пакетами, секунд')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE not in DB_SESSION_ENGINES:
+            self.stdout.write(f"Сесії зберігаються не в БД ({settings.SESSION_ENGINE}), очищення не потрібне")
+            return
+
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Видалено прострочених сесій: {deleted}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from patients.services import rebuild_all_fraction_summaries
+
+
+class Command(BaseCommand):
+    help = 'Перебудовує підсумки фракцій (fraction_summary) для всіх пацієнтів'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Кількість пацієнтів в одному пакеті',
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_all_fraction_summaries(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f"Перебудовано підсумки фракцій для {rebuilt} пацієнтів")
+        )
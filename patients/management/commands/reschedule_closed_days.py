@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.models import Patient
+from patients.services import reschedule_closed_days
+
+
+def parse_date(value):
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise CommandError(f'Некоректна дата: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносить фракції всіх пацієнтів із закритих днів (ремонт апарата, свято) '
+        'і перераховує дати виписки в одній транзакції'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dates', nargs='+', help='Закриті дні (рррр-мм-дд або дд.мм.рррр)')
+        parser.add_argument('--reason', default='', help='Причина перенесення для фракцій')
+        parser.add_argument('--add-holidays', action='store_true', help='Додати дні до святкових')
+        parser.add_argument('--dry-run', action='store_true', help='Показати зміни без збереження')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        result = reschedule_closed_days(
+            [parse_date(value) for value in options['dates']],
+            reason=options['reason'],
+            dry_run=dry_run,
+            add_holidays=options['add_holidays'],
+        )
+
+        changes = result['discharge_changes']
+        patients = Patient.objects.only(
+            'last_name', 'first_name', 'middle_name'
+        ).in_bulk([patient_id for patient_id, _, _ in changes])
+        for patient_id, old_discharge_date, new_date in changes:
+            self.stdout.write(
+                f"Пацієнт: {patients[patient_id].full_name} - "
+                f"Стара дата виписки: {old_discharge_date or 'Не встановлена'} - "
+                f"Нова дата: {new_date}"
+            )
+
+        summary = f"фракцій {result['fractions']} у {len(result['patients'])} пацієнтів"
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'DRY RUN: Було б перенесено {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Перенесено {summary}'))
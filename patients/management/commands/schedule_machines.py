@@ -0,0 +1,39 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.scheduling import active_machines, schedule_days
+
+
+class Command(BaseCommand):
+    help = (
+        'Розподіляє фракції за слотами апаратів на період (інкрементально: '
+        'чинні призначення лишаються на місці)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Перший день (рррр-мм-дд), за замовчуванням сьогодні')
+        parser.add_argument('--days', type=int, default=31, help='Кількість календарних днів')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else date.today()
+        except ValueError:
+            raise CommandError(f"Некоректна дата: {options['start']}")
+        machines = active_machines()
+        if not machines:
+            raise CommandError('Немає активних апаратів (TreatmentMachine)')
+
+        started = time.perf_counter()
+        result = schedule_days([start + timedelta(days=offset) for offset in range(options['days'])], machines)
+        elapsed = time.perf_counter() - started
+
+        if result['unscheduled']:
+            self.stdout.write(self.style.WARNING(
+                f"Не вистачило слотів для {len(result['unscheduled'])} фракцій"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Розплановано фракцій: {result['fractions']} на {len(machines)} апаратах, "
+            f"змінено призначень: {result['changed']} ({elapsed:.2f} с)"
+        ))
@@ -0,0 +1,62 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+SESSION_REFRESHED_KEY = '_refreshed_at'
+
+
+def stamp_session(session):
+    session[SESSION_REFRESHED_KEY] = int(time.time())
+
+
+def needs_refresh(refreshed_at):
+    """Чи лишилось до завершення сесії менше SESSION_REFRESH_THRESHOLD секунд"""
+    threshold = getattr(settings, 'SESSION_REFRESH_THRESHOLD', settings.SESSION_COOKIE_AGE // 2)
+    return refreshed_at is None or settings.SESSION_COOKIE_AGE - (time.time() - refreshed_at) < threshold
+
+
+class SessionRefreshMiddleware:
+    """
+    Продовжує сесію лише тоді, коли до її завершення лишилось менше
+    SESSION_REFRESH_THRESHOLD секунд.
+
+    Замість SESSION_SAVE_EVERY_REQUEST (запис у сховище сесій на кожен
+    запит) у сесії зберігається час останнього продовження. Сесія
+    позначається зміненою лише коли термін добігає кінця, тож звичайні
+    перегляди сторінок не пишуть у сховище сесій.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Під ASGI ланцюжок async: без переходів sync_to_async/async_to_sync
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+
+        # Змінена сесія і так буде збережена (повідомлення тощо) - фіксуємо час безкоштовно
+        if session.modified or needs_refresh(session.get(SESSION_REFRESHED_KEY)):
+            stamp_session(session)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+
+        # Async API сесії завантажує дані без блокування циклу подій
+        if session.modified or needs_refresh(await session.aget(SESSION_REFRESHED_KEY)):
+            await session.aset(SESSION_REFRESHED_KEY, int(time.time()))
+        return response
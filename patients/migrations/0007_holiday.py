@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_add_ambulatory_card_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Holiday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Дата', unique=True)),
+                ('name', models.CharField(blank=True, help_text='Назва свята або причина', max_length=255, null=True)),
+            ],
+            options={
+                'db_table': 'holidays',
+                'ordering': ['date'],
+            },
+        ),
+    ]
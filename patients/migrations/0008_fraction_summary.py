@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_fraction_summaries(apps, schema_editor):
+    FractionHistory = apps.get_model('patients', 'FractionHistory')
+    FractionSummary = apps.get_model('patients', 'FractionSummary')
+    rows = FractionHistory.objects.values('patient_id').annotate(
+        summary_total=Count('pk'),
+        summary_delivered=Count('pk', filter=Q(delivered=True)),
+        summary_confirmed=Count('pk', filter=Q(confirmed_by_doctor=True)),
+        summary_missed=Count('pk', filter=Q(is_missed=True)),
+        summary_postponed=Count('pk', filter=Q(is_postponed=True)),
+        summary_planned=Count('pk', filter=~Q(delivered=True) & Q(is_missed=False)),
+        summary_last_fraction_date=Max('date'),
+    ).order_by()
+    fields = ['total', 'delivered', 'confirmed', 'missed', 'postponed', 'planned', 'last_fraction_date']
+    FractionSummary.objects.bulk_create(
+        [
+            FractionSummary(
+                patient_id=row['patient_id'],
+                **{field: row[f'summary_{field}'] for field in fields}
+            )
+            for row in rows
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_holiday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FractionSummary',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fraction_summary', serialize=False, to='patients.patient')),
+                ('total', models.IntegerField(default=0, help_text='Всього фракцій')),
+                ('delivered', models.IntegerField(default=0, help_text='Проведено')),
+                ('confirmed', models.IntegerField(default=0, help_text='Підтверджено лікарем')),
+                ('missed', models.IntegerField(default=0, help_text='Пропущено')),
+                ('postponed', models.IntegerField(default=0, help_text='Відкладено')),
+                ('planned', models.IntegerField(default=0, help_text='Заплановано (не проведені та не пропущені)')),
+                ('last_fraction_date', models.DateField(blank=True, help_text='Дата останньої фракції', null=True)),
+            ],
+            options={
+                'db_table': 'fraction_summary',
+            },
+        ),
+        migrations.RunPython(populate_fraction_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:14
+
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(migrations.AddIndex):
+    """
+    На PostgreSQL створює індекс через CREATE INDEX CONCURRENTLY, щоб не
+    блокувати запис у таблицю на робочій базі. На інших БД (SQLite у тестах)
+    працює як звичайний AddIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не можна виконувати всередині транзакції
+    atomic = False
+
+    dependencies = [
+        ('patients', '0008_fraction_summary'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='fractionhistory',
+            index=models.Index(fields=['patient', 'date'], name='fraction_patient_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='fractionhistory',
+            index=models.Index(fields=['date'], name='fraction_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='fractionhistory',
+            index=models.Index(condition=models.Q(('is_missed', False)), fields=['date'], name='fraction_open_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='medicalincapacity',
+            index=models.Index(fields=['patient', '-end_date'], name='incapacity_patient_end_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='patient',
+            index=models.Index(fields=['ct_simulation_date'], name='patients_ct_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='patient',
+            index=models.Index(fields=['treatment_start_date'], name='patients_start_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='patient',
+            index=models.Index(fields=['discharge_date'], name='patients_discharge_date_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'id'], name='patients_last_name_id_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('discharge_date__isnull', True), ('inpatient_status', 'стаціонарно')), fields=['last_name', 'first_name'], name='patients_inpatient_idx'),
+        ),
+    ]
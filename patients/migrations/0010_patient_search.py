@@ -0,0 +1,99 @@
+from django.db import migrations
+
+# Текст для триграмного пошуку; вираз має збігатися з patients.search.PG_SEARCH_TEXT
+PG_SEARCH_TEXT = (
+    "(coalesce(last_name, '') || ' ' || coalesce(first_name, '') || ' ' || "
+    "coalesce(middle_name, '') || ' ' || coalesce(ambulatory_card_id, ''))"
+)
+
+POSTGRES_FORWARDS = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    ALTER TABLE patients ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(last_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(ambulatory_card_id, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(first_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(middle_name, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(diagnosis, '')), 'D')
+    ) STORED
+    """,
+    'CREATE INDEX patients_search_vector_idx ON patients USING GIN (search_vector)',
+    f'CREATE INDEX patients_search_trgm_idx ON patients USING GIN (lower({PG_SEARCH_TEXT}) gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARDS = [
+    'DROP INDEX IF EXISTS patients_search_trgm_idx',
+    'DROP INDEX IF EXISTS patients_search_vector_idx',
+    'ALTER TABLE patients DROP COLUMN IF EXISTS search_vector',
+]
+
+# FTS5 з зовнішнім вмістом: індекс зберігає лише токени, рядки беруться з patients.
+# unicode61 коректно переводить кирилицю в нижній регістр, на відміну від LIKE.
+SQLITE_COLUMNS = 'last_name, first_name, middle_name, diagnosis, ambulatory_card_id'
+SQLITE_NEW_VALUES = 'new.last_name, new.first_name, new.middle_name, new.diagnosis, new.ambulatory_card_id'
+SQLITE_OLD_VALUES = 'old.last_name, old.first_name, old.middle_name, old.diagnosis, old.ambulatory_card_id'
+
+SQLITE_FORWARDS = [
+    f"""
+    CREATE VIRTUAL TABLE patient_search USING fts5(
+        {SQLITE_COLUMNS},
+        content='patients', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER patient_search_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patient_search(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {SQLITE_NEW_VALUES});
+    END
+    """,
+    f"""
+    CREATE TRIGGER patient_search_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patient_search(patient_search, rowid, {SQLITE_COLUMNS})
+        VALUES ('delete', old.id, {SQLITE_OLD_VALUES});
+    END
+    """,
+    f"""
+    CREATE TRIGGER patient_search_update AFTER UPDATE ON patients BEGIN
+        INSERT INTO patient_search(patient_search, rowid, {SQLITE_COLUMNS})
+        VALUES ('delete', old.id, {SQLITE_OLD_VALUES});
+        INSERT INTO patient_search(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {SQLITE_NEW_VALUES});
+    END
+    """,
+    "INSERT INTO patient_search(patient_search) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    'DROP TRIGGER IF EXISTS patient_search_insert',
+    'DROP TRIGGER IF EXISTS patient_search_delete',
+    'DROP TRIGGER IF EXISTS patient_search_update',
+    'DROP TABLE IF EXISTS patient_search',
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            statements = postgres_statements
+        elif vendor == 'sqlite':
+            statements = sqlite_statements
+        else:
+            # Інші БД використовують запасний пошук через icontains
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_date_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:07
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_patient_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreatmentMachine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Назва апарата або кабінету', max_length=100, unique=True)),
+                ('day_start', models.TimeField(default=datetime.time(8, 0), help_text='Початок роботи')),
+                ('day_end', models.TimeField(default=datetime.time(16, 0), help_text='Кінець роботи')),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=15, help_text='Тривалість слоту, хв')),
+                ('is_active', models.BooleanField(default=True, help_text='Апарат у роботі')),
+            ],
+            options={
+                'db_table': 'treatment_machines',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='fractionhistory',
+            name='slot',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Номер слоту в робочому дні апарата', null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='preferred_time',
+            field=models.TimeField(blank=True, help_text='Бажаний час процедури', null=True),
+        ),
+        migrations.AddField(
+            model_name='fractionhistory',
+            name='machine',
+            field=models.ForeignKey(blank=True, help_text='Апарат', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fractions', to='patients.treatmentmachine'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='treatment_machine',
+            field=models.ForeignKey(blank=True, help_text='Апарат, на якому заплановано опромінення (порожньо - будь-який)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='patients', to='patients.treatmentmachine'),
+        ),
+        migrations.AddConstraint(
+            model_name='fractionhistory',
+            constraint=models.UniqueConstraint(condition=models.Q(('slot__isnull', False)), fields=('machine', 'date', 'slot'), name='fraction_machine_slot_unique'),
+        ),
+    ]
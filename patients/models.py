@@ -1,9 +1,12 @@
+import re
+
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from datetime import date, timedelta
-from django.db.models.signals import post_save
+from datetime import date, datetime, time, timedelta
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 
 class UserManager(BaseUserManager):
@@ -65,6 +68,67 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         db_table = 'users'
 
+# Формат може бути: 228435/2025, 2025-9246582, або інші комбінації цифр, / та -
+CARD_ID_PATTERN = re.compile(r'^[0-9/\\-]+$')
+
+
+def card_id_error(card_id):
+    """Повідомлення про помилку формату ID амбулаторної картки або None"""
+    if not CARD_ID_PATTERN.match(card_id):
+        return 'ID амбулаторної картки може містити тільки цифри, слеш (/) та дефіс (-)'
+    if not re.search(r'\d', card_id):
+        return 'ID амбулаторної картки повинен містити хоча б одну цифру'
+    return None
+
+class PatientQuerySet(models.QuerySet):
+    def list_filter(self, filter_type=None, today=None):
+        """
+        Пацієнти списку patient_list з фільтром етапу (ct-simulation,
+        treatment-start, in-treatment, discharge-prep). Без фільтра - усі
+        активні: дати виписки немає або вона ще не настала.
+        """
+        today = today or date.today()
+        base_query = self.filter(
+            models.Q(discharge_date__isnull=True) | models.Q(discharge_date__gte=today)
+        )
+        if filter_type == 'ct-simulation':
+            return base_query.filter(
+                ct_simulation_date__isnull=False,
+                treatment_start_date__isnull=True
+            )
+        if filter_type == 'treatment-start':
+            return base_query.filter(
+                treatment_start_date__isnull=False,
+                treatment_start_date__gt=today
+            )
+        if filter_type == 'in-treatment':
+            return base_query.filter(
+                treatment_start_date__isnull=False,
+                treatment_start_date__lte=today,
+                discharge_date__isnull=True
+            )
+        if filter_type == 'discharge-prep':
+            return base_query.filter(
+                discharge_date__isnull=False,
+                discharge_date__gt=today,
+                discharge_date__lte=today + timedelta(days=3)
+            )
+        return base_query
+
+    def archived(self, today=None):
+        """Виписані пацієнти (дата виписки в минулому) - список patient_archive"""
+        return self.filter(discharge_date__isnull=False, discharge_date__lt=today or date.today())
+
+    def with_latest_incapacity_end(self):
+        """Анотує дату закінчення останнього МВТН одним підзапитом замість запиту на кожного пацієнта"""
+        return self.annotate(
+            latest_incapacity_end=models.Subquery(
+                MedicalIncapacity.objects.filter(
+                    patient=models.OuterRef('pk')
+                ).order_by('-end_date').values('end_date')[:1]
+            )
+        )
+
 class Patient(models.Model):
     # Особиста інформація
     ambulatory_card_id = models.CharField(
@@ -112,9 +176,18 @@ class Patient(models.Model):
     prior_radiation = models.CharField(max_length=255, blank=True, null=True, help_text="Попереднє опромінення")
     notes = models.TextField(blank=True, null=True, help_text="Примітки")
     
+    # Планування процедур на апаратах
+    treatment_machine = models.ForeignKey(
+        'TreatmentMachine', models.SET_NULL, blank=True, null=True, related_name='patients',
+        help_text="Апарат, на якому заплановано опромінення (порожньо - будь-який)"
+    )
+    preferred_time = models.TimeField(blank=True, null=True, help_text="Бажаний час процедури")
+    
     # Системні
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
 
+    objects = PatientQuerySet.as_manager()
+
     @property
     def full_name(self):
         return f"{self.last_name} {self.first_name} {self.middle_name}".strip()
@@ -169,10 +242,18 @@ class Patient(models.Model):
 
         return "Новий"
 
+    @property
+    def fraction_stats(self):
+        """Підсумки фракцій пацієнта (нульові, якщо фракцій ще немає)."""
+        try:
+            return self.fraction_summary
+        except FractionSummary.DoesNotExist:
+            return FractionSummary(patient_id=self.pk)
+
     @property
     def current_fraction(self):
-        """Динамічно розраховує кількість проведених фракцій."""
-        return self.fractions.filter(delivered=True).count()
+        """Кількість проведених фракцій (з підсумків, без COUNT по fraction_history)."""
+        return self.fraction_stats.delivered
 
     @property
     def missed_days(self):
@@ -183,16 +264,12 @@ class Patient(models.Model):
         today = date.today()
         end_date = self.discharge_date if self.discharge_date and self.discharge_date < today else today
         
-        # Розраховуємо загальну кількість робочих днів з початку лікування
-        total_weekdays = 0
-        current_date = self.treatment_start_date
-        while current_date <= end_date:
-            if current_date.weekday() < 5: # 0-4 corresponds to Mon-Fri
-                total_weekdays += 1
-            current_date += timedelta(days=1)
+        # Розраховуємо загальну кількість робочих днів з початку лікування (з урахуванням свят)
+        from .workdays import count_workdays
+        total_weekdays = count_workdays(self.treatment_start_date, end_date)
             
         # Кількість пропущених днів = очікувані фракції - фактичні фракції
-        delivered_fractions = self.fractions.filter(delivered=True).count()
+        delivered_fractions = self.fraction_stats.delivered
         missed = total_weekdays - delivered_fractions
         return max(0, missed)
 
@@ -283,30 +360,15 @@ class Patient(models.Model):
 
     def clean(self):
         """Валідація даних пацієнта"""
-        import re
-        
-        # Валідація ambulatory_card_id
-        if self.ambulatory_card_id:
-            # Перевірка формату: дозволені тільки цифри, / та -
-            # Формат може бути: 228435/2025, 2025-9246582, або інші комбінації
-            pattern = r'^[0-9/\\-]+$'
-            if not re.match(pattern, self.ambulatory_card_id):
-                raise ValidationError({
-                    'ambulatory_card_id': 'ID амбулаторної картки може містити тільки цифри, слеш (/) та дефіс (-)'
-                })
-            
-            # Перевірка, що є хоча б одна цифра
-            if not re.search(r'\d', self.ambulatory_card_id):
-                raise ValidationError({
-                    'ambulatory_card_id': 'ID амбулаторної картки повинен містити хоча б одну цифру'
-                })
+        # Валідація ambulatory_card_id (лише якщо номер змінився)
+        changed = self.get_changed_fields()
+        if self.ambulatory_card_id and (changed is None or 'ambulatory_card_id' in changed):
+            error = card_id_error(self.ambulatory_card_id)
+            if error:
+                raise ValidationError({'ambulatory_card_id': error})
             
-            # Перевірка унікальності (якщо не є поточним записом)
-            existing = Patient.objects.filter(ambulatory_card_id=self.ambulatory_card_id).exclude(pk=self.pk)
-            if existing.exists():
-                raise ValidationError({
-                    'ambulatory_card_id': 'Пацієнт з таким ID амбулаторної картки вже існує'
-                })
+            # Унікальність гарантує обмеження БД (див. PatientForm.save), а
+            # явний full_clean() перевіряє її через validate_unique
         
         # Перевірка дат
         if self.treatment_start_date and self.discharge_date:
@@ -315,16 +377,84 @@ class Patient(models.Model):
                     'discharge_date': 'Дата виписки не може бути раніше дати початку лікування'
                 })
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Знімок завантажених значень для відстеження змінених полів
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._take_snapshot()
+
+    def _take_snapshot(self):
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def get_changed_fields(self):
+        """
+        Імена полів, змінених після завантаження з БД.
+        Для нового (ще не збереженого або не завантаженого) пацієнта - None.
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded_values is None:
+            return None
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if field.attname in loaded_values:
+                if getattr(self, field.attname) != loaded_values[field.attname]:
+                    changed.append(field.name)
+            elif field.attname in self.__dict__:
+                # Відкладене (only/defer) поле, якому присвоїли значення
+                changed.append(field.name)
+        return changed
+
     def save(self, *args, **kwargs):
-        """Перевизначений save для виклику clean"""
-        self.full_clean()
+        """
+        Валідує та зберігає лише змінені поля.
+
+        Для вже збереженого пацієнта виконується UPDATE тільки змінених
+        колонок (update_fields), а full_clean перевіряє тільки їх.
+        Унікальність номера карти перевіряє БД, без попереднього запиту.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not kwargs.get('force_insert'):
+            update_fields = self.get_changed_fields()
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields
+        if update_fields is None:
+            self.full_clean(validate_unique=False)
+        else:
+            exclude = [f.name for f in self._meta.concrete_fields if f.name not in update_fields]
+            self.full_clean(exclude=exclude, validate_unique=False)
         super().save(*args, **kwargs)
+        self._take_snapshot()
 
     def __str__(self):
         return self.full_name
 
     class Meta:
         db_table = 'patients'
+        indexes = [
+            # Фільтри дашборду та списків за етапами лікування
+            models.Index(fields=['ct_simulation_date'], name='patients_ct_date_idx'),
+            models.Index(fields=['treatment_start_date'], name='patients_start_date_idx'),
+            models.Index(fields=['discharge_date'], name='patients_discharge_date_idx'),
+            # Сортування та keyset-пагінація за прізвищем
+            models.Index(fields=['last_name', 'id'], name='patients_last_name_id_idx'),
+            # Список стаціонару: тільки невиписані стаціонарні пацієнти
+            models.Index(
+                fields=['last_name', 'first_name'],
+                name='patients_inpatient_idx',
+                condition=models.Q(inpatient_status='стаціонарно', discharge_date__isnull=True)
+            ),
+        ]
 
 class FractionHistory(models.Model):
     patient = models.ForeignKey('Patient', models.DO_NOTHING, related_name='fractions')
@@ -339,9 +469,87 @@ class FractionHistory(models.Model):
     original_date = models.DateField(blank=True, null=True, help_text="Оригінальна дата фракції")
     reason = models.CharField(max_length=255, blank=True, null=True, help_text="Причина зміни дати")
     is_missed = models.BooleanField(default=False, help_text="Чи пропущена фракція")
+    
+    # Слот на апараті (patients/scheduling.py); порожньо - ще не розплановано
+    machine = models.ForeignKey(
+        'TreatmentMachine', models.SET_NULL, blank=True, null=True, related_name='fractions',
+        help_text="Апарат"
+    )
+    slot = models.PositiveSmallIntegerField(blank=True, null=True, help_text="Номер слоту в робочому дні апарата")
 
     class Meta:
         db_table = 'fraction_history'
+        constraints = [
+            # Один слот апарата в день - одна фракція
+            models.UniqueConstraint(
+                fields=['machine', 'date', 'slot'], name='fraction_machine_slot_unique',
+                condition=models.Q(slot__isnull=False)
+            ),
+        ]
+        indexes = [
+            # Фракції пацієнта за датою (картка пацієнта, остання фракція, перерахунок виписки)
+            models.Index(fields=['patient', 'date'], name='fraction_patient_date_idx'),
+            # Фракції за день (підтвердження сьогоднішніх фракцій)
+            models.Index(fields=['date'], name='fraction_date_idx'),
+            # Непропущені фракції за датою (пошук прострочених непроведених фракцій)
+            models.Index(fields=['date'], name='fraction_open_date_idx', condition=models.Q(is_missed=False)),
+        ]
+
+class FractionSummary(models.Model):
+    """
+    Підсумки фракцій пацієнта. Оновлюються при кожній зміні фракцій
+    (services.refresh_fraction_summaries), тому відображення прогресу
+    читає готові колонки замість COUNT по fraction_history.
+    """
+    patient = models.OneToOneField('Patient', models.CASCADE, primary_key=True, related_name='fraction_summary')
+    total = models.IntegerField(default=0, help_text="Всього фракцій")
+    delivered = models.IntegerField(default=0, help_text="Проведено")
+    confirmed = models.IntegerField(default=0, help_text="Підтверджено лікарем")
+    missed = models.IntegerField(default=0, help_text="Пропущено")
+    postponed = models.IntegerField(default=0, help_text="Відкладено")
+    planned = models.IntegerField(default=0, help_text="Заплановано (не проведені та не пропущені)")
+    last_fraction_date = models.DateField(blank=True, null=True, help_text="Дата останньої фракції")
+
+    class Meta:
+        db_table = 'fraction_summary'
+
+class TreatmentMachine(models.Model):
+    """Лінійний прискорювач (кабінет) з робочими годинами та тривалістю слоту"""
+    name = models.CharField(max_length=100, unique=True, help_text="Назва апарата або кабінету")
+    day_start = models.TimeField(default=time(8, 0), help_text="Початок роботи")
+    day_end = models.TimeField(default=time(16, 0), help_text="Кінець роботи")
+    slot_minutes = models.PositiveSmallIntegerField(default=15, help_text="Тривалість слоту, хв")
+    is_active = models.BooleanField(default=True, help_text="Апарат у роботі")
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def slots_per_day(self):
+        """Денна пропускна здатність апарата, слотів"""
+        minutes = (self.day_end.hour * 60 + self.day_end.minute) - (self.day_start.hour * 60 + self.day_start.minute)
+        return max(minutes // self.slot_minutes, 0) if self.slot_minutes else 0
+
+    def slot_time(self, slot):
+        """Час початку слоту"""
+        start = datetime.combine(date.min, self.day_start)
+        return (start + timedelta(minutes=slot * self.slot_minutes)).time()
+
+    class Meta:
+        db_table = 'treatment_machines'
+        ordering = ['name']
+
+class Holiday(models.Model):
+    """Святкові та неробочі дні відділення, які не враховуються в розкладі фракцій"""
+    date = models.DateField(unique=True, help_text="Дата")
+    name = models.CharField(max_length=255, blank=True, null=True, help_text="Назва свята або причина")
+
+    def __str__(self):
+        return f"{self.date.strftime('%d.%m.%Y')} {self.name or ''}".strip()
+
+    class Meta:
+        db_table = 'holidays'
+        ordering = ['date']
 
 class MedicalIncapacity(models.Model):
     patient = models.ForeignKey('Patient', models.DO_NOTHING, related_name='medical_incapacities')
@@ -355,10 +563,20 @@ class MedicalIncapacity(models.Model):
 
     class Meta:
         db_table = 'medical_incapacity'
+        indexes = [
+            # Останнє МВТН пацієнта (підзапит у списку пацієнтів)
+            models.Index(fields=['patient', '-end_date'], name='incapacity_patient_end_idx'),
+        ]
+
+# Поля, зміна яких може вимагати генерації фракцій
+TREATMENT_FIELDS = {'treatment_start_date', 'total_fractions', 'dose_per_fraction'}
 
 @receiver(post_save, sender=Patient)
-def auto_generate_fractions(sender, instance, created, **kwargs):
+def auto_generate_fractions(sender, instance, created, update_fields=None, **kwargs):
     """Автоматично генерує фракції при збереженні пацієнта з датою початку лікування"""
+    # Збереження без зміни параметрів лікування не потребує перевірки фракцій
+    if not created and update_fields is not None and not TREATMENT_FIELDS & set(update_fields):
+        return
     # Перевіряємо, чи всі необхідні поля заповнені
     if (instance.treatment_start_date and 
         instance.total_fractions and 
@@ -367,3 +585,41 @@ def auto_generate_fractions(sender, instance, created, **kwargs):
         
         from .services import generate_fractions_for_patient
         generate_fractions_for_patient(instance)
+
+@receiver(post_save, sender=FractionHistory)
+def update_fraction_summary(sender, instance, **kwargs):
+    """Оновлює підсумки фракцій пацієнта після зміни однієї фракції"""
+    from .services import refresh_fraction_summaries
+    refresh_fraction_summaries([instance.patient_id])
+
+@receiver(post_save, sender=Patient)
+def update_autocomplete_index(sender, instance, update_fields=None, **kwargs):
+    """Оновлює префіксний індекс автодоповнення поточного воркера"""
+    from .autocomplete import patient_saved
+    patient_saved(instance, update_fields)
+
+@receiver(post_delete, sender=Patient)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    from .autocomplete import patient_deleted
+    patient_deleted(instance.pk)
+
+@receiver(user_logged_in)
+def stamp_session_refresh(sender, request, user, **kwargs):
+    """Позначає час продовження нової сесії, щоб перший запит після входу не писав у сесію"""
+    from .middleware import stamp_session
+    stamp_session(request.session)
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def bump_patient_cache_version(sender, instance, **kwargs):
+    """Інвалідовує кешовані фрагменти сторінок пацієнта"""
+    from .cache_versions import bump_patient_versions
+    bump_patient_versions([instance.pk])
+
+@receiver(post_save, sender=MedicalIncapacity)
+@receiver(post_delete, sender=MedicalIncapacity)
+@receiver(post_delete, sender=FractionHistory)
+def bump_related_cache_version(sender, instance, **kwargs):
+    # Збереження фракції інвалідовує кеш через refresh_fraction_summaries
+    from .cache_versions import bump_patient_versions
+    bump_patient_versions([instance.patient_id])
@@ -0,0 +1,154 @@
+import base64
+import json
+from datetime import date
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+
+
+def encode_cursor(value, pk):
+    """Кодує позицію (значення поля сортування, pk) у рядок для URL"""
+    if isinstance(value, date):
+        payload = ['d', value.isoformat(), pk]
+    else:
+        payload = ['v', value, pk]
+    raw = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field=None):
+    """
+    Декодує курсор; повертає (value, pk) або None для невалідного курсора.
+
+    Якщо передано поле сортування, значення приводиться до його типу
+    (field.to_python), тож підроблений курсор не доходить до фільтра запиту.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if kind == 'd' and value is not None:
+            value = date.fromisoformat(value)
+        if field is not None and value is not None:
+            value = field.to_python(value)
+        return value, int(pk)
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class KeysetPage:
+    """Одна сторінка keyset-пагінації"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __contains__(self, item):
+        return item in self.object_list
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Курсорна (keyset) пагінація за одним полем сортування та pk.
+
+    Замість OFFSET кожна сторінка вибирається умовою "після (значення, pk)",
+    тому вартість запиту не залежить від номера сторінки. NULL-значення
+    завжди йдуть в кінці списку, незалежно від напрямку сортування.
+    """
+
+    def __init__(self, queryset, field, descending=False, per_page=50):
+        self.queryset = queryset
+        self.field = field
+        self.descending = descending
+        self.per_page = per_page
+
+    def _ordering(self, reverse=False):
+        # При зворотному обході NULL-и мають іти першими, щоб після
+        # розвороту результату вони знову опинились у кінці
+        descending = self.descending != reverse
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        expression = F(self.field)
+        field_order = expression.desc(**nulls) if descending else expression.asc(**nulls)
+        return [field_order, '-pk' if descending else 'pk']
+
+    def _after(self, value, pk):
+        op = 'lt' if self.descending else 'gt'
+        if value is None:
+            return Q(**{f'{self.field}__isnull': True, f'pk__{op}': pk})
+        return (
+            Q(**{f'{self.field}__{op}': value})
+            | Q(**{self.field: value, f'pk__{op}': pk})
+            | Q(**{f'{self.field}__isnull': True})
+        )
+
+    def _before(self, value, pk):
+        op = 'gt' if self.descending else 'lt'
+        if value is None:
+            return (
+                Q(**{f'{self.field}__isnull': True, f'pk__{op}': pk})
+                | Q(**{f'{self.field}__isnull': False})
+            )
+        return (
+            Q(**{f'{self.field}__{op}': value})
+            | Q(**{self.field: value, f'pk__{op}': pk})
+        )
+
+    def _sort_field(self):
+        """Поле моделі або output_field анотації, за яким сортується сторінка"""
+        annotation = self.queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return self.queryset.model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            return None
+
+    def _cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    def get_page(self, after=None, before=None):
+        """Повертає сторінку після курсора `after` або перед курсором `before`"""
+        field = self._sort_field()
+        after_position = decode_cursor(after, field)
+        before_position = decode_cursor(before, field) if not after_position else None
+
+        if before_position:
+            rows = list(
+                self.queryset.filter(self._before(*before_position))
+                .order_by(*self._ordering(reverse=True))[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            items = rows[:self.per_page][::-1]
+            return KeysetPage(
+                items,
+                next_cursor=self._cursor_for(items[-1]) if items else None,
+                previous_cursor=self._cursor_for(items[0]) if items and has_previous else None,
+            )
+
+        queryset = self.queryset
+        if after_position:
+            queryset = queryset.filter(self._after(*after_position))
+        rows = list(queryset.order_by(*self._ordering())[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        items = rows[:self.per_page]
+        return KeysetPage(
+            items,
+            next_cursor=self._cursor_for(items[-1]) if items and has_next else None,
+            previous_cursor=self._cursor_for(items[0]) if items and after_position else None,
+        )
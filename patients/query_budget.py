@@ -0,0 +1,156 @@
+"""
+Облік SQL-запитів на запит: кількість, сумарний час та повтори.
+
+QueryRecorder працює через connection.execute_wrapper, тому не потребує
+DEBUG=True. Кожне з'єднання має один постійний wrapper, що передає запити
+рекордерам з ContextVar: контекст успадковують потоки sync_to_async (async
+ORM, пул gather_queries), тож запити з них теж потрапляють у лік, хоч
+з'єднання БД у кожного потоку своє. QueryBudgetMiddleware пише попередження
+в лог, якщо view перевищує бюджет з settings.QUERY_BUDGETS ({url_name: макс.
+запитів}), а QueryBudgetTestMixin дає тестам assertQueryBudget.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('patients.query_budget')
+
+# Рекордери, активні в поточному контексті
+_active_recorders = ContextVar('query_recorders', default=())
+
+
+def _record_queries(execute, sql, params, many, context):
+    alias = context['connection'].alias
+    recorders = [recorder for recorder in _active_recorders.get() if recorder.using == alias]
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.queries.append((sql, duration))
+
+
+def install_query_recording(connection, **kwargs):
+    """
+    Додає з'єднанню wrapper обліку запитів (обробник сигналу connection_created).
+    Вставляється першим: execute_wrapper() знімає свої wrapper-и з кінця списку.
+    """
+    if _record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_queries)
+
+
+class QueryRecorder:
+    """Записує всі SQL-запити, виконані в межах блоку with (і в потоках, що успадкували контекст)"""
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.queries = []
+        self._token = None
+
+    def __enter__(self):
+        # З'єднання поточного потоку могло відкритись до підключення сигналу
+        install_query_recording(connections[self.using])
+        self._token = _active_recorders.set(_active_recorders.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_recorders.reset(self._token)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        Шаблони SQL (без параметрів), виконані більше одного разу, з кількістю.
+        Повтор одного шаблону з різними параметрами - типова ознака N+1.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'time_ms': round(self.total_time * 1000, 2),
+            'duplicates': sum(count - 1 for count in self.duplicates.values()),
+        }
+
+
+def get_query_budget(url_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+
+
+class QueryBudgetMiddleware:
+    """Рахує запити кожного HTTP-запиту та попереджає про перевищення бюджету"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Під ASGI ланцюжок async: без переходів sync_to_async/async_to_sync
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.check_budget(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Рекордер у ContextVar, тож бачить і запити async ORM з потоків sync_to_async
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.check_budget(request, response, recorder)
+
+    def check_budget(self, request, response, recorder):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_query_budget(url_name)
+        if budget is not None and recorder.count > budget:
+            duplicates = recorder.duplicates
+            logger.warning(
+                'Query budget exceeded for %s (%s): %d queries > %d, %.1f ms SQL, %d duplicated',
+                url_name, request.path, recorder.count, budget,
+                recorder.total_time * 1000, sum(duplicates.values()),
+                extra={'duplicated_sql': list(duplicates)},
+            )
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.total_time * 1000:.1f}'
+        return response
+
+
+class QueryBudgetTestMixin:
+    """Тестовий помічник для фіксації максимальної кількості запитів"""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, using='default'):
+        with QueryRecorder(using) as recorder:
+            yield recorder
+        if recorder.count > max_queries:
+            duplicated = '\n'.join(
+                f'  {count}x {sql[:200]}' for sql, count in recorder.duplicates.items()
+            )
+            self.fail(
+                f'{recorder.count} queries > budget {max_queries} '
+                f'({recorder.total_time * 1000:.1f} ms)\nDuplicated:\n{duplicated or "  -"}'
+            )
@@ -0,0 +1,223 @@
+"""
+Розподіл фракцій дня за слотами апаратів (лінійних прискорювачів).
+
+plan_day() - чиста функція без БД: жадібне призначення з ремонтом.
+Спершу на місці лишаються чинні призначення (проведені фракції та вже
+розплановані, якщо їх слот вільний і апарат працює), тож перепланування
+інкрементальне - рухаються лише нові або відкладені фракції. Решта
+призначається від найбільш обмежених (прив'язаних до апарата, з бажаним
+часом) до найменш: у найближчий до бажаного часу вільний слот (пошук
+bisect по відсортованому списку вільних слотів). Якщо дозволені апарати
+заповнені, виконується ремонт: фракція, що вже стоїть на цьому апараті,
+але може піти на інший, переноситься туди і звільняє слот.
+
+schedule_days() завантажує фракції дат одним запитом, планує кожен день і
+записує лише змінені призначення пакетами bulk_update. Місяць розкладів
+для кількох апаратів - кілька тисяч фракцій - планується за десятки
+мілісекунд.
+"""
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+
+from .models import FractionHistory, TreatmentMachine
+
+SCHEDULE_BATCH_SIZE = 1000
+
+# Апарат на один день: id, початок дня (хв від півночі), тривалість слоту (хв), кількість слотів
+MachineDay = namedtuple('MachineDay', ['id', 'start', 'slot_minutes', 'slots'])
+
+# Фракція для планування: key - id фракції, machines - дозволені апарати
+# (None - будь-який), preferred - бажаний час (хв від півночі) або None,
+# current - поточне (machine_id, slot) або None, pinned - не переносити
+SlotRequest = namedtuple('SlotRequest', ['key', 'machines', 'preferred', 'current', 'pinned'])
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute if value is not None else None
+
+
+def machine_day(machine):
+    return MachineDay(machine.pk, _minutes(machine.day_start), machine.slot_minutes, machine.slots_per_day)
+
+
+class _DayPlan:
+    """Вільні слоти апаратів та хто займає зайняті"""
+
+    def __init__(self, machines):
+        self.machines = {machine.id: machine for machine in machines}
+        self.free = {machine.id: list(range(machine.slots)) for machine in machines}
+        self.occupant = {}
+        self.assignment = {}
+
+    def take(self, request, machine_id, slot):
+        free = self.free[machine_id]
+        del free[bisect_left(free, slot)]
+        self.occupant[machine_id, slot] = request
+        self.assignment[request.key] = (machine_id, slot)
+
+    def release(self, request):
+        machine_id, slot = self.assignment.pop(request.key)
+        del self.occupant[machine_id, slot]
+        free = self.free[machine_id]
+        free.insert(bisect_left(free, slot), slot)
+
+    def is_free(self, machine_id, slot):
+        free = self.free.get(machine_id)
+        if not free:
+            return False
+        index = bisect_left(free, slot)
+        return index < len(free) and free[index] == slot
+
+    def allowed(self, request):
+        if request.machines is None:
+            return list(self.machines)
+        return [machine_id for machine_id in request.machines if machine_id in self.machines]
+
+    def best_slot(self, request, machine_ids):
+        """(вартість, апарат, слот) найближчого до бажаного часу вільного слоту або None"""
+        best = None
+        for machine_id in machine_ids:
+            free = self.free[machine_id]
+            if not free:
+                continue
+            machine = self.machines[machine_id]
+            if request.preferred is None:
+                # Без побажань - найраніший слот, при рівності - найвільніший апарат
+                candidates = [free[0]]
+            else:
+                target = (request.preferred - machine.start) / machine.slot_minutes
+                index = bisect_left(free, target)
+                candidates = free[max(index - 1, 0):index + 1]
+            for slot in candidates:
+                start = machine.start + slot * machine.slot_minutes
+                cost = abs(start - request.preferred) if request.preferred is not None else start
+                option = (cost, -len(free), machine_id, slot)
+                if best is None or option < best:
+                    best = option
+        return best and (best[0], best[2], best[3])
+
+
+def plan_day(requests, machines):
+    """
+    Призначає фракції одного дня слотам апаратів.
+
+    requests - SlotRequest, machines - MachineDay. Повертає (призначення
+    {key: (machine_id, slot)}, [key фракцій без вільного слоту]).
+    """
+    plan = _DayPlan(machines)
+    pending = []
+    # Закріплені (проведені) спершу, потім чинні призначення - на місці
+    for request in sorted(requests, key=lambda request: not request.pinned):
+        current = request.current
+        if current and plan.is_free(*current) and (request.pinned or current[0] in plan.allowed(request)):
+            plan.take(request, *current)
+        elif not request.pinned:
+            pending.append(request)
+
+    # Найбільш обмежені - першими
+    pending.sort(key=lambda request: (
+        request.machines is None,
+        request.preferred is None,
+        request.preferred or 0,
+        request.key,
+    ))
+    unscheduled = []
+    for request in pending:
+        allowed = plan.allowed(request)
+        best = plan.best_slot(request, allowed)
+        if best is None:
+            best = _repair(plan, request, allowed)
+        if best is None:
+            unscheduled.append(request.key)
+            continue
+        _, machine_id, slot = best
+        plan.take(request, machine_id, slot)
+    return plan.assignment, unscheduled
+
+
+def _repair(plan, request, allowed):
+    """
+    Звільняє слот на одному з дозволених апаратів, переносячи незакріплену
+    фракцію, яка може стояти на іншому апараті з вільним слотом.
+    """
+    for machine_id in allowed:
+        for slot in range(plan.machines[machine_id].slots):
+            occupant = plan.occupant.get((machine_id, slot))
+            if occupant is None or occupant.pinned:
+                continue
+            alternatives = [other for other in plan.allowed(occupant) if other != machine_id]
+            moved = plan.best_slot(occupant, alternatives)
+            if moved is None:
+                continue
+            plan.release(occupant)
+            plan.take(occupant, moved[1], moved[2])
+            return (0, machine_id, slot)
+    return None
+
+
+def active_machines():
+    return list(TreatmentMachine.objects.filter(is_active=True))
+
+
+def schedule_days(dates, machines=None):
+    """
+    Планує слоти апаратів на вказані дні (інкрементально - чинні
+    призначення не рухаються) і зберігає лише змінені рядки.
+
+    Повертає словник: fractions - скільки фракцій планувалось, changed -
+    скільки призначень змінено, unscheduled - id фракцій без вільного слоту.
+    """
+    dates = sorted(set(dates))
+    result = {'fractions': 0, 'changed': 0, 'unscheduled': []}
+    if machines is None:
+        machines = active_machines()
+    if not dates or not machines:
+        return result
+    machine_days = [machine_day(machine) for machine in machines]
+
+    with transaction.atomic():
+        rows = FractionHistory.objects.select_for_update(of=('self',)).filter(date__in=dates).values_list(
+            'pk', 'date', 'machine_id', 'slot', 'delivered', 'is_missed',
+            'patient__treatment_machine_id', 'patient__preferred_time',
+        )
+        by_date = defaultdict(list)
+        current = {}
+        for pk, day, machine_id, slot, delivered, is_missed, patient_machine, preferred_time in rows:
+            if delivered:
+                # Проведена фракція лишається у своєму слоті (історія), лише займає його
+                if slot is not None:
+                    by_date[day].append(SlotRequest(pk, None, None, (machine_id, slot), True))
+                continue
+            current[pk] = (machine_id, slot) if slot is not None else None
+            if is_missed:
+                # Пропущена фракція слот не займає
+                continue
+            by_date[day].append(SlotRequest(
+                key=pk,
+                machines=(patient_machine,) if patient_machine else None,
+                preferred=_minutes(preferred_time),
+                current=current[pk],
+                pinned=False,
+            ))
+
+        planned = {}
+        for day, requests in by_date.items():
+            assignment, unscheduled = plan_day(requests, machine_days)
+            planned.update(assignment)
+            result['fractions'] += sum(not request.pinned for request in requests)
+            result['unscheduled'].extend(unscheduled)
+
+        changed = [
+            FractionHistory(pk=pk, machine_id=planned[pk][0] if pk in planned else None,
+                            slot=planned[pk][1] if pk in planned else None)
+            for pk, old in current.items()
+            if planned.get(pk) != old and (pk in planned or old is not None)
+        ]
+        if changed:
+            # Спершу звільняємо слоти, щоб обмін слотами не порушив унікальність посеред UPDATE
+            FractionHistory.objects.filter(pk__in=[fraction.pk for fraction in changed]).update(slot=None)
+            FractionHistory.objects.bulk_update(changed, ['machine', 'slot'], batch_size=SCHEDULE_BATCH_SIZE)
+    result['changed'] = len(changed)
+    return result
@@ -0,0 +1,101 @@
+"""
+Повнотекстовий пошук пацієнтів.
+
+PostgreSQL: згенерована колонка search_vector (tsvector з вагами полів)
+з GIN-індексом та триграмний GIN-індекс pg_trgm для неточних збігів.
+SQLite: FTS5-таблиця patient_search, яку підтримують тригери.
+Обидва варіанти створюються міграцією 0010_patient_search.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import Patient
+
+SEARCH_LIMIT = 200
+
+# Має збігатися з виразом триграмного індексу у міграції 0010_patient_search
+PG_SEARCH_TEXT = (
+    "(coalesce(last_name, '') || ' ' || coalesce(first_name, '') || ' ' || "
+    "coalesce(middle_name, '') || ' ' || coalesce(ambulatory_card_id, ''))"
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Розбиває запит на слова; розділові знаки (в т.ч. '-' у номері карти) відкидаються"""
+    return TOKEN_RE.findall((query or '').lower())
+
+
+def _postgres_ranked_ids(query, tokens, limit):
+    # Кожне слово - префікс, усі слова обов'язкові: 'шевч:* & олен:*'
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    sql = f"""
+        SELECT id FROM patients, to_tsquery('simple', %s) AS query
+        WHERE search_vector @@ query OR lower({PG_SEARCH_TEXT}) %% %s
+        ORDER BY ts_rank(search_vector, query) + similarity(lower({PG_SEARCH_TEXT}), %s) DESC, id
+        LIMIT %s
+    """
+    needle = query.lower()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, needle, needle, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _sqlite_ranked_ids(tokens, limit):
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    # Ваги bm25 у порядку колонок: прізвище, ім'я, по батькові, діагноз, номер карти
+    sql = """
+        SELECT rowid FROM patient_search
+        WHERE patient_search MATCH %s
+        ORDER BY bm25(patient_search, 10.0, 5.0, 2.0, 1.0, 10.0), rowid
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked_patient_ids(query, limit=SEARCH_LIMIT):
+    """
+    Повертає id пацієнтів, що відповідають запиту, від найрелевантніших.
+    Для БД без повнотекстового індексу повертає None.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    if connection.vendor == 'postgresql':
+        return _postgres_ranked_ids(query, tokens, limit)
+    if connection.vendor == 'sqlite':
+        return _sqlite_ranked_ids(tokens, limit)
+    return None
+
+
+def find_patients(query, queryset=None, limit=SEARCH_LIMIT):
+    """
+    Пошук пацієнтів за ПІБ, діагнозом та номером амбулаторної карти.
+
+    Повертає queryset, впорядкований за релевантністю, тому до нього можна
+    додавати анотації (наприклад with_latest_incapacity_end).
+    """
+    if queryset is None:
+        queryset = Patient.objects.all()
+    ids = ranked_patient_ids(query, limit)
+    if ids is None:
+        # Запасний варіант без індексу
+        return queryset.filter(
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query) |
+            Q(middle_name__icontains=query) |
+            Q(diagnosis__icontains=query) |
+            Q(ambulatory_card_id__icontains=query)
+        )[:limit]
+    if not ids:
+        return queryset.none()
+    position = Case(
+        *[When(pk=pk, then=index) for index, pk in enumerate(ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=ids).annotate(search_position=position).order_by('search_position')
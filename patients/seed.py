@@ -0,0 +1,131 @@
+"""
+Генерація синтетичного набору даних для бенчмарків.
+
+Пацієнти, фракції та МВТН вставляються через bulk_create пакетами,
+розклади фракцій рахуються одним векторним викликом робочого календаря.
+"""
+import random
+from datetime import date, timedelta
+
+from django.db.models import Max
+
+from .models import Patient, FractionHistory, MedicalIncapacity
+from .services import refresh_fraction_summaries
+from .workdays import holiday_calendar, workday_schedules
+
+SURNAME_ROOTS = [
+    'Шевчен', 'Коваль', 'Бондар', 'Ткач', 'Кравч', 'Мельн', 'Олійн', 'Лисен',
+    'Гончар', 'Руден', 'Савчен', 'Марчен', 'Петрен', 'Литвин', 'Мороз', 'Павлен',
+    'Кушнір', 'Дорош', 'Левчен', 'Карпен', 'Власен', 'Гаврил', 'Захарч', 'Іваниш',
+]
+SURNAME_ENDINGS = ['ко', 'ук', 'енко', 'чук', 'ишин', 'ович', 'ський', 'як']
+FIRST_NAMES = ['Олена', 'Іван', 'Марія', 'Петро', 'Ганна', 'Андрій', 'Оксана', 'Юрій', 'Наталія', 'Сергій']
+DIAGNOSES = [
+    'Са молочної залози', 'Са прямої кишки', 'Са передміхурової залози',
+    'Са легені', 'Са шийки матки', 'Гліома', 'Са гортані', 'Лімфома',
+]
+
+
+def seed_dataset(patients=1000, fractions_per_patient=30, incapacities=500,
+                 batch_size=5000, today=None, seed=42, stdout=None):
+    """
+    Створює синтетичних пацієнтів з курсами фракцій та МВТН.
+
+    Курси розподілені на ~3 роки назад, тому більшість фракцій - архівні,
+    як у робочій базі. Повертає список pk створених пацієнтів.
+    """
+    today = today or date.today()
+    rng = random.Random(seed)
+    calendar = holiday_calendar()
+    card_offset = (Patient.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0) + 1
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    # Пацієнти на різних етапах: архів, лікування, КТ-симуляція, очікування старту
+    new_patients = []
+    starts = []
+    for i in range(patients):
+        stage = rng.random()
+        if stage < 0.75:
+            start = today - timedelta(days=rng.randint(60, 3 * 365))
+        elif stage < 0.9:
+            start = today - timedelta(days=rng.randint(0, 40))
+        elif stage < 0.95:
+            start = today + timedelta(days=rng.randint(1, 14))
+        else:
+            start = None
+        starts.append(start)
+        new_patients.append(Patient(
+            ambulatory_card_id=f'0-{card_offset + i}',
+            last_name=rng.choice(SURNAME_ROOTS) + rng.choice(SURNAME_ENDINGS),
+            first_name=rng.choice(FIRST_NAMES),
+            middle_name=rng.choice(FIRST_NAMES) + 'вич',
+            birth_date=today - timedelta(days=rng.randint(30 * 365, 85 * 365)),
+            diagnosis=rng.choice(DIAGNOSES),
+            ct_simulation_date=(start or today) - timedelta(days=rng.randint(3, 10)),
+            treatment_start_date=start,
+            total_fractions=fractions_per_patient if start else None,
+            dose_per_fraction=2.0 if start else None,
+            inpatient_status=rng.choice(['амбулаторно', 'стаціонарно']),
+            last_blood_test_date=start + timedelta(days=rng.randint(0, 30)) if start else None,
+            notes='seed',
+        ))
+
+    created = Patient.objects.bulk_create(new_patients, batch_size=batch_size)
+    log(f'Створено пацієнтів: {len(created)}')
+
+    # Розклади всіх курсів - один векторний розрахунок
+    treated = [(p, start) for p, start in zip(created, starts) if start]
+    schedules = workday_schedules(
+        [start for _, start in treated],
+        [fractions_per_patient] * len(treated),
+        calendar=calendar
+    )
+
+    fractions = []
+    discharge_updates = []
+    fraction_count = 0
+    for (patient, _), schedule in zip(treated, schedules):
+        for fraction_date in schedule:
+            past = fraction_date < today
+            missed = past and rng.random() < 0.03
+            fractions.append(FractionHistory(
+                patient_id=patient.pk,
+                date=fraction_date,
+                dose=2.0,
+                delivered=past and not missed,
+                confirmed_by_doctor=past and not missed,
+                is_missed=missed,
+            ))
+        if schedule and schedule[-1] < today:
+            patient.discharge_date = schedule[-1]
+            discharge_updates.append(patient)
+        if len(fractions) >= batch_size:
+            FractionHistory.objects.bulk_create(fractions, batch_size=batch_size)
+            fraction_count += len(fractions)
+            fractions = []
+    if fractions:
+        FractionHistory.objects.bulk_create(fractions, batch_size=batch_size)
+        fraction_count += len(fractions)
+    Patient.objects.bulk_update(discharge_updates, ['discharge_date'], batch_size=batch_size)
+    log(f'Створено фракцій: {fraction_count}')
+
+    new_incapacities = []
+    for i in range(incapacities):
+        patient = rng.choice(created)
+        start = (patient.treatment_start_date or today) - timedelta(days=rng.randint(0, 20))
+        new_incapacities.append(MedicalIncapacity(
+            patient_id=patient.pk,
+            mvt_number=f'{i:019d}'[-19:],
+            start_date=start,
+            end_date=start + timedelta(days=rng.randint(5, 60)),
+        ))
+    MedicalIncapacity.objects.bulk_create(new_incapacities, batch_size=batch_size)
+    log(f'Створено МВТН: {len(new_incapacities)}')
+
+    patient_ids = [p.pk for p in created]
+    for offset in range(0, len(patient_ids), batch_size):
+        refresh_fraction_summaries(patient_ids[offset:offset + batch_size])
+    return patient_ids
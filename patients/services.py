@@ -1,8 +1,21 @@
-from datetime import date, timedelta
-from .models import Patient, FractionHistory
+from datetime import date
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q, QuerySet
+from .models import Patient, FractionHistory, FractionSummary, Holiday
+from .workdays import add_workdays, holiday_calendar, shift_workdays, skip_closed_days, workday_schedule
+from .cache_versions import bump_patient_versions
+from .scheduling import schedule_days
 
-def generate_fractions_for_patient(patient, start_date=None, total_fractions=None, dose_per_fraction=None):
-    """Генерує фракції для пацієнта"""
+def generate_fractions_for_patient(patient, start_date=None, total_fractions=None, dose_per_fraction=None,
+                                   keep_history=False):
+    """
+    Генерує фракції для пацієнта.
+    
+    За замовчуванням усі фракції видаляються і курс створюється заново.
+    З keep_history=True минулі фракції та фракції з історією (проведені,
+    підтверджені, пропущені, відкладені, з приміткою) зберігаються, а
+    майбутні змінюються мінімально - див. sync_future_fractions.
+    """
     if not start_date:
         start_date = patient.treatment_start_date
     if not total_fractions:
@@ -13,54 +26,212 @@ def generate_fractions_for_patient(patient, start_date=None, total_fractions=Non
     if not all([start_date, total_fractions, dose_per_fraction]):
         return False
     
-    # Видаляємо існуючі фракції
-    FractionHistory.objects.filter(patient=patient).delete()
-    
-    # Генеруємо нові фракції
-    fractions = []
-    current_date = start_date
-    
-    for i in range(total_fractions):
-        # Пропускаємо вихідні (субота, неділя)
-        while current_date.weekday() >= 5:  # 5=субота, 6=неділя
-            current_date += timedelta(days=1)
+    if keep_history:
+        last_date = sync_future_fractions(patient, start_date, total_fractions, dose_per_fraction)
+    else:
+        # Видаляємо існуючі фракції
+        FractionHistory.objects.filter(patient=patient).delete()
         
-        fraction = FractionHistory(
-            patient=patient,
-            date=current_date,
-            dose=dose_per_fraction,
-            delivered=False,
-            confirmed_by_doctor=False
-        )
-        fractions.append(fraction)
-        current_date += timedelta(days=1)
-    
-    FractionHistory.objects.bulk_create(fractions)
+        # Генеруємо нові фракції на робочі дні (без вихідних та свят)
+        fractions = [
+            FractionHistory(
+                patient=patient,
+                date=fraction_date,
+                dose=dose_per_fraction,
+                delivered=False,
+                confirmed_by_doctor=False
+            )
+            for fraction_date in workday_schedule(start_date, total_fractions)
+        ]
+        
+        FractionHistory.objects.bulk_create(fractions)
+        refresh_fraction_summaries([patient.pk])
+        last_date = fractions[-1].date if fractions else None
     
     # Завжди встановлюємо дату виписки на основі останньої фракції
-    if fractions:
-        patient.discharge_date = fractions[-1].date
+    if last_date:
+        patient.discharge_date = last_date
         patient.save()
         print(f"Встановлено дату виписки для {patient.full_name}: {patient.discharge_date}")
     
     return True
 
-def auto_confirm_today_fractions():
-    """Автоматично підтверджує фракції за сьогодні"""
-    today = date.today()
-    today_fractions = FractionHistory.objects.filter(date=today)
+def _has_history(fraction, today):
+    """Фракція, яку перегенерація не чіпає: минула або з відміткою персоналу"""
+    return (
+        fraction.date < today
+        or fraction.delivered
+        or fraction.confirmed_by_doctor
+        or fraction.is_missed
+        or fraction.is_postponed
+        or bool(fraction.note or fraction.reason)
+    )
+
+def sync_future_fractions(patient, start_date, total_fractions, dose_per_fraction, today=None):
+    """
+    Приводить майбутні фракції пацієнта до цільового курсу мінімальним diff.
+    
+    Фракції з історією (_has_history) залишаються як є; непропущені з них
+    зараховуються в курс. Решта курсу - робочі дні від max(start_date,
+    today), не зайняті збереженими фракціями. Майбутні фракції на цільових
+    датах не змінюються (крім дози), зайві переносяться на відсутні дати
+    (bulk_update), а різниця створюється (bulk_create) або видаляється
+    одним DELETE. Усе в одній транзакції. Повертає дату останньої фракції.
+    """
+    today = today or date.today()
+    with transaction.atomic():
+        existing = list(
+            FractionHistory.objects.select_for_update().filter(patient=patient).order_by('date', 'pk')
+        )
+        kept = [fraction for fraction in existing if _has_history(fraction, today)]
+        future = [fraction for fraction in existing if not _has_history(fraction, today)]
+        
+        remaining = max(total_fractions - sum(not fraction.is_missed for fraction in kept), 0)
+        occupied = {fraction.date for fraction in kept}
+        anchor = max(start_date, today)
+        # Зайняті дні в межах курсу витісняють фракції далі, тому запас = len(occupied)
+        candidates = workday_schedule(anchor, remaining + len(occupied)) if remaining else []
+        target = [day for day in candidates if day not in occupied][:remaining]
+        
+        # Фракції, що вже стоять на цільових датах, лишаються на місці
+        missing = set(target)
+        unmatched = []
+        to_update = []
+        for fraction in future:
+            if fraction.date in missing:
+                missing.discard(fraction.date)
+                if fraction.dose != dose_per_fraction:
+                    fraction.dose = dose_per_fraction
+                    to_update.append(fraction)
+            else:
+                unmatched.append(fraction)
+        missing = sorted(missing)
+        
+        # Зайві фракції займають відсутні дати, решта видаляється
+        for fraction, day in zip(unmatched, missing):
+            fraction.date = day
+            fraction.dose = dose_per_fraction
+            fraction.slot = None
+            to_update.append(fraction)
+        to_delete = [fraction.pk for fraction in unmatched[len(missing):]]
+        to_create = [
+            FractionHistory(
+                patient=patient, date=day, dose=dose_per_fraction,
+                delivered=False, confirmed_by_doctor=False
+            )
+            for day in missing[len(unmatched):]
+        ]
+        
+        if to_update:
+            FractionHistory.objects.bulk_update(to_update, ['date', 'dose', 'slot'])
+        if to_delete:
+            FractionHistory.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            FractionHistory.objects.bulk_create(to_create)
+        if to_update or to_delete or to_create:
+            refresh_fraction_summaries([patient.pk])
+    
+    dates = [fraction.date for fraction in kept] + target
+    return max(dates) if dates else None
+
+SUMMARY_FIELDS = ['total', 'delivered', 'confirmed', 'missed', 'postponed', 'planned', 'last_fraction_date']
+
+def refresh_fraction_summaries(patient_ids):
+    """
+    Перераховує підсумки фракцій для вказаних пацієнтів.
     
-    for fraction in today_fractions:
-        fraction.delivered = True
-        fraction.confirmed_by_doctor = True
-        fraction.save()
+    Один агрегатний запит по fraction_history тільки для цих пацієнтів
+    та один upsert у fraction_summary, незалежно від кількості пацієнтів.
+    """
+    patient_ids = {pk for pk in patient_ids if pk is not None}
+    if not patient_ids:
+        return
+    # Усі масові зміни фракцій проходять тут, тому й кеш сторінок інвалідовуємо тут
+    bump_patient_versions(patient_ids)
+    
+    rows = FractionHistory.objects.filter(
+        patient_id__in=patient_ids
+    ).values('patient_id').annotate(
+        summary_total=Count('pk'),
+        summary_delivered=Count('pk', filter=Q(delivered=True)),
+        summary_confirmed=Count('pk', filter=Q(confirmed_by_doctor=True)),
+        summary_missed=Count('pk', filter=Q(is_missed=True)),
+        summary_postponed=Count('pk', filter=Q(is_postponed=True)),
+        summary_planned=Count('pk', filter=~Q(delivered=True) & Q(is_missed=False)),
+        summary_last_fraction_date=Max('date'),
+    ).order_by()
+    
+    # Пацієнти без фракцій отримують нульові підсумки
+    summaries = {pk: FractionSummary(patient_id=pk) for pk in patient_ids}
+    for row in rows:
+        summaries[row['patient_id']] = FractionSummary(
+            patient_id=row['patient_id'],
+            **{field: row[f'summary_{field}'] for field in SUMMARY_FIELDS}
+        )
     
-    return today_fractions.count()
+    FractionSummary.objects.bulk_create(
+        summaries.values(),
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=SUMMARY_FIELDS
+    )
+
+def rebuild_all_fraction_summaries(batch_size=1000):
+    """Повністю перебудовує підсумки фракцій для всіх пацієнтів пакетами"""
+    patient_ids = Patient.objects.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    rebuilt = 0
+    for pk in patient_ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            refresh_fraction_summaries(batch)
+            rebuilt += len(batch)
+            batch = []
+    if batch:
+        refresh_fraction_summaries(batch)
+        rebuilt += len(batch)
+    return rebuilt
+
+def auto_confirm_today_fractions():
+    """Автоматично підтверджує фракції за сьогодні"""
+    today_fractions = FractionHistory.objects.filter(date=date.today())
+    patient_ids = set(today_fractions.values_list('patient_id', flat=True))
+    confirmed = today_fractions.update(delivered=True, confirmed_by_doctor=True)
+    refresh_fraction_summaries(patient_ids)
+    return confirmed
+
+def close_fraction_day(day=None):
+    """
+    Закриття дня: підтверджує фракції за день та позначає пропущеними
+    непроведені фракції за попередні дні.
+
+    Виконується фіксованою кількістю запитів незалежно від кількості
+    фракцій; повторний запуск нічого не змінює. Повертає словник
+    {patient_id: {'confirmed': [id фракцій], 'missed': [id фракцій]}}.
+    """
+    day = day or date.today()
+    to_confirm = FractionHistory.objects.filter(date=day, is_missed=False).filter(
+        ~Q(delivered=True) | ~Q(confirmed_by_doctor=True)
+    )
+    overdue = FractionHistory.objects.filter(date__lt=day, is_missed=False).exclude(delivered=True)
+
+    changes = {}
+    with transaction.atomic():
+        # Блокуємо рядки, щоб набір змін збігався з тим, що оновить UPDATE
+        for name, queryset in (('confirmed', to_confirm), ('missed', overdue)):
+            for fraction_id, patient_id in queryset.select_for_update().values_list('pk', 'patient_id'):
+                patient_changes = changes.setdefault(patient_id, {'confirmed': [], 'missed': []})
+                patient_changes[name].append(fraction_id)
+        if changes:
+            to_confirm.update(delivered=True, confirmed_by_doctor=True)
+            overdue.update(is_missed=True)
+            refresh_fraction_summaries(changes.keys())
+    return changes
 
 def get_patient_treatment_info(patient):
     """Отримує інформацію про лікування пацієнта"""
     total_fractions = patient.total_fractions or 0
-    completed_fractions = patient.fractions.filter(delivered=True).count()
+    completed_fractions = patient.fraction_stats.delivered
     remaining_fractions = total_fractions - completed_fractions
     
     return {
@@ -75,16 +246,8 @@ def calculate_discharge_date(patient):
     if not patient.treatment_start_date or not patient.total_fractions:
         return None
     
-    # Рахуємо робочі дні для всіх фракцій
-    current_date = patient.treatment_start_date
-    working_days = 0
-    
-    while working_days < patient.total_fractions:
-        if current_date.weekday() < 5:  # Пн-Пт
-            working_days += 1
-        current_date += timedelta(days=1)
-    
-    return current_date - timedelta(days=1)
+    # Дата останнього робочого дня курсу (вихідні та свята пропускаються)
+    return add_workdays(patient.treatment_start_date, patient.total_fractions)
 
 def recalculate_discharge_date(patient):
     """Перераховує дату виписки на основі поточних фракцій"""
@@ -105,6 +268,93 @@ def set_discharge_date_from_fractions(patient):
         return patient.discharge_date
     return None
 
+# Остання фракція кожного пацієнта разом з поточною датою виписки
+LAST_FRACTION_SQL = """
+    SELECT f.patient_id, MAX(f.date) AS last_date, p.discharge_date AS old_date
+    FROM fraction_history f
+    JOIN patients p ON p.id = f.patient_id
+    {where}
+    GROUP BY f.patient_id, p.discharge_date
+"""
+
+# Ліміт змінних у запиті SQLite - 999 у старих збірках
+DISCHARGE_BATCH_SIZE = 500
+
+# discharge_date може бути NULL, тому "<>" недостатньо
+DISCHARGE_CHANGED = '(old_date IS NULL OR old_date <> last_date)'
+
+
+def _as_date(value):
+    # SQLite повертає агрегати над датами рядками
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _discharge_filters(patient_ids):
+    """
+    Пари (WHERE, параметри) для LAST_FRACTION_SQL. QuerySet стає підзапитом
+    (без списку параметрів), список id ділиться на пакети DISCHARGE_BATCH_SIZE,
+    щоб не впертися в ліміт змінних SQLite на великих вибірках.
+    """
+    if patient_ids is None:
+        return [('', [])]
+    if isinstance(patient_ids, QuerySet):
+        sql, params = patient_ids.order_by().values('pk').query.sql_with_params()
+        return [(f'WHERE f.patient_id IN ({sql})', list(params))]
+    patient_ids = list(patient_ids)
+    return [
+        (f"WHERE f.patient_id IN ({', '.join(['%s'] * len(batch))})", batch)
+        for batch in (
+            patient_ids[offset:offset + DISCHARGE_BATCH_SIZE]
+            for offset in range(0, len(patient_ids), DISCHARGE_BATCH_SIZE)
+        )
+    ]
+
+
+def bulk_recalculate_discharge_dates(patient_ids=None, dry_run=False):
+    """
+    Встановлює дату виписки = дата останньої фракції одним UPDATE ... FROM.
+
+    patient_ids обмежує перерахунок вибраними пацієнтами (None - усі):
+    список id (великий - пакетами) або QuerySet пацієнтів (підзапит).
+    Повертає список (patient_id, стара дата, нова дата) лише для рядків,
+    які змінились (або змінились би при dry_run=True).
+    """
+    changes = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for where, params in _discharge_filters(patient_ids):
+            last_fraction = LAST_FRACTION_SQL.format(where=where)
+            if dry_run or connection.vendor != 'postgresql':
+                # SQLite не дозволяє посилатись на таблиці з FROM у RETURNING,
+                # тому зміни читаються тим самим підзапитом у тій самій транзакції
+                cursor.execute(
+                    f'SELECT patient_id, old_date, last_date FROM ({last_fraction}) AS last '
+                    f'WHERE {DISCHARGE_CHANGED} ORDER BY patient_id',
+                    params
+                )
+                batch_changes = cursor.fetchall()
+                if not dry_run and batch_changes:
+                    cursor.execute(
+                        f'UPDATE patients SET discharge_date = last.last_date '
+                        f'FROM ({last_fraction}) AS last '
+                        f'WHERE patients.id = last.patient_id AND {DISCHARGE_CHANGED}',
+                        params
+                    )
+            else:
+                cursor.execute(
+                    f'UPDATE patients SET discharge_date = last.last_date '
+                    f'FROM ({last_fraction}) AS last '
+                    f'WHERE patients.id = last.patient_id AND {DISCHARGE_CHANGED} '
+                    f'RETURNING last.patient_id, last.old_date, last.last_date',
+                    params
+                )
+                batch_changes = cursor.fetchall()
+            changes.extend(batch_changes)
+    changes.sort()
+
+    if not dry_run:
+        bump_patient_versions(pk for pk, _, _ in changes)
+    return [(pk, _as_date(old), _as_date(new)) for pk, old, new in changes]
+
 def postpone_fraction(fraction, new_date, reason=""):
     """Відкладає фракцію на нову дату"""
     if not fraction.original_date:
@@ -113,12 +363,130 @@ def postpone_fraction(fraction, new_date, reason=""):
     fraction.date = new_date
     fraction.is_postponed = True
     fraction.reason = reason
+    # Слот старого дня недійсний - фракцію розплановуємо на новий день
+    fraction.slot = None
     fraction.save()
+    schedule_days([new_date])
     
     # Перераховуємо дату виписки
     recalculate_discharge_date(fraction.patient)
     return fraction
 
+def shift_remaining_course(fraction, days, reason=""):
+    """
+    Зсуває фракцію та всі наступні непроведені фракції пацієнта на days
+    робочих днів вперед (з урахуванням вихідних і свят).
+    
+    Нові дати рахуються одним векторним викликом, усі рядки оновлюються
+    одним bulk_update, а підсумки й дата виписки - в тій самій транзакції.
+    Повертає кількість зсунутих фракцій.
+    """
+    if days < 1:
+        return 0
+    with transaction.atomic():
+        remaining = list(
+            FractionHistory.objects.select_for_update().filter(
+                patient_id=fraction.patient_id, date__gte=fraction.date
+            ).exclude(delivered=True).exclude(is_missed=True).order_by('date', 'pk')
+        )
+        if not remaining:
+            return 0
+        new_dates = shift_workdays([item.date for item in remaining], days)
+        for item, new_date in zip(remaining, new_dates):
+            if not item.original_date:
+                item.original_date = item.date
+            item.date = new_date
+            item.is_postponed = True
+            item.reason = reason or item.reason
+            item.slot = None
+        FractionHistory.objects.bulk_update(remaining, ['date', 'original_date', 'is_postponed', 'reason', 'slot'])
+        # Слоти апаратів переплановуються лише на днях, куди потрапили фракції
+        schedule_days(new_dates)
+        refresh_fraction_summaries([fraction.patient_id])
+        bulk_recalculate_discharge_dates([fraction.patient_id])
+    return len(remaining)
+
+# Рядків в одному UPDATE ... CASE при масовому перенесенні
+RESCHEDULE_BATCH_SIZE = 1000
+
+def reschedule_closed_days(closed_dates, reason="", dry_run=False, add_holidays=False):
+    """
+    Переносить фракції всіх пацієнтів із закритих днів (ремонт апарата,
+    оголошене свято).
+    
+    Для кожного пацієнта з непроведеною фракцією на закритий день решта
+    курсу від першого такого дня розкладається на робочі дні без закритих
+    (skip_closed_days - один векторний виклик для всіх фракцій). Фракції
+    оновлюються пакетами bulk_update, підсумки та дати виписки - кількома
+    set-based запитами, все в одній транзакції. dry_run виконує те саме і
+    відкочує транзакцію. add_holidays додає закриті дні до Holiday, щоб
+    нові курси їх теж оминали.
+    
+    Повертає словник: fractions - кількість перенесених фракцій, patients -
+    id пацієнтів, discharge_changes - [(patient_id, стара дата, нова дата)].
+    """
+    closed_dates = sorted(set(closed_dates))
+    result = {'fractions': 0, 'patients': [], 'discharge_changes': []}
+    if not closed_dates:
+        return result
+    
+    holidays = list(Holiday.objects.values_list('date', flat=True))
+    calendar = holiday_calendar(holidays)
+    closed_calendar = holiday_calendar(holidays + closed_dates)
+    pending = FractionHistory.objects.exclude(delivered=True).exclude(is_missed=True)
+    
+    with transaction.atomic():
+        # Перший закритий день з фракцією для кожного пацієнта
+        anchors = dict(
+            pending.filter(date__in=closed_dates).values('patient_id')
+            .annotate(first_closed=Min('date')).values_list('patient_id', 'first_closed').order_by()
+        )
+        if not anchors:
+            return result
+        fractions = [
+            fraction for fraction in pending.select_for_update().filter(
+                patient_id__in=list(anchors), date__gte=closed_dates[0]
+            ).order_by('patient_id', 'date', 'pk')
+            if fraction.date >= anchors[fraction.patient_id]
+        ]
+        new_dates = skip_closed_days(
+            [anchors[fraction.patient_id] for fraction in fractions],
+            [fraction.date for fraction in fractions],
+            calendar, closed_calendar,
+        )
+        moved = []
+        for fraction, new_date in zip(fractions, new_dates):
+            if new_date == fraction.date:
+                continue
+            if not fraction.original_date:
+                fraction.original_date = fraction.date
+            fraction.date = new_date
+            fraction.is_postponed = True
+            fraction.reason = reason or fraction.reason
+            fraction.slot = None
+            moved.append(fraction)
+        patient_ids = sorted({fraction.patient_id for fraction in moved})
+        
+        FractionHistory.objects.bulk_update(
+            moved, ['date', 'original_date', 'is_postponed', 'reason', 'slot'], batch_size=RESCHEDULE_BATCH_SIZE
+        )
+        if add_holidays:
+            Holiday.objects.bulk_create(
+                [Holiday(date=day, name=reason or 'Відділення закрите') for day in closed_dates],
+                ignore_conflicts=True
+            )
+        # При dry_run зміни дат виписки читаються з уже перенесених фракцій
+        result['discharge_changes'] = bulk_recalculate_discharge_dates(patient_ids, dry_run=dry_run)
+        if dry_run:
+            transaction.set_rollback(True)
+        else:
+            schedule_days({fraction.date for fraction in moved})
+            refresh_fraction_summaries(patient_ids)
+    
+    result['fractions'] = len(moved)
+    result['patients'] = patient_ids
+    return result
+
 def mark_fraction_missed(fraction, reason=""):
     """Позначає фракцію як пропущену"""
     fraction.is_missed = True
@@ -128,8 +496,8 @@ def mark_fraction_missed(fraction, reason=""):
 
 def get_missed_fractions_count(patient):
     """Підраховує кількість пропущених фракцій"""
-    return patient.fractions.filter(is_missed=True).count()
+    return patient.fraction_stats.missed
 
 def get_postponed_fractions_count(patient):
     """Підраховує кількість відкладених фракцій"""
-    return patient.fractions.filter(is_postponed=True).count() 
\ No newline at end of file
+    return patient.fraction_stats.postponed 
\ No newline at end of file
@@ -1,12 +1,14 @@
 # Tests file
 
-from django.test import TestCase, Client
+import base64
+
+from django.test import TestCase, Client, LiveServerTestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from datetime import date, timedelta
-from .models import Patient, FractionHistory, MedicalIncapacity
+from .models import Patient, FractionHistory, MedicalIncapacity, Holiday, FractionSummary
 from .forms import PatientForm, MedicalIncapacityForm, FractionEditForm
 from .services import (
     generate_fractions_for_patient, 
@@ -14,7 +16,18 @@ from .services import (
     get_patient_treatment_info,
     recalculate_discharge_date,
     postpone_fraction,
-    mark_fraction_missed
+    mark_fraction_missed,
+    calculate_discharge_date,
+    refresh_fraction_summaries
+)
+from .benchmark import percentile, route_requests
+from .query_budget import QueryBudgetTestMixin
+from .workdays import (
+    holiday_calendar,
+    count_workdays,
+    add_workdays,
+    workday_schedule,
+    workday_schedules
 )
 
 User = get_user_model()
@@ -761,9 +774,13 @@ class FormValidationTests(TestCase):
             'ambulatory_card_id': '228435/2025'
         }
         
+        # Унікальність перевіряє обмеження БД під час збереження форми
         form = PatientForm(data=form_data)
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(form.save())
         self.assertFalse(form.is_valid())
         self.assertIn('ambulatory_card_id', form.errors)
+        self.assertEqual(Patient.objects.filter(ambulatory_card_id='228435/2025').count(), 1)
     
     def test_ambulatory_card_id_form_validation_update_same_id(self):
         """Тест валідації форми: оновлення з тим самим ID (дозволено)"""
@@ -1007,3 +1024,2039 @@ class CRUDOperationsTests(TestCase):
         # Перевіряємо, що пацієнт видалений
         self.assertFalse(Patient.objects.filter(id=patient_id).exists())
 
+
+
+class PatientListPaginationTests(TestCase):
+    """Тести keyset-пагінації списку пацієнтів"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            role='doctor',
+            approved=True
+        )
+        self.client.force_login(self.user)
+    
+    def create_patients(self, count, offset=0):
+        patients = []
+        for i in range(offset, offset + count):
+            patient = Patient.objects.create(
+                last_name=f'Пацієнт{i:03d}',
+                first_name='Тест',
+                # Кожен третій без дати КТ - перевіряємо обробку NULL
+                ct_simulation_date=None if i % 3 == 0 else date.today() - timedelta(days=i % 7)
+            )
+            MedicalIncapacity.objects.create(
+                patient=patient,
+                start_date=date.today() - timedelta(days=10),
+                end_date=date.today() + timedelta(days=i % 5)
+            )
+            patients.append(patient)
+        return patients
+    
+    def test_query_count_does_not_grow_with_patients(self):
+        """Кількість запитів сторінки не залежить від кількості пацієнтів"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        self.create_patients(5)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('patient_list'), {'sort': 'medical_incapacity_end'})
+        
+        self.create_patients(25, offset=5)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('patient_list'), {'sort': 'medical_incapacity_end'})
+        
+        self.assertEqual(len(small), len(large))
+    
+    def test_latest_incapacity_end_annotated(self):
+        """Дата останнього МВТН береться з анотації"""
+        patient = self.create_patients(1)[0]
+        MedicalIncapacity.objects.create(
+            patient=patient,
+            start_date=date.today(),
+            end_date=date(2099, 1, 15)
+        )
+        
+        response = self.client.get(reverse('patient_list'))
+        self.assertContains(response, '15.01.2099')
+    
+    def test_pages_cover_all_patients_for_every_sort(self):
+        """Перехід по сторінках вперед і назад повертає всіх пацієнтів без повторів"""
+        from unittest.mock import patch
+        
+        patients = self.create_patients(11)
+        expected = {p.pk for p in patients}
+        
+        with patch('patients.views.PATIENTS_PER_PAGE', 4):
+            for sort in ['full_name', 'ct_simulation_date', 'treatment_start_date',
+                         'discharge_date', 'medical_incapacity_end']:
+                for order in ['asc', 'desc']:
+                    seen = []
+                    pages = []
+                    params = {'sort': sort, 'order': order}
+                    while True:
+                        page = self.client.get(reverse('patient_list'), params).context['page']
+                        pages.append([p.pk for p in page])
+                        seen.extend(p.pk for p in page)
+                        if not page.has_next:
+                            break
+                        params = {'sort': sort, 'order': order, 'after': page.next_cursor}
+                    
+                    self.assertEqual(len(seen), len(expected), (sort, order))
+                    self.assertEqual(set(seen), expected, (sort, order))
+                    
+                    # Крок назад з останньої сторінки повертає передостанню
+                    params = {'sort': sort, 'order': order, 'before': page.previous_cursor}
+                    previous = self.client.get(reverse('patient_list'), params).context['page']
+                    self.assertEqual([p.pk for p in previous], pages[-2], (sort, order))
+    
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """Пошкоджений курсор не ламає сторінку"""
+        self.create_patients(3)
+        response = self.client.get(reverse('patient_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 3)
+    
+    def test_archive_is_paginated(self):
+        """Архів віддається сторінками: запитів стільки ж, усі пацієнти без повторів"""
+        from unittest.mock import patch
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        def archive(count, offset=0):
+            return [
+                Patient.objects.create(
+                    last_name=f'Архівний{i:03d}', first_name='Тест',
+                    discharge_date=date.today() - timedelta(days=1 + i % 4),
+                ).pk
+                for i in range(offset, offset + count)
+            ]
+        
+        expected = set(archive(3))
+        with patch('patients.views.PATIENTS_PER_PAGE', 4):
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(reverse('patient_archive'))
+            expected.update(archive(8, offset=3))
+            with CaptureQueriesContext(connection) as large:
+                response = self.client.get(reverse('patient_archive'))
+            self.assertEqual(len(small), len(large))
+            
+            seen = []
+            while True:
+                page = response.context['page']
+                self.assertLessEqual(len(page), 4)
+                seen.extend(p.pk for p in page)
+                if not page.has_next:
+                    break
+                response = self.client.get(reverse('patient_archive'), {'after': page.next_cursor})
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+        # За замовчуванням - найновіші виписки першими
+        self.assertEqual(response.context['current_sort'], 'discharge_date')
+        self.assertEqual(response.context['current_order'], 'desc')
+    
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        """Курсор з рядком замість дати для поля-дати не призводить до 500"""
+        from .pagination import encode_cursor
+        
+        self.create_patients(3)
+        for sort in ['ct_simulation_date', 'medical_incapacity_end']:
+            for param in ['after', 'before']:
+                with self.subTest(sort=sort, param=param):
+                    response = self.client.get(reverse('patient_list'), {
+                        'sort': sort, param: encode_cursor('не-дата', 1)
+                    })
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.context['page']), 3)
+
+
+class FractionListViewTests(TestCase):
+    """Тести сторінки фракцій"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            role='doctor',
+            approved=True
+        )
+        self.client.force_login(self.user)
+    
+    def create_patient_with_fractions(self, name):
+        patient = Patient.objects.create(last_name=name, first_name='Тест')
+        start = date.today() - timedelta(days=3)
+        FractionHistory.objects.bulk_create([
+            FractionHistory(patient=patient, date=start, dose=2.0, delivered=True),
+            FractionHistory(patient=patient, date=start + timedelta(days=1), dose=2.0, delivered=False, is_missed=True),
+            FractionHistory(patient=patient, date=start + timedelta(days=5), dose=2.0, delivered=False, is_postponed=True),
+            FractionHistory(patient=patient, date=start + timedelta(days=4), dose=2.0, delivered=False),
+        ])
+        return patient
+    
+    def test_fraction_totals_and_order(self):
+        """Підсумки рахуються в БД, фракції відсортовані за датою"""
+        patient = self.create_patient_with_fractions('Фракційний')
+        Patient.objects.create(last_name='Без фракцій', first_name='Тест')
+        
+        response = self.client.get(reverse('fraction_list'))
+        patients_data = response.context['patients_data']
+        self.assertEqual(len(patients_data), 1)
+        
+        data = patients_data[0]
+        self.assertEqual(data['patient'], patient)
+        self.assertEqual(data['total_fractions'], 4)
+        self.assertEqual(data['completed_fractions'], 1)
+        self.assertEqual(data['pending_fractions'], 3)
+        self.assertEqual(data['missed_fractions'], 1)
+        self.assertEqual(data['postponed_fractions'], 1)
+        dates = [f.date for f in data['fractions']]
+        self.assertEqual(dates, sorted(dates))
+    
+    def test_query_count_does_not_grow_with_patients(self):
+        """Кількість запитів не залежить від кількості курсів"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        for i in range(3):
+            self.create_patient_with_fractions(f'Пацієнт{i}')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('fraction_list'))
+        
+        for i in range(3, 15):
+            self.create_patient_with_fractions(f'Пацієнт{i}')
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('fraction_list'))
+        
+        self.assertEqual(len(small), len(large))
+    
+    def test_patient_fraction_list(self):
+        """Сторінка фракцій окремого пацієнта"""
+        patient = self.create_patient_with_fractions('Перший')
+        self.create_patient_with_fractions('Другий')
+        
+        response = self.client.get(reverse('patient_fraction_list', kwargs={'pk': patient.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([d['patient'] for d in response.context['patients_data']], [patient])
+
+
+class DashboardViewTests(TestCase):
+    """Тести агрегації дашборду"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            role='doctor',
+            approved=True
+        )
+        self.client.force_login(self.user)
+        self.today = date.today()
+    
+    def test_dashboard_counts(self):
+        """Лічильники дашборду відповідають фільтрам за датами"""
+        today = self.today
+        Patient.objects.create(last_name='КТ', ct_simulation_date=today)
+        Patient.objects.create(last_name='Старт', treatment_start_date=today + timedelta(days=3))
+        Patient.objects.create(last_name='Лікування', treatment_start_date=today - timedelta(days=2))
+        Patient.objects.create(last_name='Виписка', treatment_start_date=today - timedelta(days=20), discharge_date=today)
+        
+        response = self.client.get(reverse('dashboard'))
+        context = response.context
+        self.assertEqual(context['ct_today_count'], 1)
+        self.assertEqual(context['start_today_count'], 0)
+        self.assertEqual(context['discharge_today_count'], 1)
+        self.assertEqual(context['ct_count'], 1)
+        self.assertEqual(context['start_count'], 1)
+        self.assertEqual(context['in_treatment_count'], 1)
+        self.assertEqual(context['discharged_this_week'], 1)
+    
+    def test_blood_test_notifications(self):
+        """Сповіщення лише для пацієнтів з простроченим аналізом крові"""
+        today = self.today
+        overdue = Patient.objects.create(
+            last_name='Прострочений',
+            treatment_start_date=today - timedelta(days=30),
+            last_blood_test_date=today - timedelta(days=10)
+        )
+        never_tested = Patient.objects.create(
+            last_name='Без аналізу',
+            treatment_start_date=today - timedelta(days=12)
+        )
+        Patient.objects.create(
+            last_name='Свіжий',
+            treatment_start_date=today - timedelta(days=30),
+            last_blood_test_date=today - timedelta(days=3)
+        )
+        Patient.objects.create(
+            last_name='Нещодавно почав',
+            treatment_start_date=today - timedelta(days=2)
+        )
+        
+        response = self.client.get(reverse('dashboard'))
+        notified = {n['patient'] for n in response.context['notifications']}
+        self.assertEqual(notified, {overdue, never_tested})
+    
+    def test_query_count_does_not_grow_with_patients(self):
+        """Кількість запитів дашборду не залежить від кількості пацієнтів"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as empty:
+            self.client.get(reverse('dashboard'))
+        
+        for i in range(20):
+            Patient.objects.create(
+                last_name=f'Пацієнт{i}',
+                treatment_start_date=self.today - timedelta(days=15)
+            )
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(reverse('dashboard'))
+        
+        self.assertEqual(len(empty), len(full))
+
+
+class WorkdaysTests(TestCase):
+    """Тести робочого календаря зі святковими днями"""
+    
+    def setUp(self):
+        # Понеділок 2026-10-19 - 2026-10-23 п'ятниця; середа 21.10 - свято
+        self.monday = date(2026, 10, 19)
+        self.holiday = Holiday.objects.create(date=date(2026, 10, 21), name='Тестове свято')
+    
+    def test_count_workdays_skips_weekends_and_holidays(self):
+        """Підрахунок робочих днів включно з кінцями інтервалу"""
+        self.assertEqual(count_workdays(self.monday, self.monday + timedelta(days=6)), 4)
+        self.assertEqual(count_workdays(self.monday, self.monday - timedelta(days=1)), 0)
+    
+    def test_add_workdays_and_schedule(self):
+        """Розклад починається з найближчого робочого дня і пропускає свята"""
+        saturday = self.monday - timedelta(days=2)
+        schedule = workday_schedule(saturday, 4)
+        self.assertEqual(schedule, [
+            date(2026, 10, 19), date(2026, 10, 20), date(2026, 10, 22), date(2026, 10, 23)
+        ])
+        self.assertEqual(add_workdays(saturday, 4), schedule[-1])
+        self.assertIsNone(add_workdays(saturday, 0))
+    
+    def test_vectorized_schedules_match_single_schedules(self):
+        """Векторний розрахунок дає ті ж розклади, що й поодинокий"""
+        calendar = holiday_calendar()
+        starts = [self.monday + timedelta(days=i) for i in range(10)]
+        counts = [i % 4 + 1 for i in range(10)]
+        schedules = workday_schedules(starts, counts, calendar=calendar)
+        for start, count, schedule in zip(starts, counts, schedules):
+            self.assertEqual(schedule, workday_schedule(start, count, calendar=calendar))
+        self.assertEqual(
+            list(count_workdays(starts, [s[-1] for s in schedules], calendar=calendar)),
+            counts
+        )
+    
+    def test_services_respect_holidays(self):
+        """Генерація фракцій та дата виписки враховують свята"""
+        patient = Patient.objects.create(
+            last_name='Тестовий',
+            first_name='Свято',
+            treatment_start_date=self.monday,
+            total_fractions=5,
+            dose_per_fraction=2.0
+        )
+        dates = list(patient.fractions.order_by('date').values_list('date', flat=True))
+        self.assertEqual(len(dates), 5)
+        self.assertNotIn(self.holiday.date, dates)
+        self.assertEqual(dates[-1], date(2026, 10, 26))
+        self.assertEqual(calculate_discharge_date(patient), date(2026, 10, 26))
+
+
+class FractionSummaryTests(TestCase):
+    """Тести інкрементально оновлюваних підсумків фракцій"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            role='doctor',
+            approved=True
+        )
+        self.client.force_login(self.user)
+        self.patient = Patient.objects.create(
+            last_name='Тестовий',
+            first_name='Підсумки',
+            treatment_start_date=date.today(),
+            total_fractions=5,
+            dose_per_fraction=2.0
+        )
+    
+    def get_summary(self):
+        return FractionSummary.objects.get(patient=self.patient)
+    
+    def test_summary_created_on_generation(self):
+        """Генерація фракцій створює підсумки"""
+        summary = self.get_summary()
+        self.assertEqual(summary.total, 5)
+        self.assertEqual(summary.planned, 5)
+        self.assertEqual(summary.delivered, 0)
+        self.assertEqual(summary.last_fraction_date, self.patient.fractions.order_by('date').last().date)
+    
+    def test_summary_follows_edits_and_bulk_confirmation(self):
+        """Підсумки оновлюються при редагуванні та масовому підтвердженні"""
+        fractions = list(self.patient.fractions.order_by('date'))
+        mark_fraction_missed(fractions[0], 'Хвороба')
+        postpone_fraction(fractions[1], fractions[-1].date + timedelta(days=3), 'Ремонт')
+        
+        self.client.post(reverse('confirm_fractions_nurse'), {'fraction_ids': [fractions[2].pk, fractions[3].pk]})
+        self.client.post(reverse('confirm_fractions_doctor'), {'fraction_ids': [fractions[2].pk]})
+        
+        summary = self.get_summary()
+        self.assertEqual(summary.missed, 1)
+        self.assertEqual(summary.postponed, 1)
+        self.assertEqual(summary.delivered, 2)
+        self.assertEqual(summary.confirmed, 1)
+        self.assertEqual(summary.planned, 2)
+        self.assertEqual(summary.last_fraction_date, fractions[-1].date + timedelta(days=3))
+        
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(patient.current_fraction, 2)
+        self.assertEqual(get_patient_treatment_info(patient)['completed_fractions'], 2)
+    
+    def test_summary_reset_on_regeneration(self):
+        """Повторна генерація перераховує підсумки"""
+        FractionHistory.objects.filter(patient=self.patient).update(delivered=True)
+        generate_fractions_for_patient(self.patient, total_fractions=3)
+        summary = self.get_summary()
+        self.assertEqual(summary.total, 3)
+        self.assertEqual(summary.delivered, 0)
+    
+    def test_rebuild_command(self):
+        """Команда перебудови відновлює підсумки після прямих змін у БД"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        FractionSummary.objects.all().delete()
+        FractionHistory.objects.filter(patient=self.patient).update(delivered=True)
+        call_command('rebuild_fraction_summaries', stdout=StringIO())
+        self.assertEqual(self.get_summary().delivered, 5)
+    
+    def test_patient_detail_does_not_count_fractions(self):
+        """Сторінка пацієнта не рахує фракції через COUNT"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('patient_detail', kwargs={'pk': self.patient.pk}))
+        self.assertEqual(response.status_code, 200)
+        counting = [q['sql'] for q in queries if 'COUNT(' in q['sql'] and 'fraction_history' in q['sql']]
+        self.assertEqual(counting, [])
+
+
+class SeedAndExplainTests(TestCase):
+    """Тести синтетичного наповнення та команди explain_queries"""
+    
+    def test_seed_dataset_creates_schedules_and_summaries(self):
+        """Наповнення створює курси фракцій по робочих днях та підсумки"""
+        from .seed import seed_dataset
+        
+        patient_ids = seed_dataset(patients=20, fractions_per_patient=5, incapacities=10)
+        self.assertEqual(len(patient_ids), 20)
+        self.assertEqual(FractionSummary.objects.filter(patient_id__in=patient_ids).count(), 20)
+        self.assertEqual(MedicalIncapacity.objects.count(), 10)
+        
+        fractions = FractionHistory.objects.all()
+        self.assertTrue(fractions.exists())
+        self.assertTrue(all(f.date.weekday() < 5 for f in fractions))
+    
+    def test_explain_queries_rolls_back_seed(self):
+        """Команда показує плани запитів і не залишає згенерованих даних"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        out = StringIO()
+        call_command('explain_queries', patients=20, fractions_per_patient=5, incapacities=10, stdout=out)
+        output = out.getvalue()
+        self.assertIn('dashboard: HTTP 200', output)
+        self.assertIn('fraction_list: HTTP 200', output)
+        self.assertEqual(Patient.objects.count(), 0)
+        self.assertFalse(User.objects.filter(username='explain-queries').exists())
+
+
+class PatientSearchTests(TestCase):
+    """Тести повнотекстового пошуку пацієнтів"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='searchuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.login(username='searchuser', password='testpass123')
+        self.shevchenko = Patient.objects.create(
+            last_name='Шевченко', first_name='Олена', middle_name='Петрівна',
+            diagnosis='Рак молочної залози', ambulatory_card_id='2025-9246582'
+        )
+        self.koval = Patient.objects.create(
+            last_name='Коваль', first_name='Іван', middle_name='Шевченкович',
+            diagnosis='Рак легені'
+        )
+    
+    def test_cyrillic_case_insensitive_prefix(self):
+        """Пошук не залежить від регістру кирилиці та працює за префіксом"""
+        from .search import find_patients
+        
+        self.assertEqual(list(find_patients('шевч')), [self.shevchenko, self.koval])
+        self.assertEqual(list(find_patients('ОЛЕНА шевченко')), [self.shevchenko])
+    
+    def test_surname_ranked_above_middle_name(self):
+        """Збіг у прізвищі релевантніший за збіг у по батькові"""
+        from .search import find_patients
+        
+        results = list(find_patients('Шевченко'))
+        self.assertEqual(results[0], self.shevchenko)
+    
+    def test_search_by_card_id_and_diagnosis(self):
+        """Пошук за номером амбулаторної карти та діагнозом"""
+        from .search import find_patients
+        
+        self.assertEqual(list(find_patients('2025-9246582')), [self.shevchenko])
+        self.assertEqual(list(find_patients('легені')), [self.koval])
+    
+    def test_index_follows_updates_and_deletes(self):
+        """Індекс оновлюється при зміні та видаленні пацієнта"""
+        from .search import find_patients
+        
+        Patient.objects.filter(pk=self.koval.pk).update(last_name='Бондар')
+        self.assertEqual(list(find_patients('бондар')), [self.koval])
+        self.assertEqual(list(find_patients('коваль')), [])
+        
+        Patient.objects.filter(pk=self.koval.pk).delete()
+        self.assertEqual(list(find_patients('бондар')), [])
+    
+    def test_search_view(self):
+        """Сторінка пошуку показує знайдених пацієнтів"""
+        response = self.client.get(reverse('search_patients'), {'q': 'коваль'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Коваль')
+        self.assertNotContains(response, 'Шевченко Олена')
+
+
+class PatientAutocompleteTests(TestCase):
+    """Тести in-memory автодоповнення пацієнтів"""
+    
+    def setUp(self):
+        from .autocomplete import patient_index
+        patient_index.built_at = None
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='autouser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.login(username='autouser', password='testpass123')
+        self.shevchenko = Patient.objects.create(
+            last_name='Шевченко', first_name='Олена', ambulatory_card_id='2025-9246582'
+        )
+        self.shevchuk = Patient.objects.create(last_name='Шевчук', first_name='Іван')
+        self.koval = Patient.objects.create(last_name='Коваль', first_name='Ганна')
+    
+    def tearDown(self):
+        from .autocomplete import patient_index
+        patient_index.built_at = None
+    
+    def names(self, query, limit=10):
+        from .autocomplete import autocomplete
+        return [item['name'] for item in autocomplete(query, limit)]
+    
+    def test_prefix_match_by_surname_and_card(self):
+        """Збіг за префіксом прізвища, прізвища з ім'ям та номера карти"""
+        self.assertEqual(self.names('ШЕВ'), ['Шевченко Олена', 'Шевчук Іван'])
+        self.assertEqual(self.names('шевчук і'), ['Шевчук Іван'])
+        self.assertEqual(self.names('2025-92'), ['Шевченко Олена'])
+        self.assertEqual(self.names('шев', limit=1), ['Шевченко Олена'])
+        self.assertEqual(self.names(''), [])
+    
+    def test_no_queries_after_index_built(self):
+        """Після побудови індексу запити не звертаються до бази"""
+        self.names('к')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('ков'), ['Коваль Ганна'])
+    
+    def test_incremental_update_on_save_and_delete(self):
+        """Збереження та видалення пацієнта оновлюють побудований індекс"""
+        self.names('к')
+        self.koval.last_name = 'Бондар'
+        self.koval.save()
+        Patient.objects.create(last_name='Бойко', first_name='Петро')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('ков'), [])
+            self.assertEqual(self.names('бо'), ['Бойко Петро', 'Бондар Ганна'])
+        
+        self.koval.delete()
+        self.assertEqual(self.names('бо'), ['Бойко Петро'])
+    
+    def test_json_endpoint(self):
+        """JSON-ендпоінт повертає id, ПІБ та номер карти"""
+        response = self.client.get(reverse('patient_autocomplete'), {'q': 'шевч', 'limit': 'x'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], [self.shevchenko.pk, self.shevchuk.pk])
+        self.assertEqual(results[0]['card'], '2025-9246582')
+
+
+class BulkDischargeRecalculationTests(TestCase):
+    """Тести set-based перерахунку дат виписки"""
+    
+    def setUp(self):
+        self.today = date.today()
+        self.stale = Patient.objects.create(last_name='Застаріла', first_name='Дата')
+        self.missing = Patient.objects.create(last_name='Без', first_name='Дати')
+        self.current = Patient.objects.create(last_name='Актуальна', first_name='Дата')
+        self.no_fractions = Patient.objects.create(
+            last_name='Без', first_name='Фракцій', discharge_date=self.today
+        )
+        for patient, days in [(self.stale, [1, 5]), (self.missing, [2, 3]), (self.current, [4])]:
+            FractionHistory.objects.bulk_create([
+                FractionHistory(patient=patient, date=self.today + timedelta(days=d), dose=2.0)
+                for d in days
+            ])
+        Patient.objects.filter(pk=self.stale.pk).update(discharge_date=self.today)
+        Patient.objects.filter(pk=self.current.pk).update(discharge_date=self.today + timedelta(days=4))
+    
+    def test_reports_only_changed_rows(self):
+        """Повертаються лише пацієнти, у яких дата виписки змінилась"""
+        from .services import bulk_recalculate_discharge_dates
+        
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            changes = bulk_recalculate_discharge_dates()
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(statements), 2)
+        self.assertEqual(changes, [
+            (self.stale.pk, self.today, self.today + timedelta(days=5)),
+            (self.missing.pk, None, self.today + timedelta(days=3)),
+        ])
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.discharge_date, self.today + timedelta(days=5))
+        self.no_fractions.refresh_from_db()
+        self.assertEqual(self.no_fractions.discharge_date, self.today)
+        
+        # Повторний запуск нічого не змінює
+        self.assertEqual(bulk_recalculate_discharge_dates(), [])
+    
+    def test_dry_run_and_patient_filter(self):
+        """Dry-run нічого не зберігає; фільтр обмежує вибраними пацієнтами"""
+        from .services import bulk_recalculate_discharge_dates
+        
+        changes = bulk_recalculate_discharge_dates([self.missing.pk], dry_run=True)
+        self.assertEqual(changes, [(self.missing.pk, None, self.today + timedelta(days=3))])
+        self.missing.refresh_from_db()
+        self.assertIsNone(self.missing.discharge_date)
+        self.assertEqual(bulk_recalculate_discharge_dates([]), [])
+    
+    def test_queryset_and_batched_ids(self):
+        """QuerySet передається підзапитом, довгий список id - пакетами"""
+        from unittest.mock import patch
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services import bulk_recalculate_discharge_dates
+        
+        expected = [(self.missing.pk, None, self.today + timedelta(days=3))]
+        with CaptureQueriesContext(connection) as queries:
+            changes = bulk_recalculate_discharge_dates(
+                Patient.objects.filter(last_name=self.missing.last_name), dry_run=True
+            )
+        self.assertEqual(changes, expected)
+        self.assertTrue(any('IN (SELECT' in q['sql'] for q in queries))
+        
+        with patch('patients.services.DISCHARGE_BATCH_SIZE', 2):
+            changes = bulk_recalculate_discharge_dates(
+                [self.stale.pk, self.current.pk, self.missing.pk, self.no_fractions.pk]
+            )
+        self.assertEqual([pk for pk, _, _ in changes], sorted([self.stale.pk, self.missing.pk]))
+        self.missing.refresh_from_db()
+        self.assertEqual(self.missing.discharge_date, self.today + timedelta(days=3))
+    
+    def test_admin_action_for_all_patients(self):
+        """Дія адмінки "для всіх" не розгортає вибірку у список параметрів"""
+        from django.contrib.admin import helpers
+        
+        admin = User.objects.create_user(
+            username='dischargeadmin', password='testpass123', role='admin', approved=True,
+            is_staff=True, is_superuser=True
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.post(reverse('admin:patients_patient_changelist'), {
+            'action': 'update_discharge_dates',
+            helpers.ACTION_CHECKBOX_NAME: [self.stale.pk],
+            'select_across': '1',
+        }, secure=True, follow=True)
+        self.assertContains(response, 'Успішно оновлено дати виписки для 2 пацієнтів')
+    
+    def test_management_command(self):
+        """Команда update_discharge_dates використовує масовий перерахунок"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        out = StringIO()
+        call_command('update_discharge_dates', '--dry-run', stdout=out)
+        self.assertIn('DRY RUN: Було б оновлено 2 пацієнтів', out.getvalue())
+        
+        out = StringIO()
+        call_command('update_discharge_dates', stdout=out)
+        self.assertIn('Успішно оновлено 2 пацієнтів', out.getvalue())
+        self.missing.refresh_from_db()
+        self.assertEqual(self.missing.discharge_date, self.today + timedelta(days=3))
+
+
+class CloseFractionDayTests(TestCase):
+    """Тести закриття дня фракцій"""
+    
+    def setUp(self):
+        self.today = date.today()
+        self.patient = Patient.objects.create(last_name='Денний', first_name='Пацієнт')
+        self.other = Patient.objects.create(last_name='Інший', first_name='Пацієнт')
+        self.overdue, self.delivered_past, self.today_open, self.tomorrow = FractionHistory.objects.bulk_create([
+            FractionHistory(patient=self.patient, date=self.today - timedelta(days=2), dose=2.0),
+            FractionHistory(patient=self.patient, date=self.today - timedelta(days=1), dose=2.0, delivered=True),
+            FractionHistory(patient=self.patient, date=self.today, dose=2.0),
+            FractionHistory(patient=self.patient, date=self.today + timedelta(days=1), dose=2.0),
+        ])
+        self.other_today = FractionHistory.objects.create(
+            patient=self.other, date=self.today, dose=2.0, delivered=True
+        )
+    
+    def test_transitions_and_change_sets(self):
+        """Сьогоднішні фракції підтверджуються, прострочені - пропущені"""
+        from .services import close_fraction_day
+        
+        changes = close_fraction_day()
+        self.assertEqual(changes, {
+            self.patient.pk: {'confirmed': [self.today_open.pk], 'missed': [self.overdue.pk]},
+            self.other.pk: {'confirmed': [self.other_today.pk], 'missed': []},
+        })
+        self.overdue.refresh_from_db()
+        self.today_open.refresh_from_db()
+        self.tomorrow.refresh_from_db()
+        self.assertTrue(self.overdue.is_missed)
+        self.assertTrue(self.today_open.delivered and self.today_open.confirmed_by_doctor)
+        self.assertFalse(self.tomorrow.is_missed)
+        self.assertIsNone(self.tomorrow.delivered)
+        
+        summary = FractionSummary.objects.get(patient=self.patient)
+        self.assertEqual(summary.missed, 1)
+        self.assertEqual(summary.delivered, 2)
+    
+    def test_rerun_is_noop(self):
+        """Повторне закриття дня нічого не змінює"""
+        from .services import close_fraction_day
+        
+        close_fraction_day()
+        self.assertEqual(close_fraction_day(), {})
+    
+    def test_command(self):
+        """Команда close_fraction_day виводить підсумок"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        out = StringIO()
+        call_command('close_fraction_day', date=self.today.isoformat(), stdout=out)
+        self.assertIn('Підтверджено фракцій: 2, позначено пропущеними: 1', out.getvalue())
+
+
+class PatientDirtyFieldsTests(TestCase):
+    """Тести відстеження змінених полів пацієнта"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='dirtyuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.login(username='dirtyuser', password='testpass123')
+        self.patient = Patient.objects.create(
+            last_name='Змінений', first_name='Пацієнт', ambulatory_card_id='1111/2025',
+            treatment_start_date=date.today(), total_fractions=3, dose_per_fraction=2.0
+        )
+    
+    def test_changed_fields(self):
+        """Змінені поля визначаються відносно значень з БД"""
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(patient.get_changed_fields(), [])
+        patient.last_blood_test_date = date.today()
+        patient.notes = 'Примітка'
+        self.assertEqual(patient.get_changed_fields(), ['last_blood_test_date', 'notes'])
+        patient.save()
+        self.assertEqual(patient.get_changed_fields(), [])
+        self.assertIsNone(Patient(last_name='Новий').get_changed_fields())
+    
+    def test_single_field_save_is_one_update(self):
+        """Зміна одного поля - один UPDATE без перевірок унікальності та фракцій"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.last_blood_test_date = date.today()
+        with CaptureQueriesContext(connection) as queries:
+            patient.save()
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+        self.assertIn('last_blood_test_date', queries[0]['sql'])
+        self.assertNotIn('last_name', queries[0]['sql'])
+    
+    def test_unchanged_save_skips_query(self):
+        """Збереження без змін не виконує запитів"""
+        patient = Patient.objects.get(pk=self.patient.pk)
+        with self.assertNumQueries(0):
+            patient.save()
+    
+    def test_confirm_blood_test_view(self):
+        """Підтвердження аналізу крові оновлює лише дату аналізу"""
+        Patient.objects.filter(pk=self.patient.pk).update(last_name='Інше прізвище')
+        self.client.post(reverse('confirm_blood_test', kwargs={'patient_id': self.patient.pk}), secure=True)
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertEqual(patient.last_blood_test_date, date.today())
+        self.assertEqual(patient.last_name, 'Інше прізвище')
+    
+    def test_treatment_change_triggers_generation(self):
+        """Зміна параметрів лікування запускає генерацію фракцій"""
+        patient = Patient.objects.create(last_name='Без', first_name='Фракцій')
+        self.assertFalse(patient.fractions.exists())
+        patient.treatment_start_date = date.today()
+        patient.total_fractions = 2
+        patient.dose_per_fraction = 2.0
+        patient.save()
+        self.assertEqual(patient.fractions.count(), 2)
+    
+    def test_changed_card_id_still_validated(self):
+        """Формат номера карти перевіряється, якщо номер змінився"""
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.ambulatory_card_id = 'ABC'
+        with self.assertRaises(ValidationError):
+            patient.save()
+    
+    def test_duplicate_card_on_update_form(self):
+        """Дублікат номера карти при редагуванні показується як помилка поля"""
+        other = Patient.objects.create(last_name='Інший', first_name='Пацієнт')
+        response = self.client.post(reverse('patient_update', kwargs={'pk': other.pk}), {
+            'last_name': 'Інший', 'first_name': 'Пацієнт', 'ambulatory_card_id': '1111/2025'
+        }, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ambulatory_card_id', response.context['form'].errors)
+    
+    def test_other_integrity_error_not_reported_as_duplicate(self):
+        """Інше порушення цілісності, навіть зі згадкою поля, не маскується під дублікат"""
+        from unittest.mock import patch
+        
+        form = PatientForm(data={'last_name': 'Новий', 'first_name': 'Пацієнт', 'ambulatory_card_id': '2222/2025'})
+        self.assertTrue(form.is_valid(), form.errors)
+        error = IntegrityError('CHECK constraint failed: ambulatory_card_id')
+        with patch('django.forms.ModelForm.save', side_effect=error):
+            with self.assertRaises(IntegrityError):
+                form.save()
+
+
+class SessionRefreshTests(TestCase):
+    """Тести продовження сесій без запису на кожен запит"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='sessionuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.post(reverse('login'), {'username': 'sessionuser', 'password': 'testpass123'}, secure=True)
+    
+    def session_writes(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, secure=True)
+        return [
+            q['sql'] for q in queries
+            if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')
+        ]
+    
+    def test_read_only_page_does_not_write_session(self):
+        """Перегляд сторінки не оновлює django_session"""
+        from .middleware import SESSION_REFRESHED_KEY
+        
+        self.assertIn(SESSION_REFRESHED_KEY, self.client.session)
+        self.assertEqual(self.session_writes(reverse('patient_list')), [])
+    
+    def test_session_refreshed_near_expiry(self):
+        """Сесія продовжується, коли до завершення лишилось мало часу"""
+        import time
+        from django.conf import settings
+        from .middleware import SESSION_REFRESHED_KEY
+        
+        session = self.client.session
+        session[SESSION_REFRESHED_KEY] = int(time.time()) - settings.SESSION_COOKIE_AGE + 60
+        session.save()
+        self.assertNotEqual(self.session_writes(reverse('patient_list')), [])
+        self.assertAlmostEqual(self.client.session[SESSION_REFRESHED_KEY], int(time.time()), delta=5)
+    
+    def test_purge_sessions_deletes_only_expired(self):
+        """purge_sessions видаляє лише прострочені сесії пакетами"""
+        from django.contrib.sessions.models import Session
+        from django.core.management import call_command
+        from django.utils import timezone
+        from io import StringIO
+        
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i}', session_data='', expire_date=expired) for i in range(5)
+        ])
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertIn('Видалено прострочених сесій: 5', out.getvalue())
+        self.assertEqual(Session.objects.count(), 1)
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FragmentCacheTests(TestCase):
+    """Тести кешування фрагментів сторінок з версіями пацієнтів"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='cacheuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.login(username='cacheuser', password='testpass123')
+        self.patient = Patient.objects.create(last_name='Кешований', first_name='Пацієнт')
+        FractionHistory.objects.bulk_create([
+            FractionHistory(patient=self.patient, date=date.today() + timedelta(days=i), dose=2.0)
+            for i in range(3)
+        ])
+        refresh_fraction_summaries([self.patient.pk])
+    
+    def get(self, name, **kwargs):
+        return self.client.get(reverse(name, kwargs=kwargs or None), secure=True)
+    
+    def test_version_bumps_on_changes(self):
+        """Версія змінюється при збереженні пацієнта, фракцій та МВТН"""
+        from .cache_versions import patient_version
+        
+        versions = [patient_version(self.patient.pk)]
+        self.assertEqual(patient_version(self.patient.pk), versions[0])
+        
+        self.patient.notes = 'Нова примітка'
+        self.patient.save()
+        versions.append(patient_version(self.patient.pk))
+        
+        MedicalIncapacity.objects.create(patient=self.patient, mvt_number='1')
+        versions.append(patient_version(self.patient.pk))
+        
+        FractionHistory.objects.filter(patient=self.patient).update(delivered=True)
+        refresh_fraction_summaries([self.patient.pk])
+        versions.append(patient_version(self.patient.pk))
+        
+        self.assertEqual(len(set(versions)), 4)
+    
+    def test_fraction_list_skips_fraction_query_when_cached(self):
+        """Закешована картка пацієнта не завантажує фракції"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        def fraction_selects():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get('fraction_list')
+            self.assertContains(response, 'Кешований Пацієнт')
+            return [q['sql'] for q in queries if q['sql'].startswith('SELECT "fraction_history"')]
+        
+        self.assertEqual(len(fraction_selects()), 1)
+        self.assertEqual(fraction_selects(), [])
+    
+    def test_bulk_update_invalidates_fraction_list(self):
+        """Масове підтвердження фракцій одразу видно на закешованій сторінці"""
+        self.assertContains(self.get('fraction_list'), '0/3')
+        fraction_ids = list(FractionHistory.objects.values_list('pk', flat=True))
+        self.client.post(reverse('confirm_fractions_nurse'), {'fraction_ids': fraction_ids}, secure=True)
+        self.assertContains(self.get('fraction_list'), '3/3')
+    
+    def test_patient_detail_shows_new_incapacity(self):
+        """Новий лікарняний одразу з'являється на сторінці пацієнта"""
+        self.assertContains(self.get('patient_detail', pk=self.patient.pk), 'Лікарняних листів немає')
+        MedicalIncapacity.objects.create(patient=self.patient, mvt_number='7777777')
+        response = self.get('patient_detail', pk=self.patient.pk)
+        self.assertContains(response, '7777777')
+    
+    def test_patient_list_row_follows_rename(self):
+        """Рядок списку пацієнтів оновлюється після зміни прізвища"""
+        self.assertContains(self.get('patient_list'), 'Кешований')
+        self.patient.last_name = 'Перейменований'
+        self.patient.save()
+        response = self.get('patient_list')
+        self.assertContains(response, 'Перейменований')
+        self.assertNotContains(response, 'Кешований')
+
+
+class ViewQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Кожен view з patients/urls.py вкладається у свій бюджет запитів"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        from .seed import seed_dataset
+        
+        seed_dataset(patients=150, fractions_per_patient=10, incapacities=100)
+        cls.user = User.objects.create_user(
+            username='budgetuser', password='testpass123', role='admin', approved=True, is_staff=True
+        )
+        cls.nurse = User.objects.create_user(username='budgetnurse', password='testpass123', role='nurse', approved=False)
+        cls.patient = Patient.objects.filter(
+            fractions__isnull=False, medical_incapacities__isnull=False
+        ).order_by('pk').first()
+        cls.fraction = cls.patient.fractions.order_by('pk').first()
+        cls.incapacity = cls.patient.medical_incapacities.order_by('pk').first()
+    
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def requests(self):
+        return route_requests(self.patient, self.fraction, self.incapacity, self.nurse)
+    
+    def test_every_route_has_budget(self):
+        """Кожен маршрут patients/urls.py має явний бюджет і перевіряється тут"""
+        from django.conf import settings
+        from .urls import urlpatterns
+        
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - set(settings.QUERY_BUDGETS), set())
+        self.assertEqual(names - {name for name, _, _, _ in self.requests()}, set())
+    
+    def check_budgets(self, label):
+        from django.conf import settings
+        
+        for name, method, url, data in self.requests():
+            with self.subTest(view=name, cache=label):
+                with self.assertQueryBudget(settings.QUERY_BUDGETS[name]):
+                    response = getattr(self.client, method)(url, data, secure=True)
+                self.assertLess(response.status_code, 500)
+    
+    def test_views_within_query_budget(self):
+        """Кількість запитів не перевищує бюджет на ~150 пацієнтах і 1500 фракціях"""
+        # Налаштування за замовчуванням без Redis: кеш у БД, фрагменти вимкнено
+        self.check_budgets('db')
+    
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_views_within_query_budget_with_fragment_cache(self):
+        """Бюджети тримаються і з кешем фрагментів - як порожнім, так і заповненим"""
+        from django.core.cache import caches
+        
+        caches['fragments'].clear()
+        self.check_budgets('cold')
+        self.check_budgets('warm')
+    
+    @override_settings(QUERY_BUDGETS={'patient_list': 1})
+    def test_middleware_logs_exceeded_budget(self):
+        """Middleware попереджає в лог про перевищення бюджету"""
+        with self.assertLogs('patients.query_budget', level='WARNING') as logs:
+            self.client.get(reverse('patient_list'), secure=True)
+        self.assertIn('Query budget exceeded for patient_list', logs.output[0])
+    
+    def test_recorder_reports_duplicates(self):
+        """Повторені шаблони SQL (N+1) видно у звіті"""
+        from .query_budget import QueryRecorder
+        
+        with QueryRecorder() as recorder:
+            for patient in Patient.objects.all()[:3]:
+                list(patient.fractions.all())
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.summary()['duplicates'], 2)
+
+
+class BenchmarkCommandTests(TestCase):
+    """Команда benchmark міряє кожен маршрут і пише JSON"""
+    
+    def test_percentile_nearest_rank(self):
+        values = [5, 1, 4, 2, 3, 10, 9, 8, 7, 6]
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+    
+    def test_benchmark_writes_report_and_rolls_back(self):
+        import json
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        from .urls import urlpatterns
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'bench.json'
+            call_command(
+                'benchmark', patients=20, fractions_per_patient=5, incapacities=10,
+                iterations=2, warmup=0, output=str(output), stdout=StringIO(),
+            )
+            report = json.loads(output.read_text(encoding='utf-8'))
+        
+        self.assertEqual(report['dataset']['patients'], 20)
+        self.assertEqual(report['dataset']['fractions'], 100)
+        self.assertEqual(set(report['views']), {pattern.name for pattern in urlpatterns})
+        for name, result in report['views'].items():
+            with self.subTest(view=name):
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+                self.assertTrue(all(status < 500 for status in result['status']))
+                self.assertGreater(result['peak_memory_kb'], 0)
+        # Наповнення і службові користувачі відкочені
+        self.assertFalse(Patient.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark').exists())
+
+
+class LoadStatsTests(TestCase):
+    """Агрегація результатів навантажувального тесту"""
+    
+    def test_report_counts_errors_and_histogram(self):
+        from .loadtest import LoadStats
+        
+        stats = LoadStats()
+        for elapsed in [5, 20, 30, 80, 400]:
+            stats.record('fraction_list', 200, elapsed)
+        stats.record('fraction_list', 500, 12000, error=True)
+        
+        report = stats.report(duration=2)
+        result = report['endpoints']['fraction_list']
+        self.assertEqual(report['requests'], 6)
+        self.assertEqual(result['throughput_rps'], 3)
+        self.assertEqual(result['error_rate'], round(1 / 6, 4))
+        self.assertEqual(result['statuses'], {200: 5, 500: 1})
+        self.assertEqual(result['histogram_ms']['<=10'], 1)
+        self.assertEqual(result['histogram_ms']['<=25'], 1)
+        self.assertEqual(result['histogram_ms']['<=500'], 1)
+        self.assertEqual(result['histogram_ms']['>10000'], 1)
+        self.assertEqual(sum(result['histogram_ms'].values()), 6)
+
+
+# Потоки live server ділять одне з'єднання SQLite, тож лічильник запитів
+# middleware бачить запити сусідніх потоків - бюджети тут вимкнено
+@override_settings(QUERY_BUDGETS={}, QUERY_BUDGET_DEFAULT=None)
+class LoadTestCommandTests(LiveServerTestCase):
+    """Команда loadtest входить як синтетичні користувачі і навантажує живий сервер"""
+    
+    def test_loadtest_against_live_server(self):
+        import json
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        
+        patient = Patient.objects.create(
+            last_name='Навантаження', first_name='Тест',
+            treatment_start_date=date.today(), total_fractions=5, dose_per_fraction=2.0,
+        )
+        generate_fractions_for_patient(patient)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'load.json'
+            call_command(
+                'loadtest', url=self.live_server_url, nurses=2, doctors=1,
+                duration=2, ramp_up=0, think_time=0.05, create_users=True,
+                output=str(output), stdout=StringIO(),
+            )
+            report = json.loads(output.read_text(encoding='utf-8'))
+        
+        self.assertEqual(report['users'], {'nurse': 2, 'doctor': 1})
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(report['error_rate'], 0)
+        self.assertIn('fraction_list', report['endpoints'])
+        self.assertIn('confirm_fractions_nurse', report['endpoints'])
+        self.assertTrue(User.objects.filter(username='loadtest-nurse-0', approved=True).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    """Async-версії дашборду, картки пацієнта та списку стаціонару"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import AsyncClient
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='asyncuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client = AsyncClient()
+        self.patient = Patient.objects.create(
+            last_name='Асинхронний', first_name='Пацієнт', inpatient_status='стаціонарно', ward_number=7,
+            treatment_start_date=date.today() - timedelta(days=20),
+        )
+        FractionHistory.objects.create(patient=self.patient, date=date.today(), dose=2.0)
+        MedicalIncapacity.objects.create(patient=self.patient, mvt_number='MVT-77')
+        refresh_fraction_summaries([self.patient.pk])
+    
+    async def test_async_views_render_under_asgi(self):
+        """Сторінки віддаються ASGI-обробником"""
+        await self.client.aforce_login(self.user)
+        response = await self.client.get(reverse('dashboard'), secure=True)
+        self.assertEqual(response.context['in_treatment_count'], 1)
+        self.assertEqual([n['patient'].pk for n in response.context['notifications']], [self.patient.pk])
+        response = await self.client.get(reverse('inpatient_list'), secure=True)
+        self.assertContains(response, 'Асинхронний Пацієнт')
+        response = await self.client.get(reverse('patient_detail', args=[self.patient.pk]), secure=True)
+        self.assertContains(response, 'MVT-77')
+        response = await self.client.get(reverse('patient_detail', args=[99999]), secure=True)
+        self.assertEqual(response.status_code, 404)
+    
+    @override_settings(DEBUG=True)
+    def test_project_middleware_runs_async_under_asgi(self):
+        """Під ASGI власні middleware не обгортаються sync_to_async"""
+        from unittest.mock import patch
+        from django.core.handlers.asgi import ASGIHandler
+        
+        with patch('django.core.handlers.base.logger') as logger:
+            ASGIHandler()
+        adapted = [str(call.args) for call in logger.debug.call_args_list]
+        self.assertFalse([line for line in adapted if 'patients.' in line], adapted)
+    
+    @override_settings(DEBUG=True)
+    async def test_asgi_request_counts_queries_and_refreshes_session(self):
+        """Запит через ASGI-обробник рахує запити (з потоками gather_queries) і продовжує сесію"""
+        import time
+        from django.conf import settings
+        from .middleware import SESSION_REFRESHED_KEY
+        
+        await self.client.aforce_login(self.user)
+        session = await self.client.asession()
+        await session.aset(SESSION_REFRESHED_KEY, int(time.time()) - settings.SESSION_COOKIE_AGE + 60)
+        await session.asave()
+        
+        response = await self.client.get(reverse('dashboard'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        session = await self.client.asession()
+        self.assertAlmostEqual(await session.aget(SESSION_REFRESHED_KEY), int(time.time()), delta=5)
+    
+    async def test_anonymous_gets_unauthorized_page(self):
+        response = await self.client.get(reverse('dashboard'), secure=True)
+        self.assertTemplateUsed(response, 'patients/unauthorized.html')
+    
+    def test_detail_skips_lists_when_fragments_cached(self):
+        """Закешовані фрагменти картки не завантажують фракції та МВТН"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('patient_detail', args=[self.patient.pk])
+        
+        def list_selects():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, secure=True)
+            self.assertContains(response, 'MVT-77')
+            return [
+                q['sql'] for q in queries
+                if q['sql'].startswith(('SELECT "fraction_history"', 'SELECT "medical_incapacity"'))
+            ]
+        
+        self.assertEqual(len(list_selects()), 2)
+        self.assertEqual(list_selects(), [])
+    
+    def test_detail_renders_lists_when_fragment_evicted(self):
+        """Фрагмент, витіснений після перевірки кешу, рендериться з даними, а не порожнім"""
+        from unittest.mock import patch
+        
+        client = Client()
+        client.force_login(self.user)
+        # Перевірка каже "закешовано", але в кеші фрагментів немає
+        with patch('patients.views.cached_fragment_ids', return_value={self.patient.pk}):
+            response = client.get(reverse('patient_detail', args=[self.patient.pk]), secure=True)
+        self.assertContains(response, 'MVT-77')
+        self.assertNotContains(response, 'Історія фракцій порожня.')
+    
+    def test_gather_queries_runs_concurrently(self):
+        """Поза транзакцією на PostgreSQL функції виконуються паралельно, порядок результатів зберігається"""
+        import time
+        from unittest.mock import patch
+        from asgiref.sync import async_to_sync
+        from .async_queries import gather_queries
+        
+        def slow(value):
+            def run():
+                time.sleep(0.2)
+                return value
+            return run
+        
+        with patch('patients.async_queries.concurrent_queries_enabled', return_value=True):
+            start = time.perf_counter()
+            results = async_to_sync(gather_queries)(slow(1), slow(2), slow(3))
+            elapsed = time.perf_counter() - start
+        self.assertEqual(results, [1, 2, 3])
+        self.assertLess(elapsed, 0.5)
+    
+    def test_gather_queries_counted_by_recorder(self):
+        """Запити з потоків пулу (власні з'єднання) потрапляють у QueryRecorder"""
+        from unittest.mock import patch
+        from asgiref.sync import async_to_sync
+        from django.db import connection
+        from .async_queries import gather_queries
+        from .query_budget import QueryRecorder
+        
+        def select(value):
+            def run():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT %s', [value])
+                    return cursor.fetchone()[0]
+            return run
+        
+        with patch('patients.async_queries.concurrent_queries_enabled', return_value=True):
+            with QueryRecorder() as recorder:
+                results = async_to_sync(gather_queries)(select(1), select(2), select(3))
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(recorder.count, 3)
+
+
+class WorkerConfigTests(TestCase):
+    """Розмір пулу воркерів gunicorn та прогрів процесу"""
+    
+    def load_config(self, **env):
+        import runpy
+        from unittest.mock import patch
+        from django.conf import settings
+        
+        with patch.dict('os.environ', env):
+            return runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+    
+    def test_worker_count_bounded_by_cpu_and_memory(self):
+        worker_count = self.load_config()['worker_count']
+        self.assertEqual(worker_count(cpus=2, memory_mb=None, worker_memory_mb=150), 5)
+        self.assertEqual(worker_count(cpus=8, memory_mb=512, worker_memory_mb=150), 2)
+        self.assertEqual(worker_count(cpus=4, memory_mb=100, worker_memory_mb=150), 1)
+    
+    def test_fractional_cpu_quota_limits_workers(self):
+        """Квота cgroup менше одного CPU дає 1 CPU, а не всі CPU хоста"""
+        import tempfile
+        from pathlib import Path
+        
+        config = self.load_config()
+        with tempfile.TemporaryDirectory() as directory:
+            cpu_max = Path(directory) / 'cpu.max'
+            for content, expected in [('50000 100000', 1), ('150000 100000', 2), ('max 100000', None)]:
+                with self.subTest(cpu_max=content):
+                    cpu_max.write_text(content + '\n')
+                    self.assertEqual(config['cpu_quota'](cpu_max), expected)
+            
+            cpu_max.write_text('50000 100000\n')
+            self.assertEqual(config['available_cpus'](cpu_max), 1)
+    
+    def test_env_selects_worker_class_and_app(self):
+        config = self.load_config(GUNICORN_WORKER_CLASS='gthread', GUNICORN_WORKERS='3')
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertEqual(config['wsgi_app'], 'cms_django.wsgi:application')
+        self.assertEqual((config['workers'], config['threads']), (3, 4))
+        self.assertTrue(config['preload_app'])
+        
+        config = self.load_config(GUNICORN_WORKER_CLASS='uvicorn')
+        self.assertEqual(config['worker_class'], 'uvicorn_worker.UvicornWorker')
+        self.assertEqual(config['wsgi_app'], 'cms_django.asgi:application')
+        self.assertGreaterEqual(config['workers'], 1)
+    
+    def test_warm_process_compiles_urls_and_templates(self):
+        from cms_django.warmup import warm_database, warm_process
+        
+        stats = warm_process()
+        self.assertGreater(stats['urls'], 0)
+        self.assertGreater(stats['templates'], 10)
+        self.assertEqual(warm_database(), 1)
+
+
+class ExportTests(TestCase):
+    """Потоковий експорт пацієнтів та фракцій у CSV/XLSX"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='exportuser', password='testpass123', role='doctor', approved=True
+        )
+        self.client.force_login(self.user)
+        today = date.today()
+        self.treated = Patient.objects.create(
+            last_name='Лікований', first_name='Пацієнт', ambulatory_card_id='0-900',
+            treatment_start_date=today - timedelta(days=5),
+        )
+        self.waiting = Patient.objects.create(
+            last_name='Очікуючий', first_name='Пацієнт', ct_simulation_date=today,
+        )
+        self.archived = Patient.objects.create(
+            last_name='Архівний', first_name='Пацієнт',
+            treatment_start_date=today - timedelta(days=60), discharge_date=today - timedelta(days=30),
+        )
+        FractionHistory.objects.bulk_create([
+            FractionHistory(patient=self.treated, date=today + timedelta(days=i), dose=2.0, delivered=i == 0)
+            for i in range(3)
+        ] + [FractionHistory(patient=self.archived, date=today - timedelta(days=40), dose=2.0)])
+    
+    def read_csv(self, response):
+        import csv
+        
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('﻿'))
+        return list(csv.reader(content[1:].splitlines()))
+    
+    def test_patient_export_matches_list_filters(self):
+        url = reverse('patient_export')
+        rows = self.read_csv(self.client.get(url, secure=True))
+        self.assertEqual(rows[0][0], 'Прізвище')
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ['Лікований', 'Очікуючий'])
+        
+        rows = self.read_csv(self.client.get(url, {'filter': 'in-treatment'}, secure=True))
+        self.assertEqual([row[:4] for row in rows[1:]], [['Лікований', 'Пацієнт', '', '0-900']])
+        
+        rows = self.read_csv(self.client.get(url, {'filter': 'archive'}, secure=True))
+        self.assertEqual([row[0] for row in rows[1:]], ['Архівний'])
+    
+    def test_fraction_export_for_patient(self):
+        response = self.client.get(reverse('fraction_export'), {'patient': self.treated.pk}, secure=True)
+        self.assertIn('attachment; filename="fractions-', response['Content-Disposition'])
+        rows = self.read_csv(response)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[6] for row in rows[1:]], ['так', 'ні', 'ні'])
+        
+        rows = self.read_csv(self.client.get(reverse('fraction_export'), secure=True))
+        self.assertEqual(len(rows), 5)
+    
+    def test_xlsx_export(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        
+        response = self.client.get(reverse('patient_export'), {'format': 'xlsx', 'filter': 'archive'}, secure=True)
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.values)
+        self.assertEqual(rows[0][0], 'Прізвище')
+        self.assertEqual(rows[1][0], 'Архівний')
+        self.assertEqual(rows[1][15].date(), date.today() - timedelta(days=30))
+    
+    async def test_asgi_streams_async_iterator(self):
+        from django.test import AsyncClient
+        
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('fraction_export'), secure=True)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 5)
+    
+    def test_csv_is_generated_lazily(self):
+        """Рядки читаються пакетами - пам'ять не росте з обсягом експорту"""
+        from .exports import FRACTION_COLUMNS, csv_chunks
+        
+        consumed = []
+        
+        def rows():
+            for index in range(100000):
+                consumed.append(index)
+                yield ('Прізвище', 'Ім\'я', None, None, date.today(), 2.0, True, None, False, False, None, None, None)
+        
+        first_chunk = next(csv_chunks(FRACTION_COLUMNS, rows(), rows_per_chunk=500))
+        self.assertEqual(len(consumed), 500)
+        self.assertEqual(len(first_chunk.splitlines()), 501)
+    
+    def test_export_command(self):
+        import csv
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('export_data', 'fractions', '--filter', 'in-treatment', stdout=out)
+        self.assertEqual(len(list(csv.reader(out.getvalue().splitlines()))), 4)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'patients.csv'
+            call_command('export_data', 'patients', '--all', '--output', str(output), stdout=StringIO())
+            rows = list(csv.reader(output.read_text(encoding='utf-8-sig').splitlines()))
+        self.assertEqual(len(rows), 4)
+
+
+class PatientImportTests(TestCase):
+    """Масовий імпорт пацієнтів з CSV/XLSX"""
+    
+    CSV = (
+        'Прізвище;Ім\'я;№ амбулаторної карти;Початок лікування;Кількість фракцій;РОД, Гр\n'
+        'Перший;Пацієнт;1001/2025;05.01.2026;5;2,0\n'
+        'Другий;Пацієнт;1002/2025;;;\n'
+        'Поганий;Номер;AB-12;;;\n'
+        'Повтор;Пацієнт;1001/2025;;;\n'
+        'Існуючий;Пацієнт;0-777;;;\n'
+        'Погана;Дата;1003/2025;32.01.2026;5;2\n'
+        '\n'
+        ';Без прізвища;1004/2025;;;\n'
+    )
+    
+    def setUp(self):
+        Patient.objects.create(last_name='Вже', first_name='Є', ambulatory_card_id='0-777')
+    
+    def run_import(self, content, dry_run=False, filename='patients.csv'):
+        from io import BytesIO
+        from .importer import import_patients, read_rows
+        
+        data = content.encode('utf-8-sig') if isinstance(content, str) else content
+        return import_patients(read_rows(BytesIO(data), filename), dry_run=dry_run)
+    
+    def test_imported_patients_appear_in_autocomplete(self):
+        """Імпорт в обхід сигналів оновлює вже побудований індекс автодоповнення після коміту"""
+        from .autocomplete import autocomplete, get_index, patient_index
+        
+        self.addCleanup(setattr, patient_index, 'built_at', None)
+        patient_index.built_at = None
+        get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.CSV)
+        self.assertEqual([item['card'] for item in autocomplete('100')], ['1001/2025', '1002/2025'])
+        self.assertEqual([item['name'] for item in autocomplete('друг')], ['Другий Пацієнт'])
+    
+    def test_valid_rows_imported_and_errors_reported(self):
+        result = self.run_import(self.CSV)
+        self.assertEqual(result.rows, 7)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.fractions, 5)
+        self.assertEqual([(line, field) for line, field, _ in result.errors], [
+            (4, 'ambulatory_card_id'),
+            (5, 'ambulatory_card_id'),
+            (6, 'ambulatory_card_id'),
+            (7, 'treatment_start_date'),
+            (9, 'last_name'),
+        ])
+        
+        first = Patient.objects.get(ambulatory_card_id='1001/2025')
+        self.assertEqual(first.dose_per_fraction, 2.0)
+        self.assertEqual(first.fractions.count(), 5)
+        # 05.01.2026 - понеділок: п'ять робочих днів до п'ятниці
+        self.assertEqual(first.discharge_date, date(2026, 1, 9))
+        self.assertEqual(first.fraction_summary.total, 5)
+        self.assertFalse(Patient.objects.get(ambulatory_card_id='1002/2025').fractions.exists())
+        self.assertIn('Рядок,Поле,Помилка', result.error_csv())
+    
+    def test_dry_run_creates_nothing(self):
+        result = self.run_import(self.CSV, dry_run=True)
+        self.assertEqual(result.created, 0)
+        self.assertEqual(len(result.errors), 5)
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertFalse(FractionHistory.objects.exists())
+    
+    def test_field_names_and_xlsx(self):
+        from io import BytesIO
+        from .exports import write_xlsx
+        
+        file = BytesIO()
+        write_xlsx(
+            [('last_name', None), ('treatment_start_date', None), ('total_fractions', None),
+             ('dose_per_fraction', None)],
+            [('Ексель', date(2026, 1, 5), 3, 1.8)],
+            file,
+        )
+        result = self.run_import(file.getvalue(), filename='patients.xlsx')
+        self.assertEqual((result.created, result.fractions, result.errors), (1, 3, []))
+        patient = Patient.objects.get(last_name='Ексель')
+        self.assertEqual(patient.treatment_start_date, date(2026, 1, 5))
+        self.assertEqual(patient.discharge_date, date(2026, 1, 7))
+    
+    def test_import_command(self):
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'patients.csv'
+            path.write_text(self.CSV, encoding='utf-8')
+            errors = Path(tmp) / 'errors.csv'
+            out = StringIO()
+            call_command('import_patients', str(path), '--errors', str(errors), stdout=out)
+            self.assertEqual(len(errors.read_text(encoding='utf-8-sig').splitlines()), 6)
+        self.assertIn('Імпортовано пацієнтів: 2', out.getvalue())
+        self.assertEqual(Patient.objects.count(), 3)
+    
+    def test_admin_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        admin_user = User.objects.create_superuser(username='importadmin', password='testpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:patients_patient_import')
+        self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+        
+        upload = SimpleUploadedFile('patients.csv', self.CSV.encode('utf-8'), content_type='text/csv')
+        response = self.client.post(url, {'file': upload}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertContains(response, 'Повтор номера карти з рядка 2')
+        
+        # Звіт помилок - у самій відповіді, без окремого запиту
+        prefix, content = response.context['errors_csv_url'].split(',', 1)
+        self.assertEqual(prefix, 'data:text/csv;base64')
+        self.assertEqual(len(base64.b64decode(content).decode('utf-8-sig').splitlines()), 6)
+        self.assertContains(response, 'download="import-errors.csv"')
+
+
+class FractionRegenerationTests(TestCase):
+    """Перегенерація курсу мінімальним diff зі збереженням історії"""
+    
+    START = date(2026, 1, 5)  # понеділок
+    TODAY = date(2026, 1, 7)
+    
+    def setUp(self):
+        self.patient = Patient.objects.create(
+            last_name='Перегенерація', first_name='Тест',
+            treatment_start_date=self.START, total_fractions=5, dose_per_fraction=2.0,
+        )
+        self.fractions = list(self.patient.fractions.order_by('date'))
+        FractionHistory.objects.filter(pk=self.fractions[0].pk).update(delivered=True, confirmed_by_doctor=True)
+    
+    def sync(self, total_fractions=5, dose=2.0):
+        from .services import sync_future_fractions
+        return sync_future_fractions(self.patient, self.START, total_fractions, dose, today=self.TODAY)
+    
+    def dates(self):
+        return list(self.patient.fractions.order_by('date').values_list('date', flat=True))
+    
+    def test_unchanged_course_writes_nothing(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            last_date = self.sync()
+        self.assertEqual(last_date, date(2026, 1, 9))
+        writes = [q['sql'] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+    
+    def test_growing_course_only_inserts(self):
+        old_pks = {fraction.pk for fraction in self.fractions}
+        last_date = self.sync(total_fractions=7)
+        self.assertEqual(last_date, date(2026, 1, 13))
+        self.assertEqual(len(self.dates()), 7)
+        self.assertTrue(old_pks <= set(self.patient.fractions.values_list('pk', flat=True)))
+        self.assertEqual(FractionSummary.objects.get(patient=self.patient).total, 7)
+    
+    def test_shrinking_course_keeps_history(self):
+        self.sync(total_fractions=3)
+        self.assertEqual(self.dates(), [date(2026, 1, 5), date(2026, 1, 6), date(2026, 1, 7)])
+        self.assertTrue(self.patient.fractions.get(date=self.START).delivered)
+        # Курс коротший за вже проведене - минулі фракції не видаляються
+        self.sync(total_fractions=1)
+        self.assertEqual(self.dates(), [date(2026, 1, 5), date(2026, 1, 6)])
+    
+    def test_marked_future_fractions_are_kept(self):
+        missed = self.patient.fractions.get(date=date(2026, 1, 8))
+        missed.is_missed = True
+        missed.save()
+        noted = self.patient.fractions.get(date=date(2026, 1, 9))
+        noted.note = 'Перевірити укладку'
+        noted.save()
+        
+        self.sync(dose=2.5)
+        # Пропущена фракція не зараховується - курс подовжується на один день
+        self.assertEqual(self.dates()[-1], date(2026, 1, 12))
+        self.assertEqual(self.patient.fractions.get(date=date(2026, 1, 9)).note, 'Перевірити укладку')
+        doses = dict(self.patient.fractions.values_list('date', 'dose'))
+        self.assertEqual(doses[self.START], 2.0)
+        self.assertEqual(doses[self.TODAY], 2.5)
+        self.assertEqual(doses[date(2026, 1, 12)], 2.5)
+    
+    def test_moved_start_reuses_rows(self):
+        from .services import sync_future_fractions
+        
+        FractionHistory.objects.filter(patient=self.patient).update(delivered=False, confirmed_by_doctor=False)
+        future_pks = set(self.patient.fractions.values_list('pk', flat=True))
+        sync_future_fractions(self.patient, date(2026, 1, 12), 5, 2.0, today=date(2026, 1, 2))
+        self.assertEqual(self.dates(), [date(2026, 1, day) for day in (12, 13, 14, 15, 16)])
+        self.assertEqual(set(self.patient.fractions.values_list('pk', flat=True)), future_pks)
+    
+    def test_generate_view_keeps_delivered(self):
+        client = Client()
+        client.force_login(User.objects.create_user(
+            username='regenuser', password='testpass123', role='doctor', approved=True
+        ))
+        self.patient.total_fractions = 6
+        self.patient.save()
+        client.post(reverse('generate_fractions', kwargs={'patient_id': self.patient.pk}), secure=True)
+        self.assertTrue(self.patient.fractions.get(date=self.START).delivered)
+        self.assertEqual(self.patient.fractions.count(), 6)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.discharge_date, max(self.dates()))
+
+
+class CourseShiftTests(TestCase):
+    """Зсув решти курсу на N робочих днів одним оновленням"""
+    
+    START = date(2026, 1, 5)  # понеділок
+    
+    def setUp(self):
+        Holiday.objects.create(date=date(2026, 1, 13), name='Тестове свято')
+        self.patient = Patient.objects.create(
+            last_name='Зсув', first_name='Курсу',
+            treatment_start_date=self.START, total_fractions=5, dose_per_fraction=2.0,
+        )
+        self.fractions = list(self.patient.fractions.order_by('date'))
+        FractionHistory.objects.filter(pk=self.fractions[0].pk).update(delivered=True)
+    
+    def dates(self):
+        return list(self.patient.fractions.order_by('date').values_list('date', flat=True))
+    
+    def test_shift_workdays(self):
+        from .workdays import shift_workdays
+        
+        calendar = holiday_calendar([date(2026, 1, 13)])
+        self.assertEqual(
+            shift_workdays([date(2026, 1, 9), date(2026, 1, 10)], 2, calendar=calendar),
+            [date(2026, 1, 14), date(2026, 1, 15)],
+        )
+    
+    def test_shift_moves_remaining_course(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services import shift_remaining_course
+        
+        with CaptureQueriesContext(connection) as queries:
+            shifted = shift_remaining_course(self.fractions[2], 2, 'Ремонт апарата')
+        self.assertEqual(shifted, 3)
+        fraction_updates = [
+            q['sql'] for q in queries if q['sql'].startswith('UPDATE "fraction_history"')
+        ]
+        self.assertEqual(len(fraction_updates), 1)
+        
+        # 7, 8, 9 січня -> 9, 12, 14 (13 - свято)
+        self.assertEqual(self.dates(), [
+            date(2026, 1, 5), date(2026, 1, 6), date(2026, 1, 9), date(2026, 1, 12), date(2026, 1, 14),
+        ])
+        moved = self.patient.fractions.get(date=date(2026, 1, 14))
+        self.assertEqual(moved.original_date, date(2026, 1, 9))
+        self.assertTrue(moved.is_postponed)
+        self.assertEqual(moved.reason, 'Ремонт апарата')
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.discharge_date, date(2026, 1, 14))
+        self.assertEqual(FractionSummary.objects.get(patient=self.patient).postponed, 3)
+    
+    def test_original_date_kept_on_repeated_shift(self):
+        from .services import shift_remaining_course
+        
+        shift_remaining_course(self.fractions[4], 1)
+        shift_remaining_course(FractionHistory.objects.get(pk=self.fractions[4].pk), 1)
+        fraction = FractionHistory.objects.get(pk=self.fractions[4].pk)
+        self.assertEqual(fraction.date, date(2026, 1, 14))
+        self.assertEqual(fraction.original_date, date(2026, 1, 9))
+    
+    def test_delivered_fractions_not_shifted(self):
+        from .services import shift_remaining_course
+        
+        self.assertEqual(shift_remaining_course(self.fractions[0], 1), 4)
+        self.assertEqual(self.dates()[0], self.START)
+    
+    def test_shift_view(self):
+        client = Client()
+        client.force_login(User.objects.create_user(
+            username='shiftuser', password='testpass123', role='doctor', approved=True
+        ))
+        url = reverse('fraction_shift', kwargs={'pk': self.fractions[1].pk})
+        response = client.post(url, {'days': 0}, secure=True)
+        self.assertRedirects(response, reverse('fraction_edit', kwargs={'pk': self.fractions[1].pk}),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.dates()[1], date(2026, 1, 6))
+        
+        response = client.post(url, {'days': 1, 'reason': 'Лихоманка'}, secure=True)
+        self.assertRedirects(response, reverse('patient_detail', kwargs={'pk': self.patient.pk}),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.dates()[-1], date(2026, 1, 12))
+
+
+class ClosureRescheduleTests(TestCase):
+    """Масове перенесення фракцій із закритих днів відділення"""
+    
+    START = date(2026, 1, 5)  # понеділок
+    CLOSED = date(2026, 1, 7)
+    
+    def setUp(self):
+        self.first, self.second = [
+            Patient.objects.create(
+                last_name=name, first_name='Пацієнт',
+                treatment_start_date=self.START, total_fractions=5, dose_per_fraction=2.0,
+            )
+            for name in ('Перший', 'Другий')
+        ]
+        self.later = Patient.objects.create(
+            last_name='Пізніший', first_name='Пацієнт',
+            treatment_start_date=date(2026, 1, 12), total_fractions=3, dose_per_fraction=2.0,
+        )
+    
+    def dates(self, patient):
+        return list(patient.fractions.order_by('date').values_list('date', flat=True))
+    
+    def test_reschedule_shifts_every_affected_course(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services import reschedule_closed_days
+        
+        with CaptureQueriesContext(connection) as queries:
+            result = reschedule_closed_days([self.CLOSED], reason='ТО прискорювача')
+        self.assertEqual(result['fractions'], 6)
+        self.assertEqual(result['patients'], [self.first.pk, self.second.pk])
+        fraction_updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "fraction_history"')]
+        self.assertEqual(len(fraction_updates), 1)
+        
+        expected = [date(2026, 1, day) for day in (5, 6, 8, 9, 12)]
+        for patient in (self.first, self.second):
+            self.assertEqual(self.dates(patient), expected)
+            patient.refresh_from_db()
+            self.assertEqual(patient.discharge_date, date(2026, 1, 12))
+        self.assertEqual(self.dates(self.later), [date(2026, 1, 12), date(2026, 1, 13), date(2026, 1, 14)])
+        
+        moved = self.first.fractions.get(date=date(2026, 1, 12))
+        self.assertEqual(moved.original_date, date(2026, 1, 9))
+        self.assertEqual(moved.reason, 'ТО прискорювача')
+        self.assertEqual(FractionSummary.objects.get(patient=self.first).postponed, 3)
+        self.assertFalse(Holiday.objects.exists())
+    
+    def test_several_closed_days_and_delivered_fractions(self):
+        from .services import reschedule_closed_days
+        
+        FractionHistory.objects.filter(patient=self.second, date=self.CLOSED).update(delivered=True)
+        result = reschedule_closed_days([date(2026, 1, 9), self.CLOSED], add_holidays=True)
+        self.assertEqual(
+            self.dates(self.first), [date(2026, 1, day) for day in (5, 6, 8, 12, 13)]
+        )
+        # У другого пацієнта фракцію 7-го вже проведено - курс зсувається лише з 9-го
+        self.assertEqual(
+            self.dates(self.second), [date(2026, 1, day) for day in (5, 6, 7, 8, 12)]
+        )
+        self.assertEqual(result['fractions'], 4)
+        self.assertEqual(Holiday.objects.count(), 2)
+    
+    def test_weekend_fraction_keeps_its_own_day(self):
+        """Фракція на вихідний не збігається з фракцією наступного робочого дня"""
+        from .services import reschedule_closed_days
+        
+        # Субота між п'ятничною та понеділковою фракціями
+        for day in (10, 12):
+            FractionHistory.objects.create(patient=self.first, date=date(2026, 1, day), dose=2.0)
+        reschedule_closed_days([self.CLOSED])
+        dates = self.dates(self.first)
+        self.assertEqual(len(set(dates)), len(dates))
+        self.assertEqual(dates, [date(2026, 1, day) for day in (5, 6, 8, 9, 12, 13, 14)])
+        # Інші курси з тим самим закритим днем розраховуються незалежно
+        self.assertEqual(self.dates(self.second), [date(2026, 1, day) for day in (5, 6, 8, 9, 12)])
+    
+    def test_dry_run_changes_nothing(self):
+        from .services import reschedule_closed_days
+        
+        before = self.dates(self.first)
+        result = reschedule_closed_days([self.CLOSED], dry_run=True, add_holidays=True)
+        self.assertEqual(result['fractions'], 6)
+        self.assertEqual(result['discharge_changes'], [
+            (self.first.pk, date(2026, 1, 9), date(2026, 1, 12)),
+            (self.second.pk, date(2026, 1, 9), date(2026, 1, 12)),
+        ])
+        self.assertEqual(self.dates(self.first), before)
+        self.assertFalse(Holiday.objects.exists())
+        self.assertFalse(FractionHistory.objects.filter(is_postponed=True).exists())
+    
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('reschedule_closed_days', '07.01.2026', '--dry-run', stdout=out)
+        self.assertIn('DRY RUN: Було б перенесено фракцій 6 у 2 пацієнтів', out.getvalue())
+        self.assertIn('Перший Пацієнт', out.getvalue())
+        
+        call_command('reschedule_closed_days', '2026-01-07', '--reason', 'Свято', stdout=StringIO())
+        self.assertEqual(self.dates(self.second)[-1], date(2026, 1, 12))
+    
+    def test_view_preview_and_apply(self):
+        client = Client()
+        client.force_login(User.objects.create_user(
+            username='closureuser', password='testpass123', role='doctor', approved=True
+        ))
+        url = reverse('closure_reschedule')
+        self.assertEqual(client.get(url, secure=True).status_code, 200)
+        
+        response = client.post(url, {'dates': '07.01.2026', 'preview': ''}, secure=True)
+        self.assertEqual(response.context['result']['fractions'], 6)
+        self.assertContains(response, '12.01.2026')
+        self.assertEqual(self.dates(self.first)[-1], date(2026, 1, 9))
+        
+        response = client.post(url, {'dates': '07.01.2026', 'apply': ''}, secure=True)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertEqual(self.dates(self.first)[-1], date(2026, 1, 12))
+        
+        response = client.post(url, {'dates': '32.01.2026', 'preview': ''}, secure=True)
+        self.assertIn('dates', response.context['form'].errors)
+
+
+class SlotSchedulerTests(QueryBudgetTestMixin, TestCase):
+    """Розподіл фракцій дня за слотами апаратів"""
+    
+    DAY = date(2026, 1, 5)
+    
+    def machine_days(self, *slots):
+        from .scheduling import MachineDay
+        
+        return [MachineDay(index + 1, 8 * 60, 15, count) for index, count in enumerate(slots)]
+    
+    def request(self, key, machines=None, preferred=None, current=None, pinned=False):
+        from .scheduling import SlotRequest
+        
+        return SlotRequest(key, machines, preferred, current, pinned)
+    
+    def test_plan_respects_preferences_and_capacity(self):
+        from .scheduling import plan_day
+        
+        assignment, unscheduled = plan_day([
+            self.request(1, preferred=9 * 60),
+            self.request(2, preferred=9 * 60),
+            self.request(3),
+            self.request(4, machines=(2,)),
+            self.request(5),
+            self.request(6),
+            self.request(7),
+        ], self.machine_days(5, 1))
+        # 9:00 - п'ятий слот першого апарата
+        self.assertEqual(assignment[1], (1, 4))
+        # Той самий бажаний час - сусідній слот
+        self.assertEqual(assignment[2], (1, 3))
+        self.assertEqual(assignment[4], (2, 0))
+        self.assertEqual(len(set(assignment.values())), 6)
+        self.assertEqual(unscheduled, [7])
+    
+    def test_repair_moves_flexible_fraction(self):
+        from .scheduling import plan_day
+        
+        # Апарат 1 зайнятий гнучкою фракцією, прив'язана до нього має отримати слот
+        assignment, unscheduled = plan_day([
+            self.request(1, current=(1, 0)),
+            self.request(2, machines=(1,)),
+        ], self.machine_days(1, 1))
+        self.assertEqual(unscheduled, [])
+        self.assertEqual(assignment, {1: (2, 0), 2: (1, 0)})
+    
+    def test_existing_assignments_are_kept(self):
+        from .scheduling import plan_day
+        
+        assignment, _ = plan_day([
+            self.request(1, preferred=8 * 60, current=(1, 3)),
+            self.request(2, preferred=8 * 60),
+            self.request(3, current=(1, 3)),
+            self.request(4, pinned=True, current=(1, 0)),
+        ], self.machine_days(4))
+        self.assertEqual(assignment[1], (1, 3))
+        self.assertEqual(assignment[4], (1, 0))
+        self.assertEqual(assignment[2], (1, 1))
+        # Конфлікт за слот - друга фракція переплановується
+        self.assertEqual(assignment[3], (1, 2))
+    
+    def test_month_for_several_machines_under_a_second(self):
+        import random
+        import time
+        from .scheduling import plan_day
+        
+        rng = random.Random(1)
+        machines = self.machine_days(32, 32, 32)
+        requests = [
+            self.request(
+                key, machines=rng.choice([None, None, (1,), (2,), (3,)]),
+                preferred=rng.choice([None, rng.randrange(8 * 60, 16 * 60)]),
+            )
+            for key in range(90)
+        ]
+        started = time.perf_counter()
+        for _ in range(22):
+            assignment, unscheduled = plan_day(requests, machines)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(assignment) + len(unscheduled), 90)
+        self.assertEqual(len(set(assignment.values())), len(assignment))
+    
+    def create_course(self, name, **kwargs):
+        return Patient.objects.create(
+            last_name=name, first_name='Пацієнт', treatment_start_date=self.DAY,
+            total_fractions=3, dose_per_fraction=2.0, **kwargs
+        )
+    
+    def test_schedule_days_and_incremental_replan(self):
+        from datetime import time
+        from .models import TreatmentMachine
+        from .scheduling import schedule_days
+        from .services import postpone_fraction
+        
+        linac = TreatmentMachine.objects.create(name='Linac 1', day_start=time(8), day_end=time(9), slot_minutes=15)
+        morning = self.create_course('Ранковий', preferred_time=time(8, 30))
+        other = self.create_course('Інший')
+        dates = [self.DAY + timedelta(days=offset) for offset in range(3)]
+        
+        result = schedule_days(dates)
+        self.assertEqual((result['fractions'], result['changed'], result['unscheduled']), (6, 6, []))
+        first = morning.fractions.get(date=self.DAY)
+        self.assertEqual((first.machine_id, first.slot), (linac.pk, 2))
+        self.assertEqual(other.fractions.get(date=self.DAY).slot, 0)
+        self.assertEqual(schedule_days(dates)['changed'], 0)
+        
+        # Проведена фракція тримає слот, відкладена - отримує слот нового дня
+        FractionHistory.objects.filter(pk=first.pk).update(delivered=True)
+        moved = other.fractions.get(date=self.DAY)
+        postpone_fraction(moved, dates[1], 'Тест')
+        moved.refresh_from_db()
+        self.assertEqual(moved.date, dates[1])
+        self.assertIsNotNone(moved.slot)
+        slots = list(FractionHistory.objects.filter(date=dates[1]).values_list('slot', flat=True))
+        self.assertEqual(len(slots), len(set(slots)))
+        first.refresh_from_db()
+        self.assertEqual(first.slot, 2)
+    
+    def test_worklist_view_and_command(self):
+        from datetime import time
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import TreatmentMachine
+        
+        TreatmentMachine.objects.create(name='Linac 1', day_start=time(8), day_end=time(10), slot_minutes=30)
+        patient = self.create_course('Розклад')
+        client = Client()
+        client.force_login(User.objects.create_user(
+            username='worklistuser', password='testpass123', role='nurse', approved=True
+        ))
+        url = reverse('treatment_worklist')
+        response = client.get(url, {'date': self.DAY.isoformat()}, secure=True)
+        self.assertEqual(len(response.context['unscheduled']), 1)
+        
+        client.post(url, {'date': self.DAY.isoformat()}, secure=True)
+        response = client.get(url, {'date': self.DAY.isoformat()}, secure=True)
+        self.assertEqual(response.context['unscheduled'], [])
+        self.assertContains(response, patient.full_name)
+        
+        out = StringIO()
+        call_command('schedule_machines', '--start', self.DAY.isoformat(), '--days', '7', stdout=out)
+        self.assertIn('Розплановано фракцій: 3', out.getvalue())
+        self.assertEqual(patient.fractions.filter(slot__isnull=True).count(), 0)
+    
+    def test_worklist_within_query_budget(self):
+        """GET і POST "розпланувати день" вкладаються в бюджет незалежно від кількості фракцій"""
+        from datetime import time
+        from django.conf import settings
+        from .models import TreatmentMachine
+        
+        for index in range(2):
+            TreatmentMachine.objects.create(name=f'Linac {index}', day_start=time(8), day_end=time(16))
+        for index in range(10):
+            self.create_course(f'Бюджет{index}', preferred_time=time(9 + index % 5))
+        client = Client()
+        client.force_login(User.objects.create_user(
+            username='worklistbudget', password='testpass123', role='nurse', approved=True
+        ))
+        url = reverse('treatment_worklist')
+        budget = settings.QUERY_BUDGETS['treatment_worklist']
+        
+        with self.assertQueryBudget(budget):
+            response = client.post(url, {'date': self.DAY.isoformat()}, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(FractionHistory.objects.filter(date=self.DAY, slot__isnull=True).exists())
+        with self.assertQueryBudget(budget):
+            response = client.get(url, {'date': self.DAY.isoformat()}, secure=True)
+        self.assertEqual(response.context['unscheduled'], [])
@@ -6,10 +6,12 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('search/', views.search_patients, name='search_patients'),
+    path('search/autocomplete/', views.patient_autocomplete, name='patient_autocomplete'),
 
     # Patients
     path('patients/', views.patient_list, name='patient_list'),
     path('patients/new/', views.patient_create, name='patient_create'), # Specific path first
+    path('patients/export/', views.patient_export, name='patient_export'),
     path('patients/archive/', views.patient_archive, name='patient_archive'),
     path('patients/inpatient/', views.inpatient_list, name='inpatient_list'),
     path('patients/filter/<str:filter_type>/', views.patient_list, name='patient_list_filtered'),
@@ -22,7 +24,11 @@ urlpatterns = [
     path('patients/<int:pk>/fractions/', views.fraction_list, name='patient_fraction_list'),
     path('patients/<int:patient_id>/generate_fractions/', views.generate_fractions, name='generate_fractions'),
     path('patients/<int:patient_id>/recalculate_discharge/', views.recalculate_discharge, name='recalculate_discharge'),
+    path('fractions/export/', views.fraction_export, name='fraction_export'),
     path('fractions/<int:pk>/edit/', views.fraction_edit, name='fraction_edit'),
+    path('fractions/<int:pk>/shift/', views.fraction_shift, name='fraction_shift'),
+    path('fractions/worklist/', views.treatment_worklist, name='treatment_worklist'),
+    path('fractions/reschedule/', views.closure_reschedule, name='closure_reschedule'),
     path('fractions/confirm/doctor/', views.confirm_fractions_doctor, name='confirm_fractions_doctor'),
     path('fractions/confirm/nurse/', views.confirm_fractions_nurse, name='confirm_fractions_nurse'),
 
@@ -1,18 +1,33 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from .models import Patient, FractionHistory, MedicalIncapacity, User
-from .forms import PatientForm, FractionHistoryForm, MedicalIncapacityForm, UserRegistrationForm, UserLoginForm, FractionEditForm
-from django.http import JsonResponse
+from .forms import PatientForm, FractionHistoryForm, MedicalIncapacityForm, UserRegistrationForm, UserLoginForm, FractionEditForm, CourseShiftForm, ClosureRescheduleForm
+from django.http import Http404, JsonResponse
 from datetime import date, timedelta
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Prefetch, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
 from django.db import models
 from django.utils import timezone
-from .services import generate_fractions_for_patient, auto_confirm_today_fractions, get_patient_treatment_info
+from .services import generate_fractions_for_patient, auto_confirm_today_fractions, get_patient_treatment_info, refresh_fraction_summaries
 from django.views.decorators.csrf import csrf_exempt
 import json
+from asgiref.sync import sync_to_async
 from django.views.decorators.http import require_POST
 from .decorators import login_required, staff_required, admin_required
+from .pagination import KeysetPaginator
+from .search import find_patients
+from .autocomplete import autocomplete, DEFAULT_LIMIT
+from .async_queries import gather_queries
+from .exports import (
+    EXPORT_FORMATS, FRACTION_COLUMNS, PATIENT_COLUMNS,
+    export_response, fraction_export_queryset, fraction_export_rows, patient_export_rows
+)
+from .cache_versions import (
+    FRAGMENT_TIMEOUT, attach_cache_versions, cached_fragment_ids, patient_version
+)
 
 # Create your views here.
 
@@ -24,159 +39,110 @@ def splash(request):
         return redirect('login')
 
 @login_required
-def dashboard(request):
+async def dashboard(request):
     today = date.today()
+    from_date = today - timedelta(days=7)
     
-    # Статистика на сьогодні
-    ct_today_count = Patient.objects.filter(
-        ct_simulation_date=today
-    ).count()
-    
-    start_today_count = Patient.objects.filter(
-        treatment_start_date=today
-    ).count()
-    
-    discharge_today_count = Patient.objects.filter(
-        discharge_date=today
-    ).count()
-    
-    # Загальна статистика - використовуємо фільтрацію за датами замість current_stage
-    ct_count = Patient.objects.filter(
-        ct_simulation_date__isnull=False,
-        treatment_start_date__isnull=True
-    ).count()
-    
-    start_count = Patient.objects.filter(
-        treatment_start_date__isnull=False,
-        treatment_start_date__gt=today
-    ).count()
-    
-    in_treatment_count = Patient.objects.filter(
-        treatment_start_date__isnull=False,
-        treatment_start_date__lte=today,
-        discharge_date__isnull=True
-    ).count()
-    
-    # Сповіщення про аналізи крові
-    notifications = []
-    in_treatment = Patient.objects.filter(
+    in_treatment_filter = Q(
         treatment_start_date__isnull=False,
         treatment_start_date__lte=today,
         discharge_date__isnull=True
     )
-    for patient in in_treatment:
-        last = patient.last_blood_test_date or patient.treatment_start_date
-        if not last or (today - last).days >= 10:
-            notifications.append({'patient': patient})
     
-    # Виписані цього тижня
-    from_date = today - timedelta(days=7)
-    discharged_this_week = Patient.objects.filter(
-        discharge_date__isnull=False,
-        discharge_date__gte=from_date
-    ).count()
-    
-    context = {
-        'ct_today_count': ct_today_count,
-        'start_today_count': start_today_count,
-        'discharge_today_count': discharge_today_count,
-        'ct_count': ct_count,
-        'start_count': start_count,
-        'in_treatment_count': in_treatment_count,
-        'discharged_this_week': discharged_this_week,
-        'notifications': notifications,
-    }
-    return render(request, 'patients/dashboard.html', context)
-
-@login_required
-def patient_list(request, filter_type=None):
-    today = date.today()
-    # Активні: discharge_date немає або у майбутньому
-    base_query = Patient.objects.filter(
-        models.Q(discharge_date__isnull=True) | models.Q(discharge_date__gte=today)
-    )
-    
-    if filter_type:
-        if filter_type == 'ct-simulation':
-            patients = base_query.filter(
+    def load_stats():
+        # Всі лічильники дашборду - один агрегатний запит з умовними Count
+        return Patient.objects.aggregate(
+            # Статистика на сьогодні
+            ct_today_count=Count('pk', filter=Q(ct_simulation_date=today)),
+            start_today_count=Count('pk', filter=Q(treatment_start_date=today)),
+            discharge_today_count=Count('pk', filter=Q(discharge_date=today)),
+            # Загальна статистика - використовуємо фільтрацію за датами замість current_stage
+            ct_count=Count('pk', filter=Q(
                 ct_simulation_date__isnull=False,
                 treatment_start_date__isnull=True
-            )
-        elif filter_type == 'treatment-start':
-            patients = base_query.filter(
+            )),
+            start_count=Count('pk', filter=Q(
                 treatment_start_date__isnull=False,
                 treatment_start_date__gt=today
-            )
-        elif filter_type == 'in-treatment':
-            patients = base_query.filter(
-                treatment_start_date__isnull=False,
-                treatment_start_date__lte=today,
-                discharge_date__isnull=True
-            )
-        elif filter_type == 'discharge-prep':
-            three_days_later = today + timedelta(days=3)
-            patients = base_query.filter(
+            )),
+            in_treatment_count=Count('pk', filter=in_treatment_filter),
+            # Виписані цього тижня
+            discharged_this_week=Count('pk', filter=Q(
                 discharge_date__isnull=False,
-                discharge_date__gt=today,
-                discharge_date__lte=three_days_later
-            )
-        else:
-            patients = base_query.all()
-    else:
-        patients = base_query.all()
-    
-    # Сортування
-    sort_by = request.GET.get('sort', 'last_name')
-    sort_order = request.GET.get('order', 'asc')
-    
-    # Визначаємо поле для сортування
-    if sort_by == 'full_name':
-        order_field = 'last_name'
-    elif sort_by == 'ct_simulation_date':
-        order_field = 'ct_simulation_date'
-    elif sort_by == 'treatment_start_date':
-        order_field = 'treatment_start_date'
-    elif sort_by == 'discharge_date':
-        order_field = 'discharge_date'
-    elif sort_by == 'medical_incapacity_end':
-        # Сортування за датою закінчення останнього МВТН
-        if sort_order == 'desc':
-            patients = patients.annotate(
-                latest_incapacity_end=models.Subquery(
-                    MedicalIncapacity.objects.filter(
-                        patient=models.OuterRef('pk')
-                    ).order_by('-end_date').values('end_date')[:1]
-                )
-            ).order_by('-latest_incapacity_end')
-        else:
-            patients = patients.annotate(
-                latest_incapacity_end=models.Subquery(
-                    MedicalIncapacity.objects.filter(
-                        patient=models.OuterRef('pk')
-                    ).order_by('-end_date').values('end_date')[:1]
-                )
-            ).order_by('latest_incapacity_end')
-        return render(request, 'patients/patient_list.html', {
-            'patients': patients,
-            'filter_type': filter_type,
-            'current_sort': sort_by,
-            'current_order': sort_order
-        })
-    else:
-        order_field = 'last_name'
+                discharge_date__gte=from_date
+            )),
+        )
+    
+    def load_notifications():
+        # Сповіщення про аналізи крові: останній аналіз (або початок лікування)
+        # був 10 і більше днів тому - фільтруємо одразу в БД
+        blood_test_overdue = Patient.objects.filter(in_treatment_filter).annotate(
+            last_blood_test=Coalesce('last_blood_test_date', 'treatment_start_date')
+        ).filter(
+            last_blood_test__lte=today - timedelta(days=10)
+        ).order_by('last_name', 'first_name')
+        return [{'patient': patient} for patient in blood_test_overdue]
+    
+    # Лічильники і сповіщення - незалежні запити, виконуються паралельно
+    stats, notifications = await gather_queries(load_stats, load_notifications)
     
-    # Додаємо префікс для зворотного сортування
-    if sort_order == 'desc':
-        order_field = f'-{order_field}'
+    context = dict(stats, notifications=notifications)
+    return await sync_to_async(render)(request, 'patients/dashboard.html', context)
+
+# Поля, за якими можна сортувати список пацієнтів (параметр sort -> поле запиту)
+PATIENT_SORT_FIELDS = {
+    'full_name': 'last_name',
+    'ct_simulation_date': 'ct_simulation_date',
+    'treatment_start_date': 'treatment_start_date',
+    'discharge_date': 'discharge_date',
+    'medical_incapacity_end': 'latest_incapacity_end',
+}
+
+PATIENTS_PER_PAGE = 50
+
+def _patients_page(request, patients, default_sort='full_name', default_order='asc'):
+    """
+    Сторінка пацієнтів за ?sort/?order з keyset-пагінацією (?after/?before):
+    кожна сторінка - один запит, незалежно від розміру таблиці.
+    Повертає (сторінка, поле сортування, напрямок).
+    """
+    sort_by = request.GET.get('sort', default_sort)
+    if sort_by not in PATIENT_SORT_FIELDS:
+        sort_by = default_sort
+    sort_order = request.GET.get('order', default_order)
+    if sort_order not in ('asc', 'desc'):
+        sort_order = default_order
+    
+    paginator = KeysetPaginator(
+        patients,
+        PATIENT_SORT_FIELDS[sort_by],
+        descending=sort_order == 'desc',
+        per_page=PATIENTS_PER_PAGE
+    )
+    page = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before')
+    )
+    attach_cache_versions(page.object_list)
+    return page, sort_by, sort_order
+
+@login_required
+def patient_list(request, filter_type=None):
+    today = date.today()
+    patients = Patient.objects.list_filter(filter_type, today)
     
-    # Застосовуємо сортування
-    patients = patients.order_by(order_field)
+    # Дата закінчення останнього МВТН завжди береться підзапитом в тому ж SELECT
+    patients = patients.with_latest_incapacity_end()
+    page, sort_by, sort_order = _patients_page(request, patients)
         
     return render(request, 'patients/patient_list.html', {
-        'patients': patients,
+        'patients': page,
+        'page': page,
         'filter_type': filter_type,
         'current_sort': sort_by,
-        'current_order': sort_order
+        'current_order': sort_order,
+        'today': today,
+        'fragment_timeout': FRAGMENT_TIMEOUT
     })
 
 @login_required
@@ -186,8 +152,7 @@ def patient_create(request):
         print("POST data:", request.POST)
         print("Form errors:", form.errors)
         print("Non-field errors:", form.non_field_errors())
-        if form.is_valid():
-            form.save()
+        if form.is_valid() and form.save() is not None:
             return redirect('patient_list')
     else:
         form = PatientForm()
@@ -198,8 +163,7 @@ def patient_update(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     if request.method == 'POST':
         form = PatientForm(request.POST, instance=patient)
-        if form.is_valid():
-            form.save()
+        if form.is_valid() and form.save() is not None:
             return redirect('patient_list')
     else:
         form = PatientForm(instance=patient)
@@ -213,29 +177,64 @@ def patient_delete(request, pk):
         return redirect('patient_list')
     return render(request, 'patients/patient_confirm_delete.html', {'patient': patient})
 
+FRACTION_PATIENTS_PER_PAGE = 25
+
 @login_required
-def fraction_list(request):
-    # Отримуємо пацієнтів, які мають фракції
-    patients_with_fractions = Patient.objects.filter(
-        fractions__isnull=False
-    ).distinct().prefetch_related(
-        'fractions'
-    ).order_by('last_name', 'first_name')
+def fraction_list(request, pk=None):
+    # Підсумки по фракціях рахуються в БД, а самі фракції підвантажуються
+    # одним впорядкованим prefetch-запитом для всієї сторінки пацієнтів
+    patients_with_fractions = Patient.objects.annotate(
+        fraction_count=Count('fractions'),
+        completed_fractions=Count('fractions', filter=Q(fractions__delivered=True)),
+        pending_fractions=Count('fractions', filter=Q(fractions__delivered=False)),
+        missed_fractions=Count('fractions', filter=Q(fractions__is_missed=True)),
+        postponed_fractions=Count('fractions', filter=Q(fractions__is_postponed=True)),
+    ).filter(
+        fraction_count__gt=0
+    ).order_by('last_name', 'first_name', 'pk')
+    
+    if pk is not None:
+        patients_with_fractions = patients_with_fractions.filter(pk=pk)
+    
+    paginator = Paginator(patients_with_fractions, FRACTION_PATIENTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    
+    # Фракції завантажуємо лише для пацієнтів, чиї картки ще не закешовані
+    patients = attach_cache_versions(page)
+    cached_ids = cached_fragment_ids(
+        'fraction_card', {patient.pk: patient.cache_version for patient in patients}
+    )
+    prefetch_related_objects(
+        [patient for patient in patients if patient.pk not in cached_ids],
+        Prefetch(
+            'fractions',
+            queryset=FractionHistory.objects.order_by('date', 'pk'),
+            to_attr='ordered_fractions'
+        )
+    )
     
     # Групуємо фракції по пацієнтах
     patients_data = []
-    for patient in patients_with_fractions:
-        fractions = patient.fractions.all().order_by('date')
+    for patient in patients:
         patients_data.append({
             'patient': patient,
-            'fractions': fractions,
-            'total_fractions': fractions.count(),
-            'completed_fractions': fractions.filter(delivered=True).count(),
-            'pending_fractions': fractions.filter(delivered=False).count()
+            # Якщо картку витіснили з кешу після перевірки - фракції завантажаться
+            # під час рендерингу (шаблон викликає функцію)
+            'fractions': getattr(
+                patient, 'ordered_fractions',
+                lambda patient=patient: list(patient.fractions.order_by('date', 'pk'))
+            ),
+            'total_fractions': patient.fraction_count,
+            'completed_fractions': patient.completed_fractions,
+            'pending_fractions': patient.pending_fractions,
+            'missed_fractions': patient.missed_fractions,
+            'postponed_fractions': patient.postponed_fractions
         })
     
     return render(request, 'patients/fraction_list.html', {
-        'patients_data': patients_data
+        'patients_data': patients_data,
+        'page': page,
+        'fragment_timeout': FRAGMENT_TIMEOUT
     })
 
 @login_required
@@ -268,11 +267,17 @@ def fraction_edit(request, pk):
             if not fraction.original_date and form.cleaned_data['date'] != fraction.date:
                 fraction.original_date = fraction.date
             
+            date_changed = 'date' in form.changed_data
+            if date_changed:
+                # Слот апарата старого дня звільняється
+                fraction.slot = None
             fraction = form.save()
             
-            # Перераховуємо дату виписки, якщо змінилася дата фракції
-            if 'date' in form.changed_data:
+            # Перераховуємо дату виписки та слот нового дня, якщо змінилася дата фракції
+            if date_changed:
+                from .scheduling import schedule_days
                 from .services import recalculate_discharge_date
+                schedule_days([fraction.date])
                 recalculate_discharge_date(fraction.patient)
             
             messages.success(request, f'Фракцію від {fraction.date.strftime("%d.%m.%Y")} успішно оновлено')
@@ -282,10 +287,113 @@ def fraction_edit(request, pk):
     
     return render(request, 'patients/fraction_edit.html', {
         'form': form, 
+        'shift_form': CourseShiftForm(),
         'fraction': fraction,
         'patient': fraction.patient
     })
 
+@login_required
+def fraction_shift(request, pk):
+    """Зсуває фракцію та решту курсу на N робочих днів"""
+    fraction = get_object_or_404(FractionHistory, pk=pk)
+    if request.method != 'POST':
+        return redirect('fraction_edit', pk=pk)
+    
+    form = CourseShiftForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Вкажіть кількість робочих днів від 1 до 60')
+        return redirect('fraction_edit', pk=pk)
+    
+    from .services import shift_remaining_course
+    shifted = shift_remaining_course(fraction, form.cleaned_data['days'], form.cleaned_data['reason'])
+    messages.success(
+        request,
+        f'Зсунуто фракцій: {shifted} на {form.cleaned_data["days"]} роб. дн.'
+    )
+    return redirect('patient_detail', pk=fraction.patient_id)
+
+@login_required
+def treatment_worklist(request):
+    """Денний список процедур за слотами апаратів; POST - розпланувати день"""
+    from .scheduling import active_machines, schedule_days
+    
+    try:
+        day = date.fromisoformat(request.GET.get('date') or request.POST.get('date') or '')
+    except ValueError:
+        day = date.today()
+    
+    if request.method == 'POST':
+        result = schedule_days([day])
+        if result['unscheduled']:
+            messages.warning(
+                request,
+                f"Не вистачило слотів для {len(result['unscheduled'])} фракцій - перевірте апарати та побажання"
+            )
+        messages.success(request, f"Розплановано фракцій: {result['fractions']}, змінено: {result['changed']}")
+        return redirect(f"{reverse('treatment_worklist')}?date={day.isoformat()}")
+    
+    machines = active_machines()
+    fractions = list(
+        FractionHistory.objects.filter(date=day, is_missed=False).select_related('patient').only(
+            'date', 'machine_id', 'slot', 'delivered', 'confirmed_by_doctor', 'patient__last_name',
+            'patient__first_name', 'patient__middle_name', 'patient__preferred_time',
+        ).order_by('patient__last_name', 'pk')
+    )
+    by_slot = {(fraction.machine_id, fraction.slot): fraction for fraction in fractions if fraction.slot is not None}
+    machine_ids = {machine.pk for machine in machines}
+    
+    return render(request, 'patients/treatment_worklist.html', {
+        'day': day,
+        'previous_day': day - timedelta(days=1),
+        'next_day': day + timedelta(days=1),
+        'machines': [
+            (machine, [
+                (machine.slot_time(slot), by_slot.get((machine.pk, slot)))
+                for slot in range(machine.slots_per_day)
+            ])
+            for machine in machines
+        ],
+        'unscheduled': [
+            fraction for fraction in fractions
+            if fraction.slot is None or fraction.machine_id not in machine_ids
+        ],
+    })
+
+@login_required
+def closure_reschedule(request):
+    """Масове перенесення фракцій із закритих днів: попередній перегляд і застосування"""
+    form = ClosureRescheduleForm(request.POST or None)
+    result = None
+    patients = {}
+    if request.method == 'POST' and form.is_valid():
+        from .services import reschedule_closed_days
+        
+        apply = 'apply' in request.POST
+        result = reschedule_closed_days(
+            form.cleaned_data['dates'],
+            reason=form.cleaned_data['reason'],
+            dry_run=not apply,
+            add_holidays=form.cleaned_data['add_holidays'],
+        )
+        if apply:
+            messages.success(
+                request,
+                f"Перенесено фракцій: {result['fractions']} у {len(result['patients'])} пацієнтів"
+            )
+            return redirect('closure_reschedule')
+        patients = Patient.objects.only(
+            'last_name', 'first_name', 'middle_name'
+        ).in_bulk([patient_id for patient_id, _, _ in result['discharge_changes']])
+    
+    return render(request, 'patients/closure_reschedule.html', {
+        'form': form,
+        'result': result,
+        'discharge_changes': [
+            (patients[patient_id], old_date, new_date)
+            for patient_id, old_date, new_date in result['discharge_changes']
+        ] if result else [],
+    })
+
 @login_required
 def medical_incapacity_create(request, patient_pk):
     patient = get_object_or_404(Patient, pk=patient_pk)
@@ -301,31 +409,58 @@ def medical_incapacity_create(request, patient_pk):
     return render(request, 'patients/medical_incapacity_form.html', {'form': form, 'patient': patient})
 
 @login_required
-def medical_incapacity_delete(request, patient_pk, incapacity_pk):
-    incapacity = get_object_or_404(MedicalIncapacity, pk=incapacity_pk, patient_id=patient_pk)
+def medical_incapacity_delete(request, pk):
+    incapacity = get_object_or_404(MedicalIncapacity, pk=pk)
     if request.method == 'POST':
         incapacity.delete()
-        return redirect('patient_detail', pk=patient_pk)
-    return render(request, 'patients/medical_incapacity_confirm_delete.html', {'incapacity': incapacity})
+        return redirect('patient_detail', pk=incapacity.patient_id)
+    return render(request, 'patients/medical_incapacity_confirm_delete.html', {'medical_incapacity': incapacity})
 
 @login_required
-def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
-    fractions = patient.fractions.all().order_by('-date')
-    incapacities = patient.medical_incapacities.all().order_by('-created_at')
+async def patient_detail(request, pk):
+    cache_version = await sync_to_async(patient_version)(pk)
+    # Списки фракцій і лікарняних потрібні лише для фрагментів, яких немає в кеші
+    fractions_cached, incapacities_cached = [
+        bool(await sync_to_async(cached_fragment_ids)(fragment, {pk: cache_version}))
+        for fragment in ('patient_fractions', 'patient_incapacities')
+    ]
+    
+    def load_patient():
+        return Patient.objects.select_related('fraction_summary').filter(pk=pk).first()
+    
+    fractions = FractionHistory.objects.filter(patient_id=pk).order_by('-date')
+    incapacities = MedicalIncapacity.objects.filter(patient_id=pk).order_by('-created_at')
+    
+    # Для закешованого фрагмента передаємо невиконаний queryset: якщо запис
+    # витіснять між перевіркою та {% cache %}, список завантажиться під час
+    # рендерингу, а не закешується порожнім під поточною версією
+    def load_fractions():
+        return fractions if fractions_cached else list(fractions)
+    
+    def load_incapacities():
+        return incapacities if incapacities_cached else list(incapacities)
+    
+    # Пацієнт і його списки залежать лише від pk - запити йдуть паралельно
+    patient, fractions, incapacities = await gather_queries(
+        load_patient, load_fractions, load_incapacities
+    )
+    if patient is None:
+        raise Http404('Пацієнта не знайдено')
     treatment_info = get_patient_treatment_info(patient)
     
-    # Підрахунки для статистики фракцій
-    missed_fractions_count = patient.fractions.filter(is_missed=True).count()
-    postponed_fractions_count = patient.fractions.filter(is_postponed=True).count()
+    # Підрахунки для статистики фракцій - з підсумків пацієнта
+    missed_fractions_count = patient.fraction_stats.missed
+    postponed_fractions_count = patient.fraction_stats.postponed
     
-    return render(request, 'patients/patient_detail.html', {
+    return await sync_to_async(render)(request, 'patients/patient_detail.html', {
         'patient': patient,
         'fractions': fractions,
         'incapacities': incapacities,
         'treatment_info': treatment_info,
         'missed_fractions_count': missed_fractions_count,
-        'postponed_fractions_count': postponed_fractions_count
+        'postponed_fractions_count': postponed_fractions_count,
+        'cache_version': cache_version,
+        'fragment_timeout': FRAGMENT_TIMEOUT
     })
 
 def login_view(request):
@@ -397,7 +532,8 @@ def confirm_blood_test(request, patient_id):
 def generate_fractions(request, patient_id):
     if request.method == 'POST':
         patient = get_object_or_404(Patient, pk=patient_id)
-        success = generate_fractions_for_patient(patient)
+        # Проведені та позначені фракції зберігаються, змінюються лише майбутні
+        success = generate_fractions_for_patient(patient, keep_history=True)
         if success:
             messages.success(request, f'Фракції згенеровано для {patient.full_name}')
         else:
@@ -430,29 +566,41 @@ def auto_confirm_fractions(request):
 def search_patients(request):
     query = request.GET.get('q', '')
     if query:
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(middle_name__icontains=query) |
-            Q(diagnosis__icontains=query)
-        )
+        # Повнотекстовий індекс, результати впорядковані за релевантністю
+        patients = find_patients(query, Patient.objects.with_latest_incapacity_end())
     else:
         patients = Patient.objects.none()
     
     return render(request, 'patients/patient_list.html', {
-        'patients': patients,
-        'search_query': query
+        'patients': attach_cache_versions(patients),
+        'search_query': query,
+        'today': date.today(),
+        'fragment_timeout': FRAGMENT_TIMEOUT
     })
 
 @login_required
-def inpatient_list(request):
+def patient_autocomplete(request):
+    """JSON-автодоповнення за прізвищем або номером карти з in-memory індексу"""
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return JsonResponse({'results': autocomplete(request.GET.get('q', ''), limit)})
+
+@login_required
+async def inpatient_list(request):
     """Список стаціонарних пацієнтів"""
-    inpatients = Patient.objects.filter(
-        inpatient_status='стаціонарно',
-        discharge_date__isnull=True
-    ).order_by('last_name', 'first_name')
+    inpatients = [
+        patient async for patient in Patient.objects.filter(
+            inpatient_status='стаціонарно',
+            discharge_date__isnull=True
+        ).only(
+            'last_name', 'first_name', 'middle_name', 'ward_number',
+            'treatment_start_date', 'discharge_date'
+        ).order_by('last_name', 'first_name')
+    ]
     
-    return render(request, 'patients/inpatient_list.html', {
+    return await sync_to_async(render)(request, 'patients/inpatient_list.html', {
         'patients': inpatients
     })
 
@@ -460,15 +608,59 @@ def inpatient_list(request):
 def patient_archive(request):
     """Список пацієнтів в архіві"""
     today = date.today()
-    archived_patients = Patient.objects.filter(
-        discharge_date__isnull=False,
-        discharge_date__lt=today  # Тільки виписані пацієнти (дата виписки в минулому)
-    ).order_by('-discharge_date')
+    archived_patients = Patient.objects.archived(today).with_latest_incapacity_end()
+    # Архів лише росте, тому сторінками, як і список активних пацієнтів
+    page, sort_by, sort_order = _patients_page(
+        request, archived_patients, default_sort='discharge_date', default_order='desc'
+    )
     return render(request, 'patients/patient_list.html', {
-        'patients': archived_patients,
-        'is_archive': True
+        'patients': page,
+        'page': page,
+        'current_sort': sort_by,
+        'current_order': sort_order,
+        'is_archive': True,
+        'today': today,
+        'fragment_timeout': FRAGMENT_TIMEOUT
     })
 
+def _export_patients_queryset(request):
+    """Пацієнти з тими ж фільтрами, що й у списках: ?filter=<етап>|archive"""
+    filter_type = request.GET.get('filter') or None
+    if filter_type == 'archive':
+        return Patient.objects.archived(), '-discharge_date'
+    return Patient.objects.list_filter(filter_type), None
+
+@login_required
+def patient_export(request):
+    """Експорт пацієнтів у CSV/XLSX з фільтрами та сортуванням списку пацієнтів"""
+    patients, ordering = _export_patients_queryset(request)
+    sort_by = request.GET.get('sort')
+    if sort_by in PATIENT_SORT_FIELDS:
+        field = PATIENT_SORT_FIELDS[sort_by]
+        ordering = f'-{field}' if request.GET.get('order') == 'desc' else field
+    patients = patients.with_latest_incapacity_end().order_by(ordering or 'last_name', 'pk')
+    
+    export_format = request.GET.get('format') if request.GET.get('format') in EXPORT_FORMATS else 'csv'
+    return export_response(
+        request, PATIENT_COLUMNS, patient_export_rows(patients),
+        f'patients-{date.today():%Y%m%d}', export_format
+    )
+
+@login_required
+def fraction_export(request):
+    """Експорт історії фракцій у CSV/XLSX: усі, ?patient=<pk> або ?filter=<етап>|archive"""
+    patients = None
+    if request.GET.get('patient', '').isdigit():
+        patients = Patient.objects.filter(pk=request.GET['patient'])
+    elif request.GET.get('filter'):
+        patients, _ = _export_patients_queryset(request)
+    
+    export_format = request.GET.get('format') if request.GET.get('format') in EXPORT_FORMATS else 'csv'
+    return export_response(
+        request, FRACTION_COLUMNS, fraction_export_rows(fraction_export_queryset(patients)),
+        f'fractions-{date.today():%Y%m%d}', export_format
+    )
+
 @login_required
 @require_POST
 def approve_user(request, pk):
@@ -486,7 +678,10 @@ def approve_user(request, pk):
 def confirm_fractions_doctor(request):
     fraction_ids = request.POST.getlist('fraction_ids')
     if fraction_ids:
-        FractionHistory.objects.filter(id__in=fraction_ids).update(confirmed_by_doctor=True)
+        fractions = FractionHistory.objects.filter(id__in=fraction_ids)
+        patient_ids = set(fractions.values_list('patient_id', flat=True))
+        fractions.update(confirmed_by_doctor=True)
+        refresh_fraction_summaries(patient_ids)
         messages.success(request, f"Підтверджено {len(fraction_ids)} фракцій лікарем.")
     return redirect('fraction_list')
 
@@ -495,7 +690,10 @@ def confirm_fractions_doctor(request):
 def confirm_fractions_nurse(request):
     fraction_ids = request.POST.getlist('fraction_ids')
     if fraction_ids:
-        FractionHistory.objects.filter(id__in=fraction_ids).update(delivered=True)
+        fractions = FractionHistory.objects.filter(id__in=fraction_ids)
+        patient_ids = set(fractions.values_list('patient_id', flat=True))
+        fractions.update(delivered=True)
+        refresh_fraction_summaries(patient_ids)
         messages.success(request, f"Підтверджено {len(fraction_ids)} фракцій медсестрою.")
     return redirect('fraction_list')
 
@@ -503,18 +701,9 @@ def confirm_fractions_nurse(request):
 @require_POST
 def update_all_discharge_dates(request):
     """Масове оновлення дат виписки для всіх пацієнтів"""
-    from .services import recalculate_discharge_date
-    
-    patients_with_fractions = Patient.objects.filter(
-        fractions__isnull=False
-    ).distinct()
+    from .services import bulk_recalculate_discharge_dates
     
-    updated_count = 0
-    for patient in patients_with_fractions:
-        old_date = patient.discharge_date
-        new_date = recalculate_discharge_date(patient)
-        if new_date and new_date != old_date:
-            updated_count += 1
+    updated_count = len(bulk_recalculate_discharge_dates())
     
     if updated_count > 0:
         messages.success(request, f'Успішно оновлено дати виписки для {updated_count} пацієнтів')
@@ -0,0 +1,158 @@
+"""
+Робочий календар відділення на основі NumPy busday-арифметики.
+
+Робочими вважаються Пн-Пт, крім дат з таблиці святкових днів (Holiday).
+Усі функції приймають як окремі дати, так і масиви дат, тому розклади та
+кількість робочих днів для тисяч пацієнтів рахуються одним викликом.
+"""
+import numpy as np
+
+WEEKMASK = '1111100'  # Пн-Пт
+
+
+def holiday_calendar(holidays=None):
+    """
+    Створює numpy.busdaycalendar з робочим тижнем Пн-Пт та святковими днями.
+
+    Якщо holidays не передано, святкові дні беруться з таблиці Holiday
+    (один запит). Для масових розрахунків календар варто створити один раз
+    і передавати у функції через параметр calendar.
+    """
+    if holidays is None:
+        from .models import Holiday
+        holidays = Holiday.objects.values_list('date', flat=True)
+    return np.busdaycalendar(
+        weekmask=WEEKMASK,
+        holidays=np.array(list(holidays), dtype='datetime64[D]')
+    )
+
+
+def _as_datetime64(value):
+    return np.asarray(value, dtype='datetime64[D]')
+
+
+def _as_date(value):
+    """Перетворює datetime64[D] (скаляр або масив) назад у datetime.date"""
+    result = np.asarray(value, dtype='datetime64[D]').astype(object)
+    if isinstance(result, np.ndarray) and result.ndim == 0:
+        return result.item()
+    return result
+
+
+def is_workday(day, calendar=None):
+    """Чи є дата (або масив дат) робочим днем"""
+    if calendar is None:
+        calendar = holiday_calendar()
+    result = np.is_busday(_as_datetime64(day), busdaycal=calendar)
+    return bool(result) if np.ndim(result) == 0 else result
+
+
+def count_workdays(start, end, calendar=None):
+    """
+    Кількість робочих днів між start та end включно.
+
+    Якщо end раніше за start, повертає 0. Працює поелементно для масивів.
+    """
+    if calendar is None:
+        calendar = holiday_calendar()
+    start = _as_datetime64(start)
+    end = _as_datetime64(end) + np.timedelta64(1, 'D')
+    result = np.maximum(np.busday_count(start, end, busdaycal=calendar), 0)
+    return int(result) if np.ndim(result) == 0 else result
+
+
+def add_workdays(start, count, calendar=None):
+    """
+    Дата count-го робочого дня, починаючи з start (start враховується,
+    якщо він робочий). Для count < 1 повертає None.
+    """
+    if count < 1:
+        return None
+    if calendar is None:
+        calendar = holiday_calendar()
+    result = np.busday_offset(_as_datetime64(start), count - 1, roll='forward', busdaycal=calendar)
+    return _as_date(result)
+
+
+def workday_schedule(start, count, calendar=None):
+    """Список дат count послідовних робочих днів, починаючи з start"""
+    if count < 1:
+        return []
+    if calendar is None:
+        calendar = holiday_calendar()
+    result = np.busday_offset(
+        _as_datetime64(start), np.arange(count), roll='forward', busdaycal=calendar
+    )
+    return list(_as_date(result))
+
+
+def shift_workdays(dates, count, calendar=None):
+    """
+    Зсуває кожну дату на count робочих днів вперед (дата у вихідний чи
+    свято спершу переноситься на найближчий робочий день). Для масиву дат -
+    один векторний виклик; повертає список дат.
+    """
+    if calendar is None:
+        calendar = holiday_calendar()
+    result = np.busday_offset(_as_datetime64(dates), count, roll='forward', busdaycal=calendar)
+    return list(np.atleast_1d(_as_date(result)))
+
+
+def skip_closed_days(anchors, dates, calendar, closed_calendar):
+    """
+    Переносить дати з урахуванням нових неробочих днів.
+
+    Для кожної дати береться її відстань від anchor у робочих днях за
+    calendar і відкладається від anchor за closed_calendar (де закриті дні
+    вже неробочі), тож порядок і проміжки курсу зберігаються, а дати після
+    закриття зсуваються на кількість закритих днів. Один векторний виклик
+    для всіх дат.
+
+    Дати кожного курсу йдуть підряд за зростанням; новий курс починається
+    там, де змінюється anchor або дата не зростає. Фракція на вихідний чи
+    свято має ту ж відстань, що й фракція наступного робочого дня, тому
+    позиції всередині курсу робляться строго зростаючими - такі фракції
+    займають окремий робочий день, а не збігаються з сусідньою.
+    """
+    anchors = _as_datetime64(anchors)
+    dates = _as_datetime64(dates)
+    positions = np.busday_count(anchors, dates, busdaycal=calendar)
+    if positions.size:
+        anchors = np.broadcast_to(anchors, dates.shape)
+        index = np.arange(positions.size)
+        new_course = np.ones(positions.size, dtype=bool)
+        new_course[1:] = (anchors[1:] != anchors[:-1]) | (dates[1:] <= dates[:-1])
+        # Номер фракції всередині курсу
+        rank = index - np.maximum.accumulate(np.where(new_course, index, 0))
+        # positions[i] >= positions[i-1] + 1: накопичений максимум (positions - rank)
+        # окремо для кожного курсу (зсув на course * span не дає курсам змішатись)
+        span = int(positions.max()) + positions.size + 1
+        course = np.cumsum(new_course) * span
+        positions = np.maximum.accumulate(positions - rank + course) - course + rank
+    result = np.busday_offset(anchors, positions, roll='forward', busdaycal=closed_calendar)
+    return list(np.atleast_1d(_as_date(result)))
+
+
+def workday_schedules(starts, counts, calendar=None):
+    """
+    Розклади для багатьох курсів одним векторним викликом.
+
+    starts - дати початку, counts - кількість фракцій для кожного курсу.
+    Повертає список списків дат у тому ж порядку.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.size == 0:
+        return []
+    if calendar is None:
+        calendar = holiday_calendar()
+    counts = np.maximum(counts, 0)
+    flat_starts = np.repeat(_as_datetime64(starts), counts)
+    # Порядковий номер фракції всередині кожного курсу
+    group_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.arange(counts.sum()) - group_offsets
+    flat_dates = _as_date(
+        np.busday_offset(flat_starts, positions, roll='forward', busdaycal=calendar)
+    )
+    boundaries = np.cumsum(counts)[:-1]
+    return [list(chunk) for chunk in np.split(flat_dates, boundaries)]
+